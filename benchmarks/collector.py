@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Push synthetic sessions through a local openrpm-collector.
+
+Starts a Collector in-process on a temporary Unix socket (or localhost
+TCP port) with a temporary database, then has several clients stream
+pre-built session lines at it concurrently, a share of them resubmitted,
+and waits for every acknowledgement. Reports submissions per second and
+checks that the database holds each distinct session exactly once. Runs
+without a display.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import calculations
+import collector
+import store
+import upload
+
+
+def make_lines(count, seed):
+    rng = random.Random(seed)
+    answer_key = calculations.decode_answers()
+    lines = []
+    for _ in range(count):
+        answers = {q: rng.randint(1, 6 if calculations.get_series(q) in 'AB' else 8)
+                   for q in range(1, calculations.TOTAL_QUESTIONS + 1) if rng.random() < 0.95}
+        test_results = {'session_id': uuid.UUID(int=rng.getrandbits(128)).hex,
+                        'user_answers': answers, 'answer_key': answer_key,
+                        'age_percent': 100, 'time_taken': rng.randint(300, 1200)}
+        results = calculations.calculate_raven_results(answers, answer_key, 100)
+        lines.append(upload.encode_row(store.session_row(test_results, results)))
+    return lines
+
+
+async def run_client(address, lines):
+    if address[0] == 'unix':
+        reader, writer = await asyncio.open_unix_connection(address[1])
+    else:
+        reader, writer = await asyncio.open_connection(*address[1])
+    writer.write(b''.join(lines))
+    await writer.drain()
+    writer.write_eof()
+    acks = 0
+    while await reader.readline():
+        acks += 1
+    writer.close()
+    return acks
+
+
+async def run(args, tmp):
+    lines = make_lines(args.sessions, args.seed)
+    rng = random.Random(args.seed)
+    sent = lines + rng.sample(lines, int(len(lines) * args.duplicates))
+    rng.shuffle(sent)
+    shards = [sent[i::args.clients] for i in range(args.clients)]
+
+    address = ('tcp', ('127.0.0.1', args.port)) if args.port else ('unix', os.path.join(tmp, 'collector.sock'))
+    server = collector.Collector(os.path.join(tmp, 'sessions.db'))
+    await server.start(address)
+
+    start = time.perf_counter()
+    acks = await asyncio.gather(*(run_client(address, shard) for shard in shards))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+
+    with sqlite3.connect(os.path.join(tmp, 'sessions.db')) as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+    print(f"{len(sent)} submissions from {args.clients} clients in {elapsed:.2f}s: "
+          f"{len(sent) / elapsed:.0f}/s, {sum(acks)} acknowledged")
+    print(f"collector: {server.stats()}, {stored} rows stored for {len(lines)} distinct sessions")
+    return 0 if stored == len(lines) and sum(acks) == len(sent) else 1
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--sessions', type=int, default=20000)
+    parser.add_argument('-c', '--clients', type=int, default=8)
+    parser.add_argument('--duplicates', type=float, default=0.1,
+                        help='share of sessions submitted a second time')
+    parser.add_argument('--port', type=int, help='use localhost TCP instead of a Unix socket')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv[1:])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(run(args, tmp))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Time message table loading and get_text lookups.
+
+Compiles every catalog in po/ the way the build does, then reports how
+long locales.parse_table takes to turn each table into a dict and how
+long a get_text call takes, next to the previous lookup (a gettext call
+per message with a fallback to the built-in English strings). Runs
+without a display; the legacy path uses gettext's fallback catalog, so
+its number is a lower bound.
+"""
+import argparse
+import gettext
+import importlib.util
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import locales
+
+
+def _load_compiler():
+    path = os.path.join(ROOT, 'build-aux', 'compile-messages.py')
+    spec = importlib.util.spec_from_file_location('compile_messages', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _per_call(func, calls, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / calls
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=200)
+    args = parser.parse_args(argv[1:])
+
+    compiler = _load_compiler()
+    po_dir = os.path.join(ROOT, 'po')
+    for lang in compiler.read_linguas(po_dir):
+        data = compiler.pack_table(compiler.parse_po(os.path.join(po_dir, f'{lang}.po')))
+        load = _per_call(lambda: locales.parse_table(data), 1, args.repeat)
+        print(f"{lang}: {len(data)} bytes, parse_table {load * 1e6:.1f} us")
+
+    keys = list(locales._EN)
+    translation = gettext.translation('openrpm', localedir=locales._localedir(), fallback=True)
+
+    def legacy_get_text(key):
+        text = translation.gettext(key)
+        return locales._EN.get(key, text) if text == key else text
+
+    locales.get_text(keys[0])
+    current = _per_call(lambda: [locales.get_text(k) for k in keys], len(keys), args.repeat)
+    legacy = _per_call(lambda: [legacy_get_text(k) for k in keys], len(keys), args.repeat)
+    print(f"get_text: {current * 1e9:.0f} ns per lookup, "
+          f"gettext with fallback: {legacy * 1e9:.0f} ns ({legacy / current:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
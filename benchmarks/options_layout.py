@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Time the option layout work done on every question change.
+
+Builds data/ui/test.ui from the source tree into an unmapped window,
+walks a TestController through all questions a number of times and
+reports the cost of _update_options plus the size request it triggers
+(a vertical measure of the page at the fixed test width). Series
+boundaries, where the 6- and 8-option layouts swap, are reported
+separately. Needs a display.
+
+This is a manual benchmark: nothing runs it automatically. Run it on the
+commit before a change and on the change with --save
+benchmarks/baseline.json to keep both runs' figures. Without PyGObject
+or a display it exits with status 77.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from suite import record_manual
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+# Exit status of a skipped run, as for automake and meson tests
+SKIP = 77
+
+try:
+    import gi
+
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+
+    from gi.repository import Adw, Gtk
+except (ImportError, ValueError) as e:
+    print(f"skipped: needs PyGObject with GTK 4 and libadwaita ({e})", file=sys.stderr)
+    sys.exit(SKIP)
+
+import calculations
+import test
+
+PAGE_WIDTH = 418
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {'median_us': statistics.median(samples) * 1e6,
+            'p95_us': samples[int(len(samples) * 0.95)] * 1e6, 'questions': len(samples)}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--rounds', type=int, default=20)
+    parser.add_argument('--save', metavar='BASELINE',
+                        help='record the figures in a suite.py baseline file')
+    args = parser.parse_args(argv[1:])
+
+    if not Gtk.init_check():
+        print("skipped: no display; run under xvfb-run -a or broadwayd", file=sys.stderr)
+        return SKIP
+    Adw.init()
+    builder = Gtk.Builder()
+    builder.add_from_file(os.path.join(ROOT, 'data', 'ui', 'test.ui'))
+    page = builder.get_object('test_page')
+    window = Gtk.Window(child=page)
+
+    controller = test.TestController(builder, age_percent=100)
+    controller.answers = {q: q % 6 + 1 for q in range(1, test.TOTAL_QUESTIONS + 1, 2)}
+
+    same, boundary = [], []
+    for _ in range(args.rounds):
+        for q in range(1, test.TOTAL_QUESTIONS + 1):
+            series = calculations.get_series(q)
+            crossing = series != calculations.get_series(q - 1 if q > 1 else test.TOTAL_QUESTIONS)
+            controller.current = q
+            start = time.perf_counter()
+            controller._update_options(series)
+            page.measure(Gtk.Orientation.VERTICAL, PAGE_WIDTH)
+            (boundary if crossing else same).append(time.perf_counter() - start)
+
+    figures = {'within_series': _summary(same), 'series_boundary': _summary(boundary)}
+    for key, label in (('within_series', 'within a series'), ('series_boundary', 'series boundary')):
+        f = figures[key]
+        print(f"{label}: median {f['median_us']:.0f} us, p95 {f['p95_us']:.0f} us "
+              f"over {f['questions']} questions")
+    window.destroy()
+    if args.save:
+        record_manual(args.save, 'options_layout', figures)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Measure the memory cost of extra candidate windows in one process.
+
+Starts the app with --candidates 1..N, waits for it to settle (every
+question image gets prefetched in that time), reads the proportional and
+private set sizes from /proc/<pid>/smaps_rollup and quits it over D-Bus.
+An extra window costs the PSS growth per window; a separate process per
+candidate costs at least the private memory of a one-window process,
+since its interpreter, UI, textures and tables are not shared. Needs a
+display and a session bus.
+
+This is a manual benchmark: nothing runs it automatically. Run it on the
+commit before a change and on the change with --save
+benchmarks/baseline.json to keep both runs' figures. Without the
+installed launcher, a display or a session bus it exits with status 77.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+from startup import SKIP, missing_session, quit_app
+from suite import record_manual
+
+
+def read_rollup(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if rest.strip().endswith('kB'):
+                values[name] = int(rest.split()[0])
+    return {
+        'pss': values.get('Pss', 0) / 1024,
+        'private': (values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)) / 1024,
+    }
+
+
+def measure(launcher, candidates, settle):
+    proc = subprocess.Popen([launcher, '--candidates', str(candidates)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(settle)
+        return read_rollup(proc.pid)
+    finally:
+        quit_app()
+        proc.wait(timeout=10)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('launcher', nargs='?', default='site.ikhlasulov.openrpm')
+    parser.add_argument('-n', '--max-candidates', type=int, default=4)
+    parser.add_argument('--settle', type=float, default=5.0)
+    parser.add_argument('--save', metavar='BASELINE',
+                        help='record the figures in a suite.py baseline file')
+    args = parser.parse_args(argv[1:])
+
+    reason = missing_session(args.launcher)
+    if reason:
+        print(f"skipped: {reason}", file=sys.stderr)
+        return SKIP
+
+    runs = {n: measure(args.launcher, n, args.settle) for n in range(1, args.max_candidates + 1)}
+    for n, run in runs.items():
+        print(f"{n} window(s): PSS {run['pss']:.1f} MiB, private {run['private']:.1f} MiB")
+
+    figures = {'windows': {str(n): run for n, run in runs.items()}}
+    if args.max_candidates > 1:
+        first, last = runs[1], runs[args.max_candidates]
+        figures['per_window_mib'] = (last['pss'] - first['pss']) / (args.max_candidates - 1)
+        figures['per_process_mib'] = first['private']
+        print(f"per extra window: {figures['per_window_mib']:.1f} MiB; "
+              f"per extra process: at least {first['private']:.1f} MiB")
+    if args.save:
+        record_manual(args.save, 'sessions', figures)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
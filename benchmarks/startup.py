@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Launch the installed app repeatedly and report import-hook cost.
+
+Each run starts the launcher with `--help` (so GApplication exits right
+after every module is imported) and OPENRPM_TRACE pointing at a temporary
+file, then reads back the launcher span and the gresource-import counter:
+how many GIO resource lookups and meta-path queries the launch needed.
+
+With --activate the app is started normally instead, left to draw its
+first frame, then asked to quit over D-Bus (the app.quit action), and the
+activate-to-first-frame span is reported. This needs a display and a
+session bus.
+
+This is a manual benchmark: it measures an installed build, so it is not
+part of suite.py and nothing runs it automatically. Run it on the commit
+before a change and on the change itself with --save
+benchmarks/baseline.json, which keeps both runs' figures keyed by
+commit. Without the launcher (or, with --activate, a display and a
+session bus) it exits with status 77.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import shutil
+import sys
+import tempfile
+import time
+
+from suite import record_manual
+
+APP_ID = 'site.ikhlasulov.openrpm'
+# Exit status of a skipped run, as for automake and meson tests
+SKIP = 77
+
+
+def missing_session(launcher, display=True):
+    """Why the installed app cannot be measured here, or None."""
+    if not shutil.which(launcher):
+        return f"{launcher} is not installed"
+    if display and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')
+                        or os.environ.get('GDK_BACKEND') == 'broadway'):
+        return "no display; run under xvfb-run -a or broadwayd"
+    if display and not os.environ.get('DBUS_SESSION_BUS_ADDRESS'):
+        return "no session bus; run under dbus-run-session"
+    return None
+
+
+def quit_app():
+    subprocess.run(['gdbus', 'call', '--session', '--dest', APP_ID,
+                    '--object-path', f"/{APP_ID.replace('.', '/')}",
+                    '--method', 'org.gtk.Actions.Activate', 'quit', '[]', '{}'],
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def run_once(launcher, activate=False, settle=2.0):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.json')
+        env = dict(os.environ, OPENRPM_TRACE=path)
+        if activate:
+            proc = subprocess.Popen([launcher], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            time.sleep(settle)
+            quit_app()
+            proc.wait(timeout=10)
+        else:
+            subprocess.run([launcher, '--help'], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(path, encoding='utf-8') as f:
+            events = json.load(f)['traceEvents']
+
+    result = {}
+    for event in events:
+        if event['ph'] == 'X' and event['name'] in ('launcher', 'activate-to-first-frame',
+                                                    'OpenRpmApp.do_activate'):
+            result[f"{event['name']}_ms"] = event['dur'] / 1000
+        elif event['name'] == 'gresource-import' and event['ph'] == 'C':
+            result.update(event['args'])
+    return result
+
+
+def _report(runs, key, label, figures):
+    times = [r[key] for r in runs if key in r]
+    if times:
+        figures[key] = {'median': statistics.median(times), 'min': min(times), 'runs': len(times)}
+        print(f"{label}: median {statistics.median(times):.1f} ms, "
+              f"min {min(times):.1f} ms over {len(times)} runs")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('launcher', nargs='?', default='site.ikhlasulov.openrpm')
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--activate', action='store_true',
+                        help='open the window and measure time to first frame')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds to wait before quitting with --activate')
+    parser.add_argument('--save', metavar='BASELINE',
+                        help='record the figures in a suite.py baseline file')
+    args = parser.parse_args(argv[1:])
+
+    reason = missing_session(args.launcher, display=args.activate)
+    if reason:
+        print(f"skipped: {reason}", file=sys.stderr)
+        return SKIP
+
+    runs = [run_once(args.launcher, args.activate, args.settle) for _ in range(args.runs)]
+    figures = {}
+    _report(runs, 'launcher_ms', 'launcher', figures)
+    if args.activate:
+        _report(runs, 'OpenRpmApp.do_activate_ms', 'do_activate', figures)
+        _report(runs, 'activate-to-first-frame_ms', 'activate to first frame', figures)
+    figures['lookups'] = runs[-1].get('lookups')
+    figures['find_spec'] = runs[-1].get('find_spec')
+    print(f"resource lookups per launch: {figures['lookups']}, "
+          f"meta-path queries: {figures['find_spec']}")
+    if args.save:
+        record_manual(args.save, 'startup-activate' if args.activate else 'startup', figures)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
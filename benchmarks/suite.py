@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""Time the scoring, asset and page hot paths and compare against a baseline.
+
+Every case runs on fixed synthetic inputs drawn from a seeded generator,
+so runs are comparable across commits. A case is timed `--repeat` times
+(each sample a fixed number of calls with the garbage collector off) and
+reported as time per operation. --save writes the samples as a JSON
+baseline; --compare checks a run against one and flags a case as slower
+when a one-sided Mann-Whitney U test rejects "no slowdown" at --alpha
+and the median grew by more than --threshold. The exit status is 1 when
+any case got slower.
+
+The manual GUI benchmarks (startup.py, options_layout.py, sessions.py)
+record their figures with --save into the "manual" section of the same
+baseline file, keyed by benchmark and commit; --save here keeps that
+section.
+
+Cases that need GTK are skipped without PyGObject; TestController._show
+also needs a display, e.g. `xvfb-run -a` or GDK_BACKEND=broadway with a
+running broadwayd. test.load_texture needs the compiled data gresource
+(--resources, default: a meson build directory or the installed one).
+Decoded rasters go to a temporary cache directory.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import NormalDist
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import calculations
+import locales
+
+BASELINE_VERSION = 1
+SEED = 1729
+DEFAULT_REPEAT = 30
+DEFAULT_ALPHA = 0.01
+DEFAULT_THRESHOLD = 0.1
+QUESTION_SIZE = 400
+
+RESOURCE_NAME = 'site.ikhlasulov.openrpm.data.gresource'
+RESOURCE_PATHS = [
+    os.path.join(ROOT, '_build', 'data', RESOURCE_NAME),
+    os.path.join(ROOT, 'build', 'data', RESOURCE_NAME),
+    os.path.join('/app/share/openrpm', RESOURCE_NAME),
+    os.path.join('/usr/local/share/openrpm', RESOURCE_NAME),
+    os.path.join('/usr/share/openrpm', RESOURCE_NAME),
+]
+
+CASES = {}
+
+
+class Skip(Exception):
+    pass
+
+
+def case(name, number):
+    """Register a setup function returning (run, operations per run); samples time `number` runs."""
+    def register(setup):
+        CASES[name] = (setup, number)
+        return setup
+    return register
+
+
+def _answer_sheets(count):
+    rng = random.Random(SEED)
+    key = calculations.decode_answers()
+    sheets = []
+    for _ in range(count):
+        sheet = {}
+        for q in range(1, calculations.TOTAL_QUESTIONS + 1):
+            roll = rng.random()
+            if roll < 0.6:
+                sheet[q] = key[str(q)]
+            elif roll < 0.95:
+                sheet[q] = rng.randint(1, 6 if calculations.get_series(q) in 'AB' else 8)
+        sheets.append(sheet)
+    return key, sheets
+
+
+def _gtk(display=False):
+    try:
+        import gi
+        gi.require_version('Gtk', '4.0')
+        gi.require_version('Adw', '1')
+        from gi.repository import Adw, Gtk
+    except (ImportError, ValueError) as e:
+        raise Skip(f"PyGObject with GTK 4 and libadwaita is not available: {e}")
+    if display and not Gtk.init_check():
+        raise Skip("no display; run under xvfb-run or broadwayd")
+    return Adw, Gtk
+
+
+def _load_resources(ctx):
+    _gtk()
+    from gi.repository import Gio, GLib
+    path = ctx['resources'] or next((p for p in RESOURCE_PATHS if os.path.exists(p)), None)
+    if not path:
+        raise Skip("compiled data gresource not found; build with meson or pass --resources")
+    if path not in ctx['registered']:
+        try:
+            Gio.Resource.load(path)._register()
+        except GLib.Error as e:
+            raise Skip(f"could not load {path}: {e.message}")
+        ctx['registered'].add(path)
+
+
+@case('reference', number=20)
+def _reference(ctx):
+    """Plain interpreter work that no change to the app can affect, for --normalize."""
+    rng = random.Random(SEED)
+    table = {i: rng.random() for i in range(1000)}
+    keys = [rng.randrange(1000) for _ in range(1000)]
+
+    def run():
+        total = 0.0
+        for key in keys:
+            total += table[key] * 2
+        return total
+    return run, len(keys)
+
+
+@case('calculations.calculate_raven_results', number=20)
+def _calculate(ctx):
+    key, sheets = _answer_sheets(100)
+    percents = [calculations.AGE_PERCENTS[i % len(calculations.AGE_PERCENTS)] for i in range(len(sheets))]
+
+    def run():
+        for sheet, percent in zip(sheets, percents):
+            calculations.calculate_raven_results(sheet, key, percent)
+    return run, len(sheets)
+
+
+@case('calculations.calculate_raven_results_batch', number=5)
+def _calculate_batch(ctx):
+    try:
+        import numpy as np
+    except ImportError:
+        raise Skip("NumPy is not installed")
+    key, sheets = _answer_sheets(1000)
+    answers = np.array([[sheet.get(q, 0) for q in range(1, calculations.TOTAL_QUESTIONS + 1)]
+                        for sheet in sheets])
+    percents = np.resize(list(calculations.AGE_PERCENTS.values()), len(sheets))
+
+    def run():
+        calculations.calculate_raven_results_batch(answers, key, percents)
+    return run, len(sheets)
+
+
+@case('CatmullRomSpline.interpolate', number=20)
+def _interpolate(ctx):
+    rng = random.Random(SEED)
+    spline = calculations.CatmullRomSpline(calculations.SPLINE_POINTS)
+    xs = [rng.uniform(0, calculations.TOTAL_QUESTIONS) for _ in range(1000)]
+    interpolate = spline.interpolate
+
+    def run():
+        for x in xs:
+            interpolate(x)
+    return run, len(xs)
+
+
+@case('calculations.get_closest_normative', number=50)
+def _closest_normative(ctx):
+    rng = random.Random(SEED)
+    scores = list(range(calculations.TOTAL_QUESTIONS + 1)) * 4
+    scores += [rng.uniform(0, calculations.TOTAL_QUESTIONS) for _ in range(56)]
+    get = calculations.get_closest_normative
+
+    def run():
+        for score in scores:
+            get(score)
+    return run, len(scores)
+
+
+@case('locales.get_text', number=200)
+def _get_text(ctx):
+    keys = sorted(locales._EN)
+    get_text = locales.get_text
+    get_text(keys[0])
+
+    def run():
+        for key in keys:
+            get_text(key)
+    return run, len(keys)
+
+
+def _texture_case(ctx, cold):
+    _load_resources(ctx)
+    import test
+    cache_dir = os.path.join(ctx['tmp'], 'openrpm', 'textures')
+    questions = range(1, calculations.TOTAL_QUESTIONS + 1)
+    if test.load_texture(1, 'light', QUESTION_SIZE) is None:
+        raise Skip("question images are missing from the data gresource")
+    if not cold:
+        for q in questions:
+            test.load_texture(q, 'light', QUESTION_SIZE)
+
+    def run():
+        if cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        for q in questions:
+            test.load_texture(q, 'light', QUESTION_SIZE)
+    return run, len(questions)
+
+
+@case('test.load_texture', number=3)
+def _load_texture(ctx):
+    """All 60 questions mapped from the raster cache."""
+    return _texture_case(ctx, cold=False)
+
+
+@case('test.load_texture.cold', number=1)
+def _load_texture_cold(ctx):
+    """All 60 questions rasterized from the gresource into an empty cache."""
+    return _texture_case(ctx, cold=True)
+
+
+@case('TestController._show', number=5)
+def _show(ctx):
+    Adw, Gtk = _gtk(display=True)
+    Adw.init()
+    import test
+    try:
+        _load_resources(ctx)
+        have_images = True
+    except Skip:
+        have_images = False
+
+    builder = Gtk.Builder()
+    builder.add_from_file(os.path.join(ROOT, 'data', 'ui', 'test.ui'))
+    ctx['keep'].append(Gtk.Window(child=builder.get_object('test_page')))
+    controller = test.TestController(builder, age_percent=100)
+    theme = controller._current_theme or test.get_theme_dir()
+    questions = range(1, calculations.TOTAL_QUESTIONS + 1)
+    # Every image is cached up front, as the prefetcher would have it
+    for q in questions:
+        texture = test.load_texture(q, theme, QUESTION_SIZE) if have_images else None
+        test._texture_cache.put((q, theme), texture)
+    controller.answers = {q: q % 6 + 1 for q in range(1, calculations.TOTAL_QUESTIONS + 1, 2)}
+
+    def run():
+        for q in questions:
+            controller.current = q
+            controller._show()
+    return run, len(questions)
+
+
+def _sample(run, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        run()
+    return (time.perf_counter() - start) / number
+
+
+def run_suite(names, repeat, resources=None):
+    results = {'version': BASELINE_VERSION, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'environment': environment(), 'cases': {}, 'skipped': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['XDG_CACHE_HOME'] = tmp
+        ctx = {'tmp': tmp, 'resources': resources, 'registered': set(), 'keep': []}
+        runs = {}
+        for name in names:
+            setup, number = CASES[name]
+            try:
+                run, operations = setup(ctx)
+            except Skip as e:
+                results['skipped'][name] = str(e)
+                print(f"{name}: skipped, {e}", file=sys.stderr)
+                continue
+            run()
+            runs[name] = (run, number, operations, [])
+
+        # Round-robin over the cases, so a burst of background load lands on
+        # one sample of many cases rather than on every sample of one case
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                for run, number, operations, samples in runs.values():
+                    samples.append(_sample(run, number) / operations)
+        finally:
+            if enabled:
+                gc.enable()
+
+        for name, (run, number, operations, samples) in runs.items():
+            results['cases'][name] = {'operations': operations, 'number': number, 'samples': samples,
+                                      'median': statistics.median(samples)}
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'machine': platform.machine(),
+            'system': platform.system(), 'cpus': os.cpu_count()}
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided p-value for "current samples tend to be larger", normal approximation with tie correction."""
+    n1, n2 = len(current), len(baseline)
+    values = sorted([(v, 0) for v in current] + [(v, 1) for v in baseline])
+    ranks = [0.0] * len(values)
+    ties = 0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    u = sum(r for r, (_, group) in zip(ranks, values) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / variance ** 0.5
+    return 1 - NormalDist().cdf(z)
+
+
+def normalized(results):
+    """Cases with every sample divided by the reference sample taken in the same round."""
+    reference = results['cases'].get('reference')
+    if not reference:
+        raise SystemExit("--normalize needs the reference case in both runs")
+    cases = {}
+    for name, result in results['cases'].items():
+        if name == 'reference':
+            continue
+        samples = [s / r for s, r in zip(result['samples'], reference['samples'])]
+        cases[name] = dict(result, samples=samples, median=statistics.median(samples))
+    return dict(results, cases=cases)
+
+
+def compare(baseline, current, alpha, threshold):
+    rows = []
+    slower = 0
+    for name in sorted(set(baseline['cases']) | set(current['cases'])):
+        old, new = baseline['cases'].get(name), current['cases'].get(name)
+        if not old or not new:
+            rows.append((name, old and old['median'], new and new['median'], None, None,
+                         'new' if new else 'not run'))
+            continue
+        ratio = new['median'] / old['median']
+        p_slower = mann_whitney_greater(new['samples'], old['samples'])
+        p_faster = mann_whitney_greater(old['samples'], new['samples'])
+        if p_slower < alpha and ratio > 1 + threshold:
+            verdict, p = 'SLOWER', p_slower
+            slower += 1
+        elif p_faster < alpha and ratio < 1 - threshold:
+            verdict, p = 'faster', p_faster
+        else:
+            verdict, p = '~', min(p_slower, p_faster)
+        rows.append((name, old['median'], new['median'], ratio - 1, p, verdict))
+    return rows, slower
+
+
+def _duration(seconds, unit=None):
+    if seconds is None:
+        return '-'
+    if unit:
+        return f'{seconds:.3g}{unit}'
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.3g} {unit}'
+    return f'{seconds / 1e-9:.3g} ns'
+
+
+def print_comparison(rows, baseline, current, unit=None):
+    old_env, new_env = baseline.get('environment', {}), current.get('environment', {})
+    print(f"baseline {old_env.get('commit') or '?'} ({baseline.get('created_at')}), "
+          f"current {new_env.get('commit') or '?'} ({current.get('created_at')})")
+    differs = [k for k in ('python', 'machine', 'system', 'cpus') if old_env.get(k) != new_env.get(k)]
+    if differs:
+        print(f"note: environments differ in {', '.join(differs)}; timings may not be comparable")
+    width = max(len(row[0]) for row in rows) if rows else 4
+    print(f"{'case':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}  {'p':>8}  verdict")
+    for name, old, new, change, p, verdict in rows:
+        change_text = '-' if change is None else f'{change:+.1%}'
+        p_text = '-' if p is None else f'{p:.2g}'
+        print(f"{name:<{width}}  {_duration(old, unit):>10}  {_duration(new, unit):>10}  {change_text:>8}  "
+              f"{p_text:>8}  {verdict}")
+
+
+def save_results(path, results):
+    """Write results as a baseline, keeping the manual figures already stored in path."""
+    try:
+        manual = _load(path).get('manual')
+    except (FileNotFoundError, SystemExit, ValueError):
+        manual = None
+    if manual:
+        results = dict(results, manual=manual)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+        f.write('\n')
+    os.replace(tmp, path)
+
+
+def record_manual(path, name, figures):
+    """Store the figures of a manual benchmark run in the baseline at path, keyed by commit."""
+    try:
+        data = _load(path)
+    except FileNotFoundError:
+        data = {'version': BASELINE_VERSION, 'cases': {}, 'skipped': {}}
+    env = environment()
+    data.setdefault('manual', {}).setdefault(name, {})[env['commit']] = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': env, 'figures': figures,
+    }
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+        f.write('\n')
+    os.replace(tmp, path)
+    print(f"Saved {name} figures for {env['commit']} to {path}")
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != BASELINE_VERSION:
+        raise SystemExit(f"{path}: unsupported baseline version {data.get('version')}")
+    return data
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', '--filter', action='append',
+                        help='only run cases whose name contains this; repeatable')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT, help='samples per case')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against a saved baseline')
+    parser.add_argument('--current', metavar='PATH',
+                        help='with --compare, use these saved results instead of running')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+                        help='significance level of the slowdown test')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='smallest relative change in the median worth flagging')
+    parser.add_argument('--normalize', action='store_true',
+                        help='compare times relative to the reference case, to cancel out '
+                             'machine-wide speed changes such as CPU frequency scaling')
+    parser.add_argument('--resources', help='compiled data gresource for the asset cases')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    args = parser.parse_args(argv[1:])
+
+    names = [n for n in CASES if not args.filter or any(f in n for f in args.filter)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    if args.current:
+        current = _load(args.current)
+    else:
+        current = run_suite(names, max(3, args.repeat), args.resources)
+    if args.save:
+        save_results(args.save, current)
+
+    if args.compare:
+        baseline = _load(args.compare)
+        if args.filter:
+            for results in (baseline, current):
+                results['cases'] = {n: c for n, c in results['cases'].items() if n in names}
+        if args.normalize:
+            baseline, current = normalized(baseline), normalized(current)
+        rows, slower = compare(baseline, current, args.alpha, args.threshold)
+        print_comparison(rows, baseline, current, 'x reference' if args.normalize else None)
+        return 1 if slower else 0
+
+    for name, result in current['cases'].items():
+        samples = sorted(result['samples'])
+        print(f"{name}: median {_duration(result['median'])}/op, "
+              f"min {_duration(samples[0])}, max {_duration(samples[-1])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
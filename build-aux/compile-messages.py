@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Compile the po catalogs into frozen message tables for a gresource.
+
+Each language in LINGUAS becomes <lang>.msgs in the output directory: the
+magic string followed by NUL-separated key/value pairs, sorted by key, so
+the app can turn it into a dict with a single decode and split (see
+locales.parse_table). Untranslated and fuzzy entries are left out; the
+app falls back to its built-in English strings for those. The emitted
+gresource XML lists every table under /site/ikhlasulov/openrpm/messages.
+"""
+import argparse
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+MAGIC = 'ORPMMSG1'
+PREFIX = '/site/ikhlasulov/openrpm/messages'
+ESCAPES = {'n': '\n', 't': '\t', '"': '"', '\\': '\\'}
+ESCAPE = re.compile(r'\\(.)')
+
+
+def _unquote(text):
+    return ESCAPE.sub(lambda m: ESCAPES.get(m.group(1), m.group(0)), text.strip()[1:-1])
+
+
+def parse_po(path):
+    """msgid -> msgstr of the translated, non-fuzzy entries of a po file."""
+    messages = {}
+    entry, field = {}, None
+    # Flags comments come before the msgid of the entry they belong to
+    fuzzy = next_fuzzy = False
+
+    def flush():
+        msgid, msgstr = entry.get('msgid'), entry.get('msgstr')
+        if msgid and msgstr and not fuzzy:
+            messages[msgid] = msgstr
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                if line.startswith('#,') and 'fuzzy' in line:
+                    next_fuzzy = True
+                continue
+            if line.startswith('"'):
+                if field:
+                    entry[field] += _unquote(line)
+                continue
+            keyword, _, rest = line.partition(' ')
+            if keyword == 'msgid':
+                flush()
+                entry, fuzzy, next_fuzzy = {}, next_fuzzy, False
+            field = keyword
+            entry[field] = _unquote(rest)
+    flush()
+    return messages
+
+
+def pack_table(messages):
+    parts = [MAGIC]
+    for key in sorted(messages):
+        if '\0' in key or '\0' in messages[key]:
+            raise ValueError(f'NUL in message {key!r}')
+        parts += [key, messages[key]]
+    return '\0'.join(parts).encode('utf-8')
+
+
+def read_linguas(po_dir):
+    with open(os.path.join(po_dir, 'LINGUAS'), encoding='utf-8') as f:
+        return [lang for line in f for lang in line.split('#')[0].split()]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--po-dir', required=True)
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--output-xml', required=True)
+    parser.add_argument('--depfile')
+    args = parser.parse_args(argv[1:])
+
+    root = ET.Element('gresources')
+    gresource = ET.SubElement(root, 'gresource', prefix=PREFIX)
+    sources = [os.path.join(args.po_dir, 'LINGUAS')]
+    for lang in read_linguas(args.po_dir):
+        po = os.path.join(args.po_dir, f'{lang}.po')
+        table = f'{lang}.msgs'
+        with open(os.path.join(args.output_dir, table), 'wb') as f:
+            f.write(pack_table(parse_po(po)))
+        ET.SubElement(gresource, 'file').text = table
+        sources.append(po)
+
+    tree = ET.ElementTree(root)
+    ET.indent(tree, space='  ')
+    tree.write(args.output_xml, encoding='UTF-8', xml_declaration=True)
+
+    if args.depfile:
+        with open(args.depfile, 'w') as f:
+            f.write(f"{args.output_xml}: {' '.join(sources)}\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Minify question SVGs and pre-render PNG variants for the data gresource.
+
+Reads the source gresource XML, writes an optimized copy of every
+images/*.svg entry plus one PNG per requested pixel size into the build
+directory, and emits a gresource XML that points at the optimized files
+(aliases are unchanged, variants are aliased as images/<theme>/<q>@<size>.png).
+Other entries are left as they are and still resolve from the source dir.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+EDITOR_NAMESPACES = (
+    'http://www.inkscape.org/namespaces/inkscape',
+    'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+)
+OUTPUT_SUBDIR = 'images-optimized'
+
+NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+PATH_TOKEN = re.compile(r'[MmZzLlHhVvCcSsQqTtAa]|-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def short_number(text, precision):
+    value = round(float(text), precision)
+    if value == int(value):
+        return str(int(value))
+    out = f'{value:.{precision}f}'.rstrip('0')
+    return out.replace('0.', '.', 1) if out.startswith(('0.', '-0.')) else out
+
+
+def compact_path(d, precision):
+    """Rewrite path data with short numbers and only the separators SVG needs."""
+    out = []
+    prev_number = None
+    for token in PATH_TOKEN.findall(d):
+        if token[0].isalpha():
+            out.append(token)
+            prev_number = None
+            continue
+        token = short_number(token, precision)
+        if prev_number is not None and not token.startswith('-') and \
+                not (token.startswith('.') and '.' in prev_number):
+            out.append(' ')
+        out.append(token)
+        prev_number = token
+    return ''.join(out)
+
+
+def compact_numbers(value, precision):
+    return NUMBER.sub(lambda m: short_number(m.group(0), precision), value)
+
+
+def _is_editor_name(name):
+    return any(name.startswith(f'{{{ns}}}') for ns in EDITOR_NAMESPACES)
+
+
+def _strip(elem, precision):
+    for child in list(elem):
+        tag = child.tag
+        if _is_editor_name(tag) or tag in (f'{{{SVG_NS}}}metadata', f'{{{SVG_NS}}}title'):
+            elem.remove(child)
+        elif tag == f'{{{SVG_NS}}}defs' and len(child) == 0:
+            elem.remove(child)
+        elif tag == f'{{{SVG_NS}}}rect' and 'fill:none' in child.get('style', '') \
+                and 'stroke:' not in child.get('style', ''):
+            # Invisible layout rectangles left behind by the editor
+            elem.remove(child)
+        else:
+            _strip(child, precision)
+
+    for name in list(elem.attrib):
+        if _is_editor_name(name) or name == 'id':
+            del elem.attrib[name]
+        elif name == 'd':
+            elem.set(name, compact_path(elem.get(name), precision))
+        elif name in ('transform', 'viewBox', 'width', 'height', 'x', 'y'):
+            elem.set(name, compact_numbers(elem.get(name), 6))
+    elem.text = elem.text.strip() or None if elem.text else None
+    elem.tail = None
+
+
+def optimize_svg(src, dst, precision):
+    tree = ET.parse(src)
+    root = tree.getroot()
+    _strip(root, precision)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(dst, 'wb') as f:
+        f.write(ET.tostring(root, encoding='utf-8', xml_declaration=False))
+
+
+def _pixbuf_renderer():
+    try:
+        import gi
+        gi.require_version('GdkPixbuf', '2.0')
+        from gi.repository import GdkPixbuf
+    except (ImportError, ValueError):
+        return None
+
+    def render(src, dst, size):
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(src, size, size, True)
+        pixbuf.savev(dst, 'png', ['compression'], ['9'])
+    return render
+
+
+def make_renderer(rsvg_convert):
+    if rsvg_convert:
+        def render(src, dst, size):
+            subprocess.run([rsvg_convert, '--keep-aspect-ratio', '-w', str(size), '-h', str(size),
+                            '-o', dst, src], check=True)
+        return render
+    return _pixbuf_renderer()
+
+
+def _human(nbytes):
+    return f'{nbytes / 1024 / 1024:.2f} MiB'
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source-dir', required=True)
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--xml', required=True, help='source gresource XML')
+    parser.add_argument('--output-xml', required=True)
+    parser.add_argument('--depfile')
+    parser.add_argument('--sizes', default='', help='comma-separated PNG variant sizes')
+    parser.add_argument('--precision', type=int, default=1)
+    parser.add_argument('--rsvg-convert', default='')
+    args = parser.parse_args(argv[1:])
+
+    ET.register_namespace('', SVG_NS)
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    render = make_renderer(args.rsvg_convert) if sizes else None
+    if sizes and render is None:
+        print('optimize-images: no SVG rasterizer found, skipping PNG variants', file=sys.stderr)
+        sizes = []
+
+    tree = ET.parse(args.xml)
+    sources = []
+    before = after = variants = 0
+    for gresource in tree.getroot():
+        for entry in list(gresource):
+            rel = entry.text.strip()
+            if not (rel.startswith('images/') and rel.endswith('.svg')):
+                continue
+            src = os.path.join(args.source_dir, rel)
+            out_rel = os.path.join(OUTPUT_SUBDIR, os.path.relpath(rel, 'images'))
+            dst = os.path.join(args.output_dir, out_rel)
+            optimize_svg(src, dst, args.precision)
+            entry.text = out_rel
+            sources.append(src)
+            before += os.path.getsize(src)
+            after += os.path.getsize(dst)
+
+            alias = entry.get('alias', rel)
+            index = list(gresource).index(entry)
+            for size in sizes:
+                png_rel = f'{os.path.splitext(out_rel)[0]}@{size}.png'
+                render(dst, os.path.join(args.output_dir, png_rel), size)
+                variants += os.path.getsize(os.path.join(args.output_dir, png_rel))
+                png = ET.Element('file', alias=f'{os.path.splitext(alias)[0]}@{size}.png')
+                png.text = png_rel
+                index += 1
+                gresource.insert(index, png)
+
+    ET.indent(tree, space='  ')
+    tree.write(args.output_xml, encoding='UTF-8', xml_declaration=True)
+
+    if args.depfile:
+        with open(args.depfile, 'w') as f:
+            f.write(f"{args.output_xml}: {args.xml} {' '.join(sources)}\n")
+
+    print(f'optimize-images: {len(sources)} SVGs {_human(before)} -> {_human(after)} '
+          f'({100 * (before - after) / max(before, 1):.0f}% smaller)'
+          + (f', PNG variants {_human(variants)} at {sizes}' if sizes else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Add the message keys of src/locales.py to the translation template.
+
+The po catalogs are keyed by message id (e.g. result.percentile) rather
+than by English text, and those ids are dict keys of locales._EN, not
+gettext calls, so xgettext never sees them. This rewrites the message-key
+entries of the template from _EN, one per key in source order with the
+English string as a translator comment, and keeps every other entry
+(the xgettext output for the UI, desktop and metainfo files) as it is.
+Run after xgettext, see generate_pot.sh.
+"""
+import argparse
+import ast
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOCALES = os.path.join('src', 'locales.py')
+
+
+def read_messages(path):
+    """(key, English text, line) of every entry of the _EN dict, in source order."""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == '_EN' for t in node.targets):
+            return [(k.value, v.value, k.lineno) for k, v in zip(node.value.keys, node.value.values)]
+    raise ValueError(f"No _EN dict in {path}")
+
+
+def quote(text):
+    escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{escaped}"'
+
+
+def split_entries(text):
+    return [block for block in text.strip().split('\n\n') if block.strip()]
+
+
+def entry_msgid(block):
+    for line in block.splitlines():
+        if line.startswith('msgid '):
+            return ast.literal_eval(line[len('msgid '):])
+    return None
+
+
+def update(pot_text, messages):
+    keys = {key for key, _, _ in messages}
+    kept = [block for block in split_entries(pot_text) if entry_msgid(block) not in keys]
+    added = [f"#. English: {english.replace(chr(10), ' ')}\n#: {LOCALES}:{line}\n"
+             f"msgid {quote(key)}\nmsgstr \"\"" for key, english, line in messages]
+    return '\n\n'.join(kept + added) + '\n'
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pot', help='template to update in place')
+    args = parser.parse_args(argv[1:])
+
+    messages = read_messages(os.path.join(ROOT, LOCALES))
+    with open(args.pot, encoding='utf-8') as f:
+        text = update(f.read(), messages)
+    with open(args.pot, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"{len(messages)} message keys in {args.pot}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -15,3 +15,6 @@ sed -i 's/charset=CHARSET/charset=UTF-8/g' $OUTPUT
 sed -i '2,3c\
 # Copyright (C) 2026 Ikhlashulov\
 # This file is distributed under the license GPLv3-or-later.' $OUTPUT
+
+# message keys of src/locales.py, which xgettext cannot see
+python3 build-aux/update-pot.py "$OUTPUT"
@@ -1,7 +1,13 @@
+import base64
+import json
+from bisect import bisect_left
+
 from logger import get_logger
 
 log = get_logger('calculations')
 
+ANSWERS_B64 = "eyIxIjo0LCIyIjo1LCIzIjoxLCI0IjoyLCI1Ijo2LCI2IjozLCI3Ijo2LCI4IjoyLCI5IjoxLCIxMCI6MywiMTEiOjQsIjEyIjo1LCIxMyI6MiwiMTQiOjYsIjE1IjoxLCIxNiI6MiwiMTciOjEsIjE4IjozLCIxOSI6NSwiMjAiOjYsIjIxIjo0LCIyMiI6MywiMjMiOjQsIjI0Ijo1LCIyNSI6OCwiMjYiOjIsIjI3IjozLCIyOCI6OCwiMjkiOjcsIjMwIjo0LCIzMSI6NSwiMzIiOjEsIjMzIjo3LCIzNCI6NiwiMzUiOjEsIjM2IjoyLCIzNyI6MywiMzgiOjQsIjM5IjozLCI0MCI6NywiNDEiOjgsIjQyIjo2LCI0MyI6NSwiNDQiOjQsIjQ1IjoxLCI0NiI6MiwiNDciOjUsIjQ4Ijo2LCI0OSI6NywiNTAiOjYsIjUxIjo4LCI1MiI6MiwiNTMiOjEsIjU0Ijo1LCI1NSI6MSwiNTYiOjYsIjU3IjozLCI1OCI6MiwiNTkiOjQsIjYwIjo1fQ=="
+
 NORMATIVE_DISTRIBUTION = {
     0: [0, 0, 0, 0, 0], 15: [8, 4, 2, 1, 0], 16: [8, 4, 2, 1, 0],
     17: [8, 5, 2, 1, 1], 18: [8, 5, 2, 2, 1], 19: [8, 6, 3, 2, 0],
@@ -46,6 +52,19 @@ RECOMMENDATION_RANGES = [
     (120, '120'), (110, '110'), (90, '90'), (80, '80'), (0, 'low'),
 ]
 
+AGE_PERCENTS = {0: 100, 1: 97, 2: 93, 3: 88, 4: 82, 5: 76, 6: 70}
+
+NORMS_FORMAT = 'openrpm-norms'
+NORMS_VERSION = 1
+
+
+def decode_answers():
+    try:
+        return json.loads(base64.b64decode(ANSWERS_B64).decode('utf-8'))
+    except Exception as e:
+        log.error(f"Failed to decode answers: {e}")
+        return {}
+
 
 def _find_threshold(value, ranges):
     for threshold, key in ranges:
@@ -55,20 +74,21 @@ def _find_threshold(value, ranges):
 
 
 def get_diagnosis_key(iq):
-    return _find_threshold(iq, DIAGNOSIS_RANGES)
+    return SCORING_TABLES.diagnosis_key(iq)
 
 
 def get_degree_key(iq):
-    return _find_threshold(iq, DEGREE_RANGES)
+    return SCORING_TABLES.degree_key(iq)
 
 
 def get_recommendation_key(iq):
-    return _find_threshold(iq, RECOMMENDATION_RANGES)
+    return SCORING_TABLES.recommendation_key(iq)
 
 
 class CatmullRomSpline:
     def __init__(self, points):
         self.points = sorted(points, key=lambda p: p[0])
+        self._xs = [p[0] for p in self.points]
 
     def interpolate(self, x):
         pts = self.points
@@ -77,10 +97,7 @@ class CatmullRomSpline:
         if x >= pts[-1][0]:
             return pts[-1][1]
 
-        for j in range(len(pts) - 1):
-            if pts[j][0] <= x <= pts[j+1][0]:
-                i = j
-                break
+        i = bisect_left(self._xs, x) - 1
 
         p0 = pts[max(0, i - 1)]
         p1 = pts[i]
@@ -98,7 +115,9 @@ class CatmullRomSpline:
         )
 
 
-_iq_spline = CatmullRomSpline(SPLINE_POINTS)
+SERIES_NAMES = ['A', 'B', 'C', 'D', 'E']
+SERIES_SIZE = 12
+TOTAL_QUESTIONS = 60
 
 
 def get_series(q):
@@ -109,43 +128,153 @@ def get_series(q):
     return 'E'
 
 
-def get_base_iq(score):
-    return _iq_spline.interpolate(round(score))
-
-
-def get_closest_normative(score):
+def _closest_normative(score, normative, keys):
+    if score in normative:
+        return normative[score]
+    # The manual has no profiles between 0 and 15, fitted norms may have
     if score < 15:
         r = score / 15
         return [round(8 * r), round(4 * r), round(2 * r), round(1 * r), 0]
-    if score in NORMATIVE_DISTRIBUTION:
-        return NORMATIVE_DISTRIBUTION[score]
-    keys = sorted(NORMATIVE_DISTRIBUTION.keys())
     closest = min(keys, key=lambda k: abs(score - k))
-    return NORMATIVE_DISTRIBUTION[closest]
+    return normative[closest]
+
+
+def _final_iq(base_iq, age_percent):
+    return round((base_iq * 100) / age_percent) if age_percent > 0 else 0
+
+
+class ScoringTables:
+    """Scoring lookups precomputed for every integer raw score 0..60.
+
+    `base_iq` has 61 rows, `expected` is 61x5, `final_iq` is 61 rows by one
+    column per age group, and the diagnosis/degree/recommendation buckets are
+    indexed by IQ, so scoring a session is plain list indexing.
+    """
+
+    def __init__(self, spline_points=SPLINE_POINTS, normative=NORMATIVE_DISTRIBUTION,
+                 age_percents=AGE_PERCENTS, norms_id='manual'):
+        self.norms_id = norms_id
+        self.spline = CatmullRomSpline(spline_points)
+        self.normative = normative
+        self.normative_keys = sorted(normative.keys())
+        self.age_percents = [age_percents[i] for i in sorted(age_percents)]
+        self._age_columns = {pct: col for col, pct in enumerate(self.age_percents)}
+
+        scores = range(TOTAL_QUESTIONS + 1)
+        self.base_iq = [self.spline.interpolate(s) for s in scores]
+        self.expected = [_closest_normative(s, normative, self.normative_keys) for s in scores]
+        self.final_iq = [[_final_iq(base, pct) for pct in self.age_percents]
+                         for base in self.base_iq]
+
+        self.diagnosis = self._buckets(DIAGNOSIS_RANGES)
+        self.degree = self._buckets(DEGREE_RANGES)
+        self.recommendation = self._buckets(RECOMMENDATION_RANGES)
+
+    @staticmethod
+    def _buckets(ranges):
+        # Every IQ at or above the highest threshold shares its bucket
+        top = max(threshold for threshold, _ in ranges)
+        return [_find_threshold(iq, ranges) for iq in range(top + 1)]
+
+    @staticmethod
+    def _bucket(buckets, ranges, iq):
+        if isinstance(iq, int):
+            return buckets[min(max(iq, 0), len(buckets) - 1)]
+        return _find_threshold(iq, ranges)
+
+    def diagnosis_key(self, iq):
+        return self._bucket(self.diagnosis, DIAGNOSIS_RANGES, iq)
+
+    def degree_key(self, iq):
+        return self._bucket(self.degree, DEGREE_RANGES, iq)
+
+    def recommendation_key(self, iq):
+        return self._bucket(self.recommendation, RECOMMENDATION_RANGES, iq)
+
+    def get_base_iq(self, score):
+        score = round(score)
+        if 0 <= score <= TOTAL_QUESTIONS:
+            return self.base_iq[score]
+        return self.spline.interpolate(score)
+
+    def get_expected(self, score):
+        if isinstance(score, int) and 0 <= score <= TOTAL_QUESTIONS:
+            return self.expected[score]
+        return _closest_normative(score, self.normative, self.normative_keys)
+
+    def get_final_iq(self, raw_score, age_percent):
+        col = self._age_columns.get(age_percent)
+        if col is not None:
+            return self.final_iq[raw_score][col]
+        return _final_iq(self.base_iq[raw_score], age_percent)
+
+
+SCORING_TABLES = ScoringTables()
+
+
+def load_norms(path):
+    """Read a norm file written by openrpm-norms as ScoringTables arguments."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('format') != NORMS_FORMAT or data.get('version') != NORMS_VERSION:
+        raise ValueError(f"{path} is not a version {NORMS_VERSION} norm file")
+    try:
+        norms = {
+            'spline_points': [(int(x), float(y)) for x, y in data['spline_points']],
+            'normative': {int(k): [int(v) for v in row] for k, row in data['normative_distribution'].items()},
+            'age_percents': {int(k): float(v) for k, v in data['age_percents'].items()},
+            'norms_id': str(data['id']),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid norm file {path}: {e}") from e
+    if (len(norms['spline_points']) < 2 or sorted(norms['age_percents']) != sorted(AGE_PERCENTS)
+            or any(len(row) != len(SERIES_NAMES) for row in norms['normative'].values())):
+        raise ValueError(f"Invalid norm file {path}: incomplete tables")
+    return norms
+
+
+def use_norms(norms=None):
+    """Score with load_norms() output from now on, or with the manual's norms for None."""
+    global SCORING_TABLES
+    SCORING_TABLES = ScoringTables(**norms) if norms else ScoringTables()
+    log.info(f"Scoring with norms {SCORING_TABLES.norms_id}")
+    return SCORING_TABLES
+
+
+def get_age_percent(age_group):
+    percents = SCORING_TABLES.age_percents
+    return percents[age_group] if 0 <= age_group < len(percents) else 100
+
+
+def get_base_iq(score):
+    return SCORING_TABLES.get_base_iq(score)
+
+
+def get_closest_normative(score):
+    return SCORING_TABLES.get_expected(score)
 
 
 def calculate_raven_results(user_answers, answer_key, age_percent):
+    tables = SCORING_TABLES
     raw_score = 0
-    series_scores = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
+    series_scores = [0] * len(SERIES_NAMES)
 
     for q in range(1, 61):
         correct = answer_key.get(str(q)) or answer_key.get(q)
         user = user_answers.get(q)
         if correct is not None and user == correct:
             raw_score += 1
-            series_scores[get_series(q)] += 1
+            series_scores[(q - 1) // SERIES_SIZE] += 1
 
-    base_iq = get_base_iq(raw_score)
-    final_iq = round((base_iq * 100) / age_percent) if age_percent > 0 else 0
+    final_iq = tables.get_final_iq(raw_score, age_percent)
 
-    expected = get_closest_normative(raw_score)
-    series_names = ['A', 'B', 'C', 'D', 'E']
+    expected = tables.expected[raw_score]
     unreliable = 0
     deviation_a = 0
     details = []
 
-    for idx, name in enumerate(series_names):
-        actual = series_scores[name]
+    for idx, name in enumerate(SERIES_NAMES):
+        actual = series_scores[idx]
         exp = expected[idx]
         dev = actual - exp
         if name == 'A':
@@ -167,9 +296,69 @@ def calculate_raven_results(user_answers, answer_key, age_percent):
         "raw_score": raw_score,
         "max_score": 60,
         "iq": final_iq,
-        "diagnosis_key": get_diagnosis_key(final_iq),
+        "diagnosis_key": tables.diagnosis_key(final_iq),
         "reliability_status": rel_key,
-        "recommendation_key": get_recommendation_key(final_iq),
+        "recommendation_key": tables.recommendation_key(final_iq),
         "series_details": details,
         "age_used": age_percent
     }
+
+
+def _bucket_batch(values, buckets):
+    import numpy as np
+    return np.asarray(buckets)[np.clip(values, 0, len(buckets) - 1)]
+
+
+def answer_key_vector(answer_key):
+    """Answer key as a list of 60 options, 0 where the key has no entry."""
+    return [answer_key.get(str(q)) or answer_key.get(q) or 0
+            for q in range(1, TOTAL_QUESTIONS + 1)]
+
+
+def calculate_raven_results_batch(answers, answer_key, age_percents):
+    """Score N sessions at once.
+
+    `answers` is an (N, 60) matrix of chosen options (0 for unanswered),
+    `age_percents` a length-N vector. Returns a dict of NumPy arrays whose
+    rows match `calculate_raven_results` for the same session.
+    """
+    import numpy as np
+
+    tables = SCORING_TABLES
+    answers = np.asarray(answers)
+    if answers.ndim != 2 or answers.shape[1] != TOTAL_QUESTIONS:
+        raise ValueError(f"Expected an (N, {TOTAL_QUESTIONS}) answer matrix, got {answers.shape}")
+    age_percents = np.broadcast_to(np.asarray(age_percents, dtype=np.float64), answers.shape[:1])
+
+    key = np.asarray(answer_key_vector(answer_key))
+    correct = (answers == key) & (key != 0)
+    series_scores = correct.reshape(-1, len(SERIES_NAMES), SERIES_SIZE).sum(axis=2)
+    raw_score = series_scores.sum(axis=1)
+
+    base_iq = np.asarray(tables.base_iq)[raw_score]
+    valid_age = age_percents > 0
+    iq = np.where(valid_age, np.rint(base_iq * 100 / np.where(valid_age, age_percents, 1)), 0)
+    iq = iq.astype(np.int64)
+
+    expected = np.asarray(tables.expected)[raw_score]
+    deviation = series_scores - expected
+    unreliable = (np.abs(deviation) > 2).sum(axis=1)
+
+    reliability = np.select(
+        [deviation[:, 0] <= -3, unreliable > 2, raw_score < 15],
+        ['defect', 'unreliable', 'low_reliability'],
+        default='good')
+
+    return {
+        "raw_score": raw_score,
+        "max_score": TOTAL_QUESTIONS,
+        "series_scores": series_scores,
+        "expected": expected,
+        "deviation": deviation,
+        "iq": iq,
+        "diagnosis_key": _bucket_batch(iq, tables.diagnosis),
+        "degree_key": _bucket_batch(iq, tables.degree),
+        "recommendation_key": _bucket_batch(iq, tables.recommendation),
+        "reliability_status": reliability,
+        "age_used": np.asarray(age_percents),
+    }
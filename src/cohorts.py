@@ -0,0 +1,258 @@
+import argparse
+import os
+import sqlite3
+import struct
+import sys
+from array import array
+
+import calculations
+import locales
+import store
+from logger import get_logger, log_to_stderr
+
+log = get_logger('cohorts')
+
+FILE_NAME = 'cohorts.bin'
+MAGIC = b'ORPMCOH2'
+# Magic, id of the last stored session counted, flags
+HEADER = struct.Struct('<8sQQ')
+# Tables written before the flags were added
+MAGIC_V1 = b'ORPMCOH1'
+HEADER_V1 = struct.Struct('<8sQ')
+# The counts come from other databases, so the table cannot catch up with one
+MERGED = 1
+
+AGE_GROUPS = len(calculations.AGE_PERCENTS)
+SCORE_BINS = calculations.TOTAL_QUESTIONS + 1
+SERIES_BINS = calculations.SERIES_SIZE + 1
+# One histogram for the raw score, then one per series
+GROUP_SIZE = SCORE_BINS + SERIES_BINS * len(calculations.SERIES_NAMES)
+# Cohorts smaller than this are not shown to candidates
+MIN_COHORT = 30
+
+SCORE_COLUMNS = ['raw_score'] + [f'series_{s.lower()}' for s in calculations.SERIES_NAMES]
+
+
+def default_path():
+    return os.path.join(store.get_data_dir(), FILE_NAME)
+
+
+def _offset(age_group, series=None):
+    base = age_group * GROUP_SIZE
+    if series is None:
+        return base, SCORE_BINS
+    return base + SCORE_BINS + calculations.SERIES_NAMES.index(series) * SERIES_BINS, SERIES_BINS
+
+
+class CohortTable:
+    """Score distribution of every age group: the raw score and each series.
+
+    Scores are small integers, so each distribution is an exact histogram
+    with one count per possible score. Tables from several machines merge
+    by adding counts, and a percentile is answered from prefix sums that
+    are rebuilt once after a batch of updates. A merged table is only
+    read: its session ids belong to other databases, so it never catches
+    up with a local one.
+    """
+
+    def __init__(self, counts=None, last_id=0, path=None, merged=False):
+        self.counts = counts or array('Q', bytes(8 * AGE_GROUPS * GROUP_SIZE))
+        self.last_id = last_id
+        self.path = path
+        self.merged = merged
+        self._below = None
+
+    def copy(self):
+        return CohortTable(array('Q', self.counts), self.last_id, self.path, self.merged)
+
+    def add(self, age_group, raw_score, series_scores):
+        """Count one session; series_scores follows calculations.SERIES_NAMES."""
+        if not 0 <= age_group < AGE_GROUPS:
+            return False
+        base = age_group * GROUP_SIZE
+        self.counts[base + min(max(raw_score, 0), SCORE_BINS - 1)] += 1
+        base += SCORE_BINS
+        for score in series_scores:
+            self.counts[base + min(max(score, 0), SERIES_BINS - 1)] += 1
+            base += SERIES_BINS
+        self._below = None
+        return True
+
+    def add_results(self, age_group, results):
+        series = {d['series']: d['score'] for d in results['series_details']}
+        return self.add(age_group, results['raw_score'],
+                        [series.get(s, 0) for s in calculations.SERIES_NAMES])
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        # Session ids of different databases cannot be compared
+        self.last_id = 0
+        self.merged = True
+        self._below = None
+
+    def total(self, age_group, series=None):
+        if not 0 <= age_group < AGE_GROUPS:
+            return 0
+        below = self._below or self._prefix_sums()
+        start, size = _offset(age_group, series)
+        last = start + size - 1
+        return below[last] + self.counts[last]
+
+    def _prefix_sums(self):
+        # below[i] counts the sessions of the same histogram scoring less than bin i
+        below = array('Q', bytes(8 * len(self.counts)))
+        histograms = [_offset(g, s) for g in range(AGE_GROUPS)
+                      for s in [None] + calculations.SERIES_NAMES]
+        for start, size in histograms:
+            running = 0
+            for i in range(start, start + size):
+                below[i] = running
+                running += self.counts[i]
+        self._below = below
+        return below
+
+    def percentile(self, age_group, score, series=None):
+        """Mid-rank percentile of a score within its age group, None for an empty cohort."""
+        total = self.total(age_group, series)
+        if not total:
+            return None
+        start, size = _offset(age_group, series)
+        i = start + min(max(score, 0), size - 1)
+        below = self._below
+        return 100 * (below[i] + self.counts[i] / 2) / total
+
+    def to_bytes(self):
+        counts = array('Q', self.counts)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return HEADER.pack(MAGIC, self.last_id, MERGED if self.merged else 0) + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC_V1)] == MAGIC_V1:
+            magic, last_id = HEADER_V1.unpack_from(data)
+            header, flags = HEADER_V1, 0
+        else:
+            magic, last_id, flags = HEADER.unpack_from(data)
+            header = HEADER
+        if magic not in (MAGIC, MAGIC_V1) or len(data) != header.size + 8 * AGE_GROUPS * GROUP_SIZE:
+            raise ValueError("Not a cohort table")
+        counts = array('Q', data[header.size:])
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return cls(counts, last_id, merged=bool(flags & MERGED))
+
+    @classmethod
+    def load(cls, path=None):
+        """The table stored at path, or an empty one if it is missing or unreadable."""
+        path = path or default_path()
+        try:
+            with open(path, 'rb') as f:
+                table = cls.from_bytes(f.read())
+        except FileNotFoundError:
+            table = cls()
+        except (OSError, ValueError, struct.error) as e:
+            log.warning(f"Ignoring cohort table {path}: {e}")
+            table = cls()
+        table.path = path
+        return table
+
+    def save(self, path=None):
+        path = path or self.path or default_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    def catch_up(self, conn):
+        """Count the sessions stored in conn since the last call; returns how many."""
+        if self.merged:
+            log.debug(f"Cohort table {self.path} is merged, not counting local sessions into it")
+            return 0
+        newest = conn.execute('SELECT MAX(id) FROM sessions').fetchone()[0] or 0
+        if newest < self.last_id:
+            log.info("Session database was replaced, recounting cohorts")
+            self.counts = array('Q', bytes(8 * AGE_GROUPS * GROUP_SIZE))
+            self.last_id = 0
+            self._below = None
+        added = 0
+        rows = conn.execute(f"SELECT id, age_group, {', '.join(SCORE_COLUMNS)} FROM sessions "
+                            f"WHERE id > ? ORDER BY id", (self.last_id,))
+        for row_id, age_group, raw_score, *series in rows:
+            added += self.add(age_group, raw_score, series)
+            self.last_id = row_id
+        return added
+
+
+def build(db_path=None):
+    conn = store.connect_readonly(db_path or store.default_path())
+    try:
+        table = CohortTable()
+        table.catch_up(conn)
+        return table
+    finally:
+        conn.close()
+
+
+def _print_table(table, series=None):
+    bins = SCORE_BINS if series is None else SERIES_BINS
+    groups = range(AGE_GROUPS)
+    print('score\t' + '\t'.join(locales.AGE_RANGES[g] for g in groups))
+    print('n\t' + '\t'.join(str(table.total(g, series)) for g in groups))
+    for score in range(bins):
+        cells = []
+        for g in groups:
+            p = table.percentile(g, score, series)
+            cells.append('-' if p is None else f'{p:.1f}')
+        print(f'{score}\t' + '\t'.join(cells))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-cohorts',
+        description="Build, merge and query the per-age-group score distributions.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help='count every session of a session database')
+    p.add_argument('--db', help='session database (default: the local session store)')
+    p.add_argument('-o', '--output', required=True)
+
+    p = sub.add_parser('merge', help='add up cohort tables from several machines')
+    p.add_argument('tables', nargs='+')
+    p.add_argument('-o', '--output', required=True)
+
+    p = sub.add_parser('show', help='print the percentile of every score per age group')
+    p.add_argument('table', nargs='?', help='cohort table (default: the local one)')
+    p.add_argument('--series', choices=calculations.SERIES_NAMES)
+    return parser
+
+
+def main(argv):
+    args = build_parser().parse_args(argv[1:])
+    log_to_stderr()
+
+    if args.command == 'build':
+        try:
+            table = build(args.db)
+        except sqlite3.Error as e:
+            log.error(f"Could not read {args.db or store.default_path()}: {e}")
+            return 1
+        table.save(args.output)
+        log.info(f"Counted sessions up to id {table.last_id} into {args.output}")
+    elif args.command == 'merge':
+        table = CohortTable()
+        for path in args.tables:
+            with open(path, 'rb') as f:
+                table.merge(CohortTable.from_bytes(f.read()))
+        table.save(args.output)
+        log.info(f"Merged {len(args.tables)} table(s) into {args.output}")
+    else:
+        _print_table(CohortTable.load(args.table), args.series)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cohorts
+import store
+import upload
+from logger import get_logger, log_to_stderr
+
+log = get_logger('collector')
+
+BATCH_SIZE = 512
+# How long a short batch waits for more rows before it is written
+FLUSH_INTERVAL = 0.02
+# Rows received but not yet committed, across all connections
+QUEUE_LIMIT = 4096
+LINE_LIMIT = 64 * 1024
+STATS_INTERVAL = 60
+# Seconds between writes of the cohort table while sessions keep arriving
+COHORTS_SAVE_INTERVAL = 10
+
+
+def default_socket():
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or store.get_data_dir()
+    return os.path.join(runtime, 'openrpm-collector.sock')
+
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def settle(self, data):
+        self.send(data)
+        self.pending -= 1
+        if not self.pending:
+            self.idle.set()
+
+
+class Collector:
+    """Receives finished sessions from kiosks and stores them in one session database.
+
+    Clients send one JSON session row per line (see upload.encode_row) and
+    get one {"ack": session_id} line back per row once it is committed.
+    Rows pass through a bounded queue, so a connection whose rows cannot
+    be stored fast enough simply stops being read. A single database
+    thread inserts them in batches with INSERT OR IGNORE, which makes
+    resubmitting a session harmless. With a cohort table path, the same
+    thread keeps that table counting every stored session.
+    """
+
+    def __init__(self, path=None, cohorts_path=None):
+        self.path = path or store.default_path()
+        self.cohorts_path = cohorts_path
+        self._cohorts = None
+        self._cohorts_saved = 0
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self._queue = None
+        self._servers = []
+        self._writer_task = None
+        self._db = ThreadPoolExecutor(1, thread_name_prefix='openrpm-collector-db')
+        self._conn = None
+
+    async def start(self, address):
+        """Listen on an upload.parse_address() tuple; may be called once per address."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(QUEUE_LIMIT)
+            self._writer_task = asyncio.create_task(self._write_batches())
+        kind, target = address
+        if kind == 'unix':
+            if os.path.exists(target):
+                os.remove(target)
+            server = await asyncio.start_unix_server(self._handle, target, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self._handle, *target, limit=LINE_LIMIT)
+        self._servers.append(server)
+        log.info(f"Listening on {kind}:{target}, storing to {self.path}")
+        return server
+
+    async def stop(self):
+        """Stop accepting, commit every row already received, then close the database."""
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        if self._queue is not None:
+            await self._queue.join()
+            self._writer_task.cancel()
+        await asyncio.get_running_loop().run_in_executor(self._db, self._close_db)
+        self._db.shutdown()
+
+    def stats(self):
+        return {'received': self.received, 'inserted': self.inserted,
+                'duplicates': self.duplicates, 'rejected': self.rejected}
+
+    async def _handle(self, reader, writer):
+        client = _Client(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    row = upload.decode_row(line)
+                except (ValueError, KeyError, TypeError) as e:
+                    self.rejected += 1
+                    client.send(upload.encode_reject(line, e))
+                    continue
+                self.received += 1
+                client.pending += 1
+                client.idle.clear()
+                # Blocks while the queue is full, which stops reading from this client
+                await self._queue.put((row, client))
+            await client.idle.wait()
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+            log.debug(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    def _drain(self, batch):
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _write_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < BATCH_SIZE:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                self._drain(batch)
+
+            rows = list({row[0]: row for row, _ in batch}.values())
+            try:
+                inserted = await loop.run_in_executor(self._db, self._insert, rows)
+                self.inserted += inserted
+                self.duplicates += len(batch) - inserted
+                for row, client in batch:
+                    client.settle(upload.encode_ack(row[0]))
+            except sqlite3.Error as e:
+                log.error(f"Could not store {len(rows)} session(s): {e}")
+                reply = json.dumps({'error': 'store unavailable'}).encode('utf-8') + b'\n'
+                for row, client in batch:
+                    client.settle(reply)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _insert(self, rows):
+        if self._conn is None:
+            self._conn = store.connect(self.path)
+        before = self._conn.total_changes
+        with self._conn:
+            self._conn.executemany(store.INSERT_SQL, rows)
+        inserted = self._conn.total_changes - before
+        if self.cohorts_path:
+            self._count_cohorts()
+        return inserted
+
+    def _count_cohorts(self, force=False):
+        if self._cohorts is None:
+            self._cohorts = cohorts.CohortTable.load(self.cohorts_path)
+        last_id = self._cohorts.last_id
+        self._cohorts.catch_up(self._conn)
+        now = time.monotonic()
+        if force or (self._cohorts.last_id != last_id and now - self._cohorts_saved >= COHORTS_SAVE_INTERVAL):
+            try:
+                self._cohorts.save()
+                self._cohorts_saved = now
+            except OSError as e:
+                log.warning(f"Could not save cohort table: {e}")
+
+    def _close_db(self):
+        if self._conn is not None:
+            if self.cohorts_path:
+                self._count_cohorts(force=True)
+            self._conn.close()
+            self._conn = None
+
+
+async def _log_stats(collector, interval):
+    while True:
+        await asyncio.sleep(interval)
+        log.info(f"Sessions: {collector.stats()}")
+
+
+async def serve(addresses, path=None, stats_interval=STATS_INTERVAL, cohorts_path=None):
+    collector = Collector(path, cohorts_path)
+    for address in addresses:
+        await collector.start(address)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    stats_task = asyncio.create_task(_log_stats(collector, stats_interval))
+    started = time.monotonic()
+    await stopping.wait()
+
+    stats_task.cancel()
+    await collector.stop()
+    log.info(f"Stopped after {time.monotonic() - started:.0f}s: {collector.stats()}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-collector',
+        description="Collect finished Open RPM sessions from kiosks into one session store.")
+    parser.add_argument('-l', '--listen', action='append', metavar='ADDRESS',
+                        help="unix:PATH, an absolute socket path or HOST:PORT; repeatable "
+                             "(default: unix socket in $XDG_RUNTIME_DIR)")
+    parser.add_argument('--db', help='session database (default: the local session store)')
+    parser.add_argument('--cohorts', metavar='PATH',
+                        help='keep a cohort table of the stored sessions (see openrpm-cohorts)')
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help='seconds between statistics log lines')
+    return parser
+
+
+def main(argv):
+    parser = build_parser()
+    args = parser.parse_args(argv[1:])
+
+    log_to_stderr()
+    try:
+        addresses = [upload.parse_address(a) for a in args.listen or [default_socket()]]
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(serve(addresses, args.db, args.stats_interval, args.cohorts))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
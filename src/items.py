@@ -0,0 +1,434 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import calculations
+import store
+from logger import get_logger, log_to_stderr
+
+log = get_logger('items')
+
+ITEMS = calculations.TOTAL_QUESTIONS
+SERIES_COUNT = len(calculations.SERIES_NAMES)
+MAX_OPTION = 8
+FETCH_SIZE = 65536
+RANGES_PER_JOB = 4
+BLOCK_SIZE = 65536
+
+# Ability grid of the 2PL fit
+QUADRATURE_POINTS = 41
+THETA_LIMIT = 4.0
+MAX_ITERATIONS = 200
+TOLERANCE = 1e-6
+NEWTON_STEPS = 4
+POSTERIOR_FLOOR = -50.0
+# Weak normal priors on slope and intercept keep items almost everyone
+# solves (most of series A) from running off to infinity
+SLOPE_PRIOR = (1.0, 1.0)
+INTERCEPT_PRIOR = (0.0, 4.0)
+
+# Report flags
+EASY_P = 0.95
+HARD_P = 0.05
+WEAK_RPB = 0.2
+ORDER_GAP = 0.1
+
+ANSWERS_SQL = ("SELECT answers FROM sessions WHERE id >= ? AND id < ? AND length(answers) = ? "
+               "AND answer_key_version = ?")
+OTHER_KEYS_SQL = "SELECT COUNT(*) FROM sessions WHERE answer_key_version != ?"
+
+
+class ResponseMatrix:
+    """Correct and answered flags of N sessions by 60 items, eight items per byte.
+
+    `choices` counts how often each option was picked per item, with
+    column 0 for unanswered.
+    """
+
+    def __init__(self, correct, answered, choices):
+        self.correct = correct
+        self.answered = answered
+        self.choices = choices
+
+    def __len__(self):
+        return len(self.correct)
+
+    def unpack(self, start=0, stop=None, dtype=np.float32):
+        return np.unpackbits(self.correct[start:stop], axis=1, count=ITEMS).astype(dtype)
+
+    def split(self, parts):
+        bounds = np.linspace(0, len(self), parts + 1).astype(int)
+        return [ResponseMatrix(self.correct[a:b], self.answered[a:b], None)
+                for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return pack_answers(np.zeros((0, ITEMS), dtype=np.uint8), np.zeros(ITEMS, dtype=np.uint8))
+        return cls(np.concatenate([p.correct for p in parts]),
+                   np.concatenate([p.answered for p in parts]),
+                   sum(p.choices for p in parts))
+
+
+def pack_answers(options, key):
+    """ResponseMatrix of an (N, 60) matrix of chosen options, 0 for unanswered."""
+    options = np.asarray(options, dtype=np.uint8)
+    key = np.asarray(key)
+    correct = (options == key) & (key != 0)
+    cells = np.arange(ITEMS) * (MAX_OPTION + 1) + np.minimum(options, MAX_OPTION)
+    choices = np.bincount(cells.ravel(), minlength=ITEMS * (MAX_OPTION + 1))
+    return ResponseMatrix(np.packbits(correct, axis=1), np.packbits(options != 0, axis=1),
+                          choices.reshape(ITEMS, MAX_OPTION + 1))
+
+
+def read_db_range(path, start, stop, key, version):
+    """Sessions of one id range that were answered against the key with this version."""
+    parts = []
+    conn = store.connect_readonly(path)
+    try:
+        cursor = conn.execute(ANSWERS_SQL, (start, stop, ITEMS, version))
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            text = ''.join(row[0] for row in rows).encode('ascii')
+            options = (np.frombuffer(text, dtype=np.uint8) - ord('0')).reshape(-1, ITEMS)
+            parts.append(pack_answers(options, key))
+    finally:
+        conn.close()
+    return ResponseMatrix.concat(parts)
+
+
+def classical_stats(matrix):
+    """p-values, corrected point-biserials and KR-20 reliabilities from sums over the matrix."""
+    n = len(matrix)
+    sum_x = np.zeros(ITEMS)
+    sum_xt = np.zeros(ITEMS)
+    sum_t = sum_t2 = 0.0
+    series_sum = np.zeros(SERIES_COUNT)
+    series_sq = np.zeros(SERIES_COUNT)
+    for start in range(0, n, BLOCK_SIZE):
+        x = matrix.unpack(start, start + BLOCK_SIZE, np.float64)
+        t = x.sum(axis=1)
+        sum_x += x.sum(axis=0)
+        sum_xt += t @ x
+        sum_t += t.sum()
+        sum_t2 += t @ t
+        s = x.reshape(-1, SERIES_COUNT, calculations.SERIES_SIZE).sum(axis=2)
+        series_sum += s.sum(axis=0)
+        series_sq += (s * s).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = sum_x / n
+        # Each item against the total of the other 59 (x * x == x)
+        rest_mean = (sum_t - sum_x) / n
+        cov = (sum_xt - sum_x) / n - p * rest_mean
+        rest_var = (sum_t2 - 2 * sum_xt + sum_x) / n - rest_mean ** 2
+        rpb = cov / np.sqrt(p * (1 - p) * rest_var)
+
+        pq = p * (1 - p)
+        total_var = sum_t2 / n - (sum_t / n) ** 2
+        series_mean = series_sum / n
+        series_var = series_sq / n - series_mean ** 2
+        k = calculations.SERIES_SIZE
+        series_kr20 = k / (k - 1) * (1 - pq.reshape(SERIES_COUNT, k).sum(axis=1) / series_var)
+        kr20 = ITEMS / (ITEMS - 1) * (1 - pq.sum() / total_var)
+    return {
+        'p': p, 'rpb': rpb, 'mean': sum_t / n, 'sd': np.sqrt(total_var), 'kr20': kr20,
+        'series_mean': series_mean, 'series_sd': np.sqrt(series_var), 'series_kr20': series_kr20,
+    }
+
+
+# Set in the parent before the pool forks, so every worker already has its shard
+_shards = []
+
+
+def _expected_counts(index, params):
+    """E-step over one shard: expected sessions and correct answers at each ability node."""
+    slopes, intercepts, theta, log_prior = params
+    logit = np.outer(theta, slopes) + intercepts
+    log_p = -np.logaddexp(0, -logit)
+    log_q = -np.logaddexp(0, logit)
+    weights = (log_p - log_q).T.astype(np.float32)
+    offset = (log_q.sum(axis=1) + log_prior).astype(np.float32)
+
+    shard = _shards[index]
+    sessions = np.zeros(len(theta))
+    correct = np.zeros((ITEMS, len(theta)))
+    marginal = 0.0
+    for start in range(0, len(shard), BLOCK_SIZE):
+        x = shard.unpack(start, start + BLOCK_SIZE)
+        loglik = x @ weights + offset
+        peak = loglik.max(axis=1, keepdims=True)
+        # Far below the peak, exp() yields float32 subnormals that slow the products below tenfold
+        posterior = np.exp(np.maximum(loglik - peak, POSTERIOR_FLOOR))
+        total = posterior.sum(axis=1, keepdims=True)
+        posterior /= total
+        marginal += float((peak + np.log(total)).sum())
+        sessions += posterior.sum(axis=0)
+        correct += x.T @ posterior
+    return sessions, correct, marginal
+
+
+def _maximize(slopes, intercepts, theta, sessions, correct):
+    """M-step: a few Newton steps of every item's logistic regression on the expected counts."""
+    (a_mean, a_sd), (c_mean, c_sd) = SLOPE_PRIOR, INTERCEPT_PRIOR
+    for _ in range(NEWTON_STEPS):
+        prob = 1 / (1 + np.exp(-(np.outer(slopes, theta) + intercepts[:, None])))
+        residual = correct - sessions * prob
+        weight = sessions * prob * (1 - prob)
+        grad_a = residual @ theta - (slopes - a_mean) / a_sd ** 2
+        grad_c = residual.sum(axis=1) - (intercepts - c_mean) / c_sd ** 2
+        h_aa = weight @ (theta * theta) + 1 / a_sd ** 2
+        h_ac = weight @ theta
+        h_cc = weight.sum(axis=1) + 1 / c_sd ** 2
+        det = h_aa * h_cc - h_ac * h_ac
+        slopes = slopes + (h_cc * grad_a - h_ac * grad_c) / det
+        intercepts = intercepts + (h_aa * grad_c - h_ac * grad_a) / det
+    return slopes, intercepts
+
+
+def fit_2pl(matrix, p_values, jobs=1, max_iterations=MAX_ITERATIONS):
+    """Marginal maximum likelihood 2PL fit by EM over a standard normal ability grid.
+
+    Returns slopes a, difficulties b (P = 1 / (1 + exp(-a (theta - b)))) and
+    fit details. Each E-step runs on row shards of the response matrix in
+    forked worker processes; only parameters and per-node sums cross
+    process boundaries.
+    """
+    global _shards
+    theta = np.linspace(-THETA_LIMIT, THETA_LIMIT, QUADRATURE_POINTS)
+    log_prior = -theta ** 2 / 2
+    log_prior -= np.log(np.exp(log_prior).sum())
+    slopes = np.ones(ITEMS)
+    p = np.clip(p_values, 0.01, 0.99)
+    intercepts = np.log(p / (1 - p))
+
+    _shards = matrix.split(jobs * 2 if jobs > 1 else 1)
+    pool = None
+    if jobs > 1:
+        # Modules are served from the GResource import hook, so workers must be
+        # forked from this process rather than re-importing by name.
+        pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+
+    previous = None
+    converged = False
+    try:
+        for iteration in range(1, max_iterations + 1):
+            params = (slopes, intercepts, theta, log_prior)
+            if pool:
+                parts = list(pool.map(_expected_counts, range(len(_shards)), [params] * len(_shards)))
+            else:
+                parts = [_expected_counts(i, params) for i in range(len(_shards))]
+            sessions = sum(part[0] for part in parts)
+            correct = sum(part[1] for part in parts)
+            loglik = sum(part[2] for part in parts)
+            slopes, intercepts = _maximize(slopes, intercepts, theta, sessions, correct)
+            if previous is not None and abs(loglik - previous) <= TOLERANCE * abs(loglik):
+                converged = True
+                break
+            previous = loglik
+    finally:
+        if pool:
+            pool.shutdown()
+        _shards = []
+
+    if not converged:
+        log.warning(f"2PL fit did not converge in {max_iterations} iterations")
+    return {
+        'a': slopes, 'b': -intercepts / slopes,
+        'iterations': iteration, 'log_likelihood': loglik, 'converged': converged,
+    }
+
+
+def _item_flags(q, p, rpb, choices, key):
+    flags = []
+    if p[q] > EASY_P:
+        flags.append('easy')
+    elif p[q] < HARD_P:
+        flags.append('hard')
+    if rpb[q] < 0:
+        flags.append('negative')
+    elif rpb[q] < WEAK_RPB:
+        flags.append('weak')
+    wrong = [(count, option) for option, count in enumerate(choices[q]) if option and option != key[q]]
+    if wrong and max(wrong)[0] > choices[q][key[q]]:
+        flags.append('distractor')
+    # Items get harder along a series, so one clearly easier than its predecessor is out of place
+    if q % calculations.SERIES_SIZE and p[q] > p[q - 1] + ORDER_GAP:
+        flags.append('order')
+    return flags
+
+
+def _number(value, digits=3):
+    return None if not np.isfinite(value) else round(float(value), digits)
+
+
+def build_report(matrix, key, jobs=1, irt=True, max_iterations=MAX_ITERATIONS):
+    n = len(matrix)
+    if not n:
+        raise ValueError("No sessions to analyse")
+    stats = classical_stats(matrix)
+    fit = fit_2pl(matrix, stats['p'], jobs, max_iterations) if irt else None
+    choices = matrix.choices
+    p, rpb = stats['p'], stats['rpb']
+
+    items = []
+    for q in range(ITEMS):
+        wrong = sorted(((int(count), option) for option, count in enumerate(choices[q])
+                        if option and option != key[q]), reverse=True)
+        item = {
+            'item': q + 1,
+            'series': calculations.get_series(q + 1),
+            'key': int(key[q]),
+            'p': _number(p[q]),
+            'omitted': _number(choices[q][0] / n),
+            'rpb': _number(rpb[q]),
+            'top_distractor': wrong[0][1] if wrong and wrong[0][0] else None,
+            'top_distractor_share': _number(wrong[0][0] / n) if wrong else None,
+            'flags': _item_flags(q, p, rpb, choices, key),
+        }
+        if fit:
+            item['a'] = _number(fit['a'][q])
+            item['b'] = _number(fit['b'][q])
+        items.append(item)
+
+    series = []
+    for i, name in enumerate(calculations.SERIES_NAMES):
+        block = slice(i * calculations.SERIES_SIZE, (i + 1) * calculations.SERIES_SIZE)
+        entry = {
+            'series': name,
+            'mean': _number(stats['series_mean'][i]),
+            'sd': _number(stats['series_sd'][i]),
+            'kr20': _number(stats['series_kr20'][i]),
+            'mean_p': _number(p[block].mean()),
+            'mean_rpb': _number(np.nanmean(rpb[block])),
+            'flagged': [item['item'] for item in items[block] if item['flags']],
+        }
+        if fit:
+            entry['mean_a'] = _number(fit['a'][block].mean())
+            entry['b_range'] = [_number(fit['b'][block].min()), _number(fit['b'][block].max())]
+        series.append(entry)
+
+    report = {
+        'sessions': n,
+        'answer_key_version': store.answer_key_version(calculations.decode_answers()),
+        'test': {'mean': _number(stats['mean']), 'sd': _number(stats['sd']), 'kr20': _number(stats['kr20'])},
+        'series': series,
+        'items': items,
+    }
+    if fit:
+        report['irt'] = {'model': '2PL', 'iterations': fit['iterations'],
+                         'log_likelihood': _number(fit['log_likelihood'], 1), 'converged': fit['converged']}
+    return report
+
+
+def _cell(value, width, digits=2):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return f'{value:{width}.{digits}f}'
+    return str(value).rjust(width)
+
+
+def write_text(report, out):
+    test = report['test']
+    out.write(f"{report['sessions']} sessions, mean {test['mean']:.2f}, sd {test['sd']:.2f}, "
+              f"KR-20 {_cell(test['kr20'], 0)}\n")
+    if 'irt' in report:
+        irt = report['irt']
+        state = 'converged' if irt['converged'] else 'not converged'
+        out.write(f"2PL: {irt['iterations']} EM iterations, {state}, "
+                  f"log-likelihood {irt['log_likelihood']}\n")
+
+    out.write('\nseries   mean     sd  KR-20 mean p  mean r  flagged\n')
+    for s in report['series']:
+        out.write(f"{s['series']:>6} {_cell(s['mean'], 6)} {_cell(s['sd'], 6)} {_cell(s['kr20'], 6)} "
+                  f"{_cell(s['mean_p'], 6)} {_cell(s['mean_rpb'], 7)}  "
+                  f"{', '.join(map(str, s['flagged'])) or '-'}\n")
+
+    out.write('\nitem key      p  omit    r_pb      a      b  distractor  flags\n')
+    for item in report['items']:
+        distractor = (f"{item['top_distractor']} ({item['top_distractor_share']:.0%})"
+                      if item['top_distractor'] else '-')
+        out.write(f"{item['series']}{(item['item'] - 1) % calculations.SERIES_SIZE + 1:<3} "
+                  f"{item['key']:>3} {_cell(item['p'], 6)} {_cell(item['omitted'], 5)} "
+                  f"{_cell(item['rpb'], 7)} {_cell(item.get('a'), 6)} {_cell(item.get('b'), 6)} "
+                  f"{distractor:>11}  {', '.join(item['flags'])}\n")
+
+
+def count_other_keys(path, version):
+    conn = store.connect_readonly(path)
+    try:
+        return conn.execute(OTHER_KEYS_SQL, (version,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def load_matrix(databases, jobs=1):
+    answer_key = calculations.decode_answers()
+    key = np.asarray(calculations.answer_key_vector(answer_key))
+    # Responses to an older key would be scored against the wrong options
+    version = store.answer_key_version(answer_key)
+    for path in databases:
+        if other := count_other_keys(path, version):
+            log.warning(f"Skipping {other} session(s) in {path} answered against another answer key")
+    tasks = [r + (key, version) for path in databases
+             for r in store.id_ranges(path, jobs * RANGES_PER_JOB)]
+    if jobs <= 1:
+        return ResponseMatrix.concat(read_db_range(*task) for task in tasks), key
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        return ResponseMatrix.concat(pool.map(read_db_range, *zip(*tasks)) if tasks else []), key
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-items',
+        description="Item difficulty, discrimination and 2PL IRT fits over stored sessions.")
+    parser.add_argument('--db', action='append',
+                        help='session database to read; repeatable (default: the local session store)')
+    parser.add_argument('-o', '--output', default='-', help="report file, '-' for stdout")
+    parser.add_argument('-t', '--output-format', choices=['text', 'json'], default='text')
+    parser.add_argument('--no-irt', action='store_true', help='only compute the classical statistics')
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: CPU count)')
+    return parser
+
+
+def main(argv):
+    args = build_parser().parse_args(argv[1:])
+    log_to_stderr()
+
+    jobs = max(1, args.jobs)
+    started = time.monotonic()
+    try:
+        matrix, key = load_matrix(args.db or [store.default_path()], jobs)
+        log.info(f"Loaded {len(matrix)} sessions in {time.monotonic() - started:.1f}s")
+        report = build_report(matrix, key, jobs, not args.no_irt, max(1, args.max_iterations))
+    except (OSError, sqlite3.Error, ValueError) as e:
+        log.error(f"Item analysis failed: {e}")
+        return 1
+    log.info(f"Analysed {len(matrix)} sessions in {time.monotonic() - started:.1f}s")
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        if args.output_format == 'json':
+            json.dump(report, out, indent=1)
+            out.write('\n')
+        else:
+            write_text(report, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,202 @@
+import os
+import struct
+import threading
+import uuid
+
+import store
+from logger import get_logger
+
+log = get_logger('journal')
+
+JOURNAL_NAME = 'session.journal'
+MAGIC = b'ORPMJRN1'
+
+# kind, question, option, age group, elapsed test time in ms, value
+RECORD = struct.Struct('<BBBBII')
+HEADER = struct.Struct('<8s16s')
+
+START, SELECT, NAVIGATE, TIME = range(1, 5)
+# Only written by snapshots: per-question viewing time and time to first answer in value
+DWELL, FIRST_ANSWER = range(5, 7)
+
+
+def default_path(slot=0):
+    """Journal of candidate window `slot`; the first window keeps the original name."""
+    name = JOURNAL_NAME if not slot else f'session-{slot}.journal'
+    return os.path.join(store.get_data_dir(), name)
+
+
+class JournalState:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.age_group = 0
+        self.age_percent = 100
+        self.answers = {}
+        self.current = 1
+        self.elapsed_ms = 0
+        self.item_times = {}
+        self.first_answer = {}
+        self._shown_at = None
+
+    def _viewed(self, elapsed_ms):
+        return self.item_times.get(self.current, 0) + elapsed_ms - self._shown_at
+
+    def apply(self, kind, question, option, age_group, elapsed_ms, value):
+        self.elapsed_ms = max(self.elapsed_ms, elapsed_ms)
+        if kind == START:
+            self.age_group = age_group
+            self.age_percent = value / 100
+        elif kind == SELECT:
+            self.answers[question] = option
+            if question == self.current and self._shown_at is not None:
+                self.first_answer.setdefault(question, self._viewed(elapsed_ms))
+        elif kind == NAVIGATE:
+            if self._shown_at is not None:
+                self.item_times[self.current] = self._viewed(elapsed_ms)
+            self.current = question
+            self._shown_at = elapsed_ms
+        elif kind == DWELL:
+            self.item_times[question] = value
+        elif kind == FIRST_ANSWER:
+            self.first_answer[question] = value
+
+    def close_view(self):
+        """Charge the time up to the last record to the question on screen."""
+        if self._shown_at is not None:
+            self.item_times[self.current] = self._viewed(self.elapsed_ms)
+            self._shown_at = None
+
+
+def load(path=None):
+    """Rebuild an unfinished session from its journal, or return None."""
+    path = path or default_path()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        log.warning(f"Could not read journal: {e}")
+        return None
+
+    if len(data) < HEADER.size + RECORD.size:
+        return None
+    magic, session_id = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        log.warning("Ignoring journal with unknown format")
+        return None
+
+    state = JournalState(session_id.hex())
+    # A torn trailing record from a crash mid-write is simply dropped
+    end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+    for record in RECORD.iter_unpack(data[HEADER.size:end]):
+        state.apply(*record)
+    state.close_view()
+    return state
+
+
+class Journal:
+    """Append-only log of one test session, written by a background thread.
+
+    Events are packed into fixed-size records and handed to the writer,
+    which appends and fsyncs everything queued since its last pass, so an
+    event reaches disk within one fsync of being recorded.
+    """
+
+    def __init__(self, path=None, session_id=None):
+        self.path = path or default_path()
+        self.session_id = session_id or uuid.uuid4().hex
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._file = None
+        self._thread = None
+
+    def open(self, state=None):
+        """Start a new journal, or a compacted copy of a resumed `state`."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, bytes.fromhex(self.session_id)))
+            if state:
+                f.write(self._snapshot(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+        self._file = open(self.path, 'ab', buffering=0)
+        self._thread = threading.Thread(target=self._run, name='openrpm-journal', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _snapshot(state):
+        elapsed = state.elapsed_ms
+        records = [RECORD.pack(START, 1, 0, state.age_group, elapsed, round(state.age_percent * 100))]
+        records += [RECORD.pack(DWELL, q, 0, 0, elapsed, ms) for q, ms in sorted(state.item_times.items())]
+        records += [RECORD.pack(FIRST_ANSWER, q, 0, 0, elapsed, ms)
+                    for q, ms in sorted(state.first_answer.items())]
+        records += [RECORD.pack(SELECT, q, opt, 0, elapsed, 0) for q, opt in sorted(state.answers.items())]
+        records.append(RECORD.pack(NAVIGATE, state.current, 0, 0, elapsed, 0))
+        return b''.join(records)
+
+    def _append(self, kind, question=0, option=0, age_group=0, elapsed_ms=0, value=0):
+        if self._file is None:
+            return
+        with self._lock:
+            self._pending.append(RECORD.pack(kind, question, option, age_group, elapsed_ms, value))
+        self._wakeup.set()
+
+    def start(self, age_group, age_percent):
+        self._append(START, 1, 0, age_group, 0, round(age_percent * 100))
+
+    def select(self, question, option, elapsed_ms):
+        self._append(SELECT, question, option, 0, elapsed_ms)
+
+    def navigate(self, question, elapsed_ms):
+        self._append(NAVIGATE, question, 0, 0, elapsed_ms)
+
+    def time(self, elapsed_ms):
+        self._append(TIME, 0, 0, 0, elapsed_ms)
+
+    def _flush(self):
+        with self._lock:
+            chunk = b''.join(self._pending)
+            self._pending = []
+        if chunk:
+            try:
+                self._file.write(chunk)
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                log.warning(f"Could not write journal: {e}")
+
+    def _run(self):
+        while not self._closing:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._flush()
+        # Events recorded while the last pass was writing, up to close()
+        self._flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join()
+        self._file.close()
+        self._file = None
+
+    def finish(self):
+        """Close the journal of a completed session and drop it from disk."""
+        self.close()
+        discard(self.path)
+
+
+def discard(path=None):
+    try:
+        os.remove(path or default_path())
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.warning(f"Could not remove journal: {e}")
@@ -1,11 +1,23 @@
 import os
 import gettext
-from gi.repository import GLib
+import sys
+import tracing
+from calculations import AGE_PERCENTS
 from logger import get_logger
 
 log = get_logger('locales')
 
-_translation = None
+MESSAGES_PATH = '/site/ikhlasulov/openrpm/messages/'
+MESSAGES_MAGIC = 'ORPMMSG1'
+# Interface languages shipped in po/LINGUAS, by native name
+LANGUAGE_NAMES = {'en': 'English', 'ru': 'Русский', 'id': 'Bahasa Indonesia'}
+
+_messages = None
+_language = None
+# object -> {setter name: (message key, transform)} for set_language to refresh;
+# holds the objects until unbind/unbind_all releases them
+_bindings = {}
+_listeners = []
 
 _EN = {
     "app.title": "Raven's Test", "app.subtitle": "Raven's Progressive Matrices (RPM)",
@@ -13,6 +25,8 @@ _EN = {
     "app.description": "A modern implementation of Raven's Progressive Matrices (RPM)",
     "about.comments": "A modern IQ testing application based on Raven's Progressive Matrices.",
     "menu.shortcuts": "Keyboard Shortcuts", "menu.about": "About Open RPM", "menu.quit": "Quit",
+    "menu.language": "Language", "menu.language_system": "System",
+    "menu.new_window": "New Candidate Window",
     "shortcuts.title": "Shortcuts", "shortcuts.quit": "Quit",
     "intro.instruction_title": "Instruction:",
     "intro.instruction_text": "You will be offered 60 tasks (5 series). Find the pattern and select the missing piece.",
@@ -23,8 +37,12 @@ _EN = {
     "test.progress_template": "Question {q} of 60 (Series {s})",
     "test.prev": "Back", "test.next": "Next", "test.finish": "Finish", "test.end": "End",
     "test.series": "Series", "confirm.title": "End?", "confirm.message": "End early? Only completed questions count.",
-    "confirm.cancel": "Cancel", "confirm.end": "Yes", "result.results_title": "Results",
-    "result.label": "Result", "result.age": "Age", "result.total_score": "Score",
+    "confirm.cancel": "Cancel", "confirm.end": "Yes",
+    "resume.title": "Resume Test?",
+    "resume.message": "An unfinished test was found ({answered} answers). Continue where it stopped?",
+    "resume.discard": "Discard", "resume.continue": "Continue", "result.results_title": "Results",
+    "result.label": "Result", "result.age": "Age", "result.percentile": "Percentile in Age Group",
+    "result.total_score": "Score",
     "result.time_taken": "Time", "result.series": "Series", "result.correct": "Correct",
     "result.deviation": "Deviation", "result.return": "Return",
     "result.interpretation": "Interpretation", "result.analysis": "Analysis &amp; Advice",
@@ -61,30 +79,157 @@ _EN = {
 }
 
 AGE_RANGES = ["14-30", "31-35", "36-40", "41-45", "46-50", "51-55", "56+"]
-AGE_PERCENTS = {0: 100, 1: 97, 2: 93, 3: 88, 4: 82, 5: 76, 6: 70}
 
 
-def _init_gettext():
-    global _translation
-    if _translation is not None:
-        return
+def _system_data_dirs():
+    # Same lookup as GLib.get_system_data_dirs(), without importing GLib
+    dirs = os.environ.get('XDG_DATA_DIRS') or '/usr/local/share:/usr/share'
+    return [d for d in dirs.split(os.pathsep) if d]
+
 
-    localedir = None
-    for d in GLib.get_system_data_dirs() or []:
+def _localedir():
+    for d in _system_data_dirs():
         p = os.path.join(d, 'locale')
         if os.path.exists(p):
-            localedir = p
+            return p
+    return '/usr/share/locale'
+
+
+def _requested_languages(language=None):
+    """Candidate catalog names, most specific first, like gettext's own lookup."""
+    if language:
+        values = [language]
+    else:
+        values = []
+        for var in ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG'):
+            if os.environ.get(var):
+                values = os.environ[var].split(':')
+                break
+    candidates = []
+    for value in values:
+        value = value.split('.')[0].split('@')[0]
+        if value in ('C', 'POSIX'):
             break
-    localedir = localedir or '/usr/share/locale'
-    _translation = gettext.translation('openrpm', localedir=localedir, fallback=True)
-    _translation.install()
+        for code in (value, value.split('_')[0]):
+            if code and code not in candidates:
+                candidates.append(code)
+    return candidates
+
+
+def parse_table(data):
+    """Key -> string dict of a compiled message table, see build-aux/compile-messages.py."""
+    parts = data.decode('utf-8').split('\0')
+    if parts[0] != MESSAGES_MAGIC:
+        raise ValueError("not a message table")
+    return dict(zip(parts[1::2], parts[2::2]))
+
+
+def _read_table(code):
+    # Only the GUI registers the messages resource, and it has loaded Gio by
+    # then; the headless tools must not import GLib just to find no table
+    if 'gi.repository.Gio' not in sys.modules:
+        return None
+    from gi.repository import Gio, GLib
+    try:
+        data = Gio.resources_lookup_data(f'{MESSAGES_PATH}{code}.msgs', Gio.ResourceLookupFlags.NONE)
+    except GLib.Error:
+        return None
+    try:
+        return parse_table(data.get_data())
+    except (UnicodeDecodeError, ValueError) as e:
+        log.warning(f"Ignoring message table {code}: {e}")
+        return None
+
+
+def _gettext_table(candidates):
+    # Without the messages gresource (e.g. running from the source tree)
+    translation = gettext.translation('openrpm', localedir=_localedir(),
+                                      languages=candidates or None, fallback=True)
+    table = {}
+    for key in _EN:
+        text = translation.gettext(key)
+        if text != key:
+            table[key] = text
+    return table
+
+
+def _load_messages(language=None):
+    candidates = _requested_languages(language)
+    for code in candidates:
+        table = _read_table(code)
+        if table is not None:
+            return code, table
+    return (candidates[0] if candidates else None), _gettext_table(candidates)
+
+
+def get_language():
+    return _language
+
+
+def set_language(language=None):
+    """Switch to `language`, or the environment's language if empty.
+
+    Bound widgets are refreshed where their text actually changes, then
+    the on_language_changed callbacks run.
+    """
+    global _messages, _language
+    code, table = _load_messages(language)
+    messages = dict(_EN)
+    messages.update(table)
+    previous, _messages, _language = _messages, messages, code
+    log.debug(f"Interface language {code or 'en'}, {len(table)} translated messages")
+    if previous is None:
+        return
+    for obj, setters in list(_bindings.items()):
+        for setter, (key, transform) in list(setters.items()):
+            if previous.get(key) != messages.get(key):
+                _apply_binding(obj, setter, key, transform)
+    for callback in list(_listeners):
+        callback()
 
 
 def get_text(key):
-    if _translation is None:
-        _init_gettext()
-    text = _translation.gettext(key)
-    return _EN.get(key, text) if text == key else text
+    if _messages is None:
+        set_language()
+    return _messages.get(key, key)
+
+
+def _apply_binding(obj, setter, key, transform):
+    text = get_text(key)
+    getattr(obj, setter)(transform(text) if transform else text)
+
+
+def bind(obj, key, setter='set_label', transform=None):
+    """Show message `key` through `obj.setter` now and after every language switch."""
+    if obj is None:
+        return
+    binding = (key, transform)
+    setters = _bindings.setdefault(obj, {})
+    if setters.get(setter) == binding:
+        return
+    setters[setter] = binding
+    _apply_binding(obj, setter, key, transform)
+
+
+def unbind(obj):
+    """Stop refreshing `obj` and release it, e.g. before it is destroyed."""
+    _bindings.pop(obj, None)
+
+
+def unbind_all(builder):
+    """Release the bindings of every object built by `builder`, e.g. when its window closes."""
+    for obj in builder.get_objects():
+        _bindings.pop(obj, None)
+
+
+def on_language_changed(callback):
+    """Call `callback()` after every language switch, for text built from templates."""
+    _listeners.append(callback)
+
+
+def disconnect_language_changed(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
 
 
 def get_localized_age_ranges():
@@ -109,16 +254,12 @@ def _apply_labels(builder, mapping):
     for obj_name, key in mapping.items():
         obj = builder.get_object(obj_name)
         if obj:
-            if hasattr(obj, 'set_label'):
-                obj.set_label(get_text(key))
-            elif hasattr(obj, 'set_title'):
-                obj.set_title(get_text(key))
+            bind(obj, key, 'set_label' if hasattr(obj, 'set_label') else 'set_title')
 
 
+@tracing.traced()
 def apply_localization(builder):
-    window = builder.get_object('main_window')
-    if window:
-        window.set_title(get_text('app.title'))
+    bind(builder.get_object('main_window'), 'app.title', 'set_title')
 
     _apply_labels(builder, {
         'header_label': 'app.site_title', 'title_label': 'app.title',
@@ -127,9 +268,8 @@ def apply_localization(builder):
     })
 
     instruction_row = builder.get_object('instruction_row')
-    if instruction_row:
-        instruction_row.set_title(get_text('intro.instruction_title'))
-        instruction_row.set_subtitle(get_text('intro.instruction_text'))
+    bind(instruction_row, 'intro.instruction_title', 'set_title')
+    bind(instruction_row, 'intro.instruction_text', 'set_subtitle')
 
 
 def apply_test_localization(builder):
@@ -149,6 +289,9 @@ def create_localized_menu():
     menu = Gio.Menu.new()
     section = Gio.Menu.new()
 
+    new_window_item = Gio.MenuItem.new(get_text('menu.new_window'), 'app.new-window')
+    section.append_item(new_window_item)
+
     shortcuts_item = Gio.MenuItem.new(get_text('menu.shortcuts'), 'app.shortcuts')
     section.append_item(shortcuts_item)
 
@@ -158,8 +301,11 @@ def create_localized_menu():
     quit_item = Gio.MenuItem.new(get_text('menu.quit'), 'app.quit')
     section.append_item(quit_item)
 
+    languages = Gio.Menu.new()
+    languages.append(get_text('menu.language_system'), "app.language('')")
+    for code, name in LANGUAGE_NAMES.items():
+        languages.append(name, f"app.language('{code}')")
+
+    menu.append_submenu(get_text('menu.language'), languages)
     menu.append_section(None, section)
     return menu
-
-
-_init_gettext()
@@ -20,4 +20,11 @@ def get_logger(name: str = 'openrpm') -> logging.Logger:
     return _root_logger.getChild(name.split('.')[-1]) if '.' in name else _root_logger
 
 
+def log_to_stderr():
+    """Move log output off stdout, for tools that stream results there."""
+    for handler in get_logger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sys.stderr)
+
+
 log = get_logger()
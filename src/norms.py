@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+import calculations
+import score
+import store
+from logger import get_logger, log_to_stderr
+
+log = get_logger('norms')
+
+AGE_GROUPS = len(calculations.AGE_PERCENTS)
+SCORE_BINS = calculations.TOTAL_QUESTIONS + 1
+SERIES_COUNT = len(calculations.SERIES_NAMES)
+SERIES_BINS = calculations.SERIES_SIZE + 1
+# Sessions per age group, raw score, series and series score
+COUNTS_SHAPE = (AGE_GROUPS, SCORE_BINS, SERIES_COUNT, SERIES_BINS)
+
+FETCH_SIZE = 65536
+DEFAULT_CHUNK_SIZE = 20000
+# Database id ranges per worker, so a slow range does not hold up the rest
+RANGES_PER_JOB = 4
+# Fewer sessions than this leave the corresponding manual value in place
+MIN_REFERENCE = 500
+MIN_AGE_GROUP = 200
+MIN_PROFILE = 30
+
+SCORES_SQL = (f"SELECT age_group, raw_score, "
+              f"{', '.join(f'series_{s.lower()}' for s in calculations.SERIES_NAMES)} "
+              f"FROM sessions WHERE id >= ? AND id < ?")
+
+
+def new_counts():
+    return np.zeros(COUNTS_SHAPE, dtype=np.int64)
+
+
+def add_scores(counts, age_groups, series_scores):
+    """Count sessions given an age group vector and an (N, 5) series score matrix."""
+    age_groups = np.asarray(age_groups, dtype=np.int64)
+    series_scores = np.clip(np.asarray(series_scores, dtype=np.int64), 0, SERIES_BINS - 1)
+    keep = (age_groups >= 0) & (age_groups < AGE_GROUPS)
+    age_groups, series_scores = age_groups[keep], series_scores[keep]
+    raw_scores = series_scores.sum(axis=1)
+    cells = ((age_groups * SCORE_BINS + raw_scores)[:, None] * SERIES_COUNT
+             + np.arange(SERIES_COUNT)) * SERIES_BINS + series_scores
+    counts += np.bincount(cells.ravel(), minlength=counts.size).reshape(COUNTS_SHAPE)
+    return int(keep.sum())
+
+
+def count_db_range(path, start, stop):
+    counts = new_counts()
+    conn = store.connect_readonly(path)
+    try:
+        cursor = conn.execute(SCORES_SQL, (start, stop))
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            block = np.array(rows, dtype=np.int64)
+            add_scores(counts, block[:, 0], block[:, 2:])
+    finally:
+        conn.close()
+    return counts
+
+
+def count_chunk(fmt, chunk):
+    """Score a chunk of answer sheets and count them; sheets without an age group are skipped."""
+    parse = score.parse_jsonl if fmt == 'jsonl' else score.parse_csv
+    default_key = calculations.decode_answers()
+    by_key = {}
+    for lineno, item in chunk:
+        try:
+            session = parse(item)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            log.warning(f"Skipping record {lineno}: {e}")
+            continue
+        if session['age_group'] is None:
+            continue
+        answer_key = session['answer_key'] or default_key
+        key = json.dumps(answer_key, sort_keys=True)
+        groups, sheets = by_key.setdefault(key, (answer_key, [], []))[1:]
+        groups.append(session['age_group'])
+        sheets.append([session['user_answers'].get(q, 0)
+                       for q in range(1, calculations.TOTAL_QUESTIONS + 1)])
+
+    counts = new_counts()
+    for answer_key, groups, sheets in by_key.values():
+        key = np.asarray(calculations.answer_key_vector(answer_key))
+        correct = (np.asarray(sheets) == key) & (key != 0)
+        series_scores = correct.reshape(-1, SERIES_COUNT, calculations.SERIES_SIZE).sum(axis=2)
+        add_scores(counts, groups, series_scores)
+    return counts
+
+
+def accumulate(databases=(), inputs=(), fmt=None, jobs=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Count every session of the databases and answer sheet files in one pass."""
+    counts = new_counts()
+    tasks = [(count_db_range, r) for path in databases
+             for r in store.id_ranges(path, jobs * RANGES_PER_JOB)]
+    chunks = score.iter_chunks(score.read_records(inputs, fmt), chunk_size) if inputs else ()
+
+    if jobs <= 1:
+        for func, args in tasks:
+            counts += func(*args)
+        for chunk_fmt, chunk in chunks:
+            counts += count_chunk(chunk_fmt, chunk)
+        return counts
+
+    # Modules are served from the GResource import hook, so workers must be
+    # forked from this process rather than re-importing by name.
+    context = multiprocessing.get_context('fork')
+    window = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        pending = [pool.submit(func, *args) for func, args in tasks]
+        for chunk_fmt, chunk in chunks:
+            if len(pending) >= window:
+                counts += pending.pop(0).result()
+            pending.append(pool.submit(count_chunk, chunk_fmt, chunk))
+        for future in pending:
+            counts += future.result()
+    return counts
+
+
+def fit_spline_points(raw_counts):
+    """Knots mapping each observed raw score to the IQ of its mid-rank percentile."""
+    total = raw_counts.sum()
+    observed = np.flatnonzero(raw_counts)
+    percentile = (np.cumsum(raw_counts) - raw_counts / 2)[observed] / total
+    normal = NormalDist()
+    z = np.array([normal.inv_cdf(p) for p in percentile])
+    iq = np.rint(100 + 15 * z)
+    return [(int(s), int(v)) for s, v in zip(observed, iq)]
+
+
+def fit_profiles(counts, min_count=MIN_PROFILE):
+    """Expected series scores per raw score: the mean profile rounded to sum to the raw score."""
+    pooled = counts.sum(axis=0)
+    sessions = pooled[:, 0, :].sum(axis=1)
+    means = (pooled * np.arange(SERIES_BINS)).sum(axis=2) / np.maximum(sessions, 1)[:, None]
+    rounded = np.floor(means)
+    # Largest remainders get the points lost to rounding down
+    missing = np.arange(SCORE_BINS) - rounded.sum(axis=1)
+    rank = np.argsort(np.argsort(rounded - means, axis=1, kind='stable'), axis=1)
+    rounded += rank < missing[:, None]
+    rounded = np.clip(rounded, 0, calculations.SERIES_SIZE).astype(np.int64)
+    return {int(s): rounded[s].tolist() for s in np.flatnonzero(sessions >= min_count)}
+
+
+def fit_age_percents(raw_counts, base_iq, reference, current, min_count=MIN_AGE_GROUP):
+    """Scale each age group so that its mean IQ is 100, like the reference group's base IQ."""
+    totals = raw_counts.sum(axis=1)
+    mean_iq = raw_counts @ base_iq / np.maximum(totals, 1)
+    # base_iq is fitted to the reference group, so it gets 100
+    fitted = np.round(100 * mean_iq / mean_iq[reference], 1)
+    return {g: float(fitted[g]) if totals[g] >= min_count else float(current[g])
+            for g in range(AGE_GROUPS)}
+
+
+def fit_norms(counts, reference=0):
+    raw_counts = counts[:, :, 0, :].sum(axis=2)
+    if raw_counts[reference].sum() < MIN_REFERENCE:
+        raise ValueError(f"The reference age group has {raw_counts[reference].sum()} sessions, "
+                         f"at least {MIN_REFERENCE} are needed")
+    current = calculations.ScoringTables()
+    spline_points = fit_spline_points(raw_counts[reference])
+    base_iq = np.array(calculations.ScoringTables(spline_points).base_iq)
+
+    normative = dict(current.normative)
+    normative.update(fit_profiles(counts))
+    return {
+        'spline_points': spline_points,
+        'normative': normative,
+        'age_percents': fit_age_percents(raw_counts, base_iq, reference, current.age_percents),
+    }
+
+
+def norms_document(norms, counts, reference=0, name=None):
+    body = {
+        'spline_points': [list(p) for p in norms['spline_points']],
+        'normative_distribution': {str(k): norms['normative'][k] for k in sorted(norms['normative'])},
+        'age_percents': {str(k): norms['age_percents'][k] for k in sorted(norms['age_percents'])},
+    }
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return {
+        'format': calculations.NORMS_FORMAT,
+        'version': calculations.NORMS_VERSION,
+        'id': f'{name}-{digest}' if name else digest,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'reference_age_group': reference,
+        'sessions': counts[:, :, 0, :].sum(axis=2).sum(axis=1).tolist(),
+        **body,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-norms',
+        description="Fit local norms from an archive of sessions and write a norm file.")
+    parser.add_argument('inputs', nargs='*',
+                        help='JSONL or CSV answer sheets with an age_group field')
+    parser.add_argument('--db', action='append', default=[],
+                        help='session database to read; repeatable')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'],
+                        help='input format (default: by file extension, else jsonl)')
+    parser.add_argument('-o', '--output', required=True, help='norm file to write')
+    parser.add_argument('--name', help='label prefixed to the norm id')
+    parser.add_argument('--reference', type=int, default=0, choices=range(AGE_GROUPS),
+                        help='age group whose distribution defines IQ 100 (default: 0)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    return parser
+
+
+def main(argv):
+    parser = build_parser()
+    args = parser.parse_args(argv[1:])
+    if not args.inputs and not args.db:
+        parser.error('give answer sheet files or --db')
+    log_to_stderr()
+
+    started = time.monotonic()
+    try:
+        counts = accumulate(args.db, args.inputs, args.format, max(1, args.jobs),
+                            max(1, args.chunk_size))
+        norms = fit_norms(counts, args.reference)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        log.error(f"Could not fit norms: {e}")
+        return 1
+
+    document = norms_document(norms, counts, args.reference, args.name)
+    tmp = f'{args.output}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=1)
+        f.write('\n')
+    os.replace(tmp, args.output)
+    log.info(f"Wrote norms {document['id']} from {sum(document['sessions'])} sessions "
+             f"in {time.monotonic() - started:.1f}s to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,110 @@
+import time
+
+from gi.repository import GLib
+
+import test
+from logger import get_logger
+
+log = get_logger('prefetch')
+
+THEMES = ('dark', 'light')
+# A question behind the candidate counts as this many questions ahead
+BACKWARD_WEIGHT = 3
+# Main-loop time one idle pass may spend dispatching decodes
+SLICE_BUDGET = 0.003
+MAX_IN_FLIGHT = test.DECODE_WORKERS * 2
+
+
+class PrefetchScheduler:
+    """Feeds question image decodes to the worker pool, nearest first.
+
+    Every candidate window focuses its own question through `owner`. Work
+    is ordered by distance from the nearest focused question, favouring
+    the questions ahead of it, with the other theme after every image of
+    the current one. Each low-priority idle pass dispatches for at most
+    SLICE_BUDGET seconds and at most MAX_IN_FLIGHT decodes are queued;
+    finished decodes wake the scheduler again. Moving the focus or
+    switching theme re-sorts the queue and cancels queued decodes that
+    are no longer near the front.
+
+    Only the front of the queue that fits the texture cache budget is
+    prefetched. On every refocus that window is touched far to near, so
+    the cache's LRU evicts the questions outside it (behind the candidate
+    or far ahead) first, and the window slides on as the candidate moves.
+    """
+
+    def __init__(self, total=test.TOTAL_QUESTIONS):
+        self.total = total
+        self.positions = {}
+        self.theme = None
+        self._order = []
+        self._next = 0
+        self._source_id = None
+        self._stopped = False
+
+    def _cost(self, q):
+        return min(q - current if q >= current else (current - q) * BACKWARD_WEIGHT
+                   for current in self.positions.values())
+
+    def _build_queue(self):
+        order = sorted(range(1, self.total + 1), key=self._cost)
+        themes = [self.theme] + [t for t in THEMES if t != self.theme]
+        return [(q, theme) for theme in themes for q in order]
+
+    def _window(self):
+        # Every window's own question has distance 0, so pins are inside it
+        capacity = test._texture_cache.capacity()
+        return len(self._order) if capacity is None else capacity
+
+    def focus(self, current, theme, owner=None):
+        if (self.positions.get(owner), self.theme) == (current, theme) and self._order:
+            return
+        self.positions[owner] = current
+        self.theme = theme
+        self._refocus()
+
+    def release(self, owner=None):
+        """Forget the position of a closed window."""
+        if self.positions.pop(owner, None) is not None and self.positions and not self._stopped:
+            self._refocus()
+
+    def _refocus(self):
+        self._stopped = False
+        self._order = self._build_queue()
+        self._next = 0
+        test._texture_cache.touch(reversed(self._order[:self._window()]))
+        test.cancel_decodes(keep=self._order[:MAX_IN_FLIGHT])
+        self._schedule()
+
+    def stop(self):
+        self._stopped = True
+        self._order = []
+        self._next = 0
+        if self._source_id:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+    def _schedule(self):
+        if self._source_id is None and not self._stopped:
+            self._source_id = GLib.idle_add(self._run, priority=GLib.PRIORITY_LOW)
+
+    def _on_decoded(self, texture):
+        self._schedule()
+
+    def _run(self):
+        deadline = time.monotonic() + SLICE_BUDGET
+        while self._next < len(self._order):
+            if test.pending_decodes() >= MAX_IN_FLIGHT:
+                break
+            if self._next >= self._window():
+                # Resumes from the new position on the next focus
+                log.debug(f"Prefetch window of {self._next} images is full")
+                break
+            key = self._order[self._next]
+            self._next += 1
+            if not test.is_cached_or_pending(key):
+                test.request_texture(*key, callback=self._on_decoded)
+            if time.monotonic() >= deadline:
+                return True
+        self._source_id = None
+        return False
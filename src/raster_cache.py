@@ -0,0 +1,105 @@
+import glob
+import hashlib
+import os
+import struct
+
+import gi
+
+gi.require_version('GdkPixbuf', '2.0')
+
+from gi.repository import Gdk, GdkPixbuf, Gio, GLib
+
+from logger import get_logger
+
+log = get_logger('raster_cache')
+
+MAGIC = b'ORPMRAS1'
+# magic, width, height, stride, Gdk.MemoryFormat; pixels start at HEADER_SIZE
+HEADER = struct.Struct('<8sIIII')
+HEADER_SIZE = 64
+
+
+def get_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'openrpm', 'textures')
+
+
+def resource_checksum(data):
+    return hashlib.sha256(data.get_data()).hexdigest()[:16]
+
+
+def cache_path(name, size, checksum):
+    return os.path.join(get_cache_dir(), f'{name}-{size}-{checksum}.rgba')
+
+
+def _map_texture(path):
+    """Texture backed by a shared read-only mapping of a cached raster."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("truncated raster")
+    magic, width, height, stride, fmt = HEADER.unpack(header)
+
+    contents = GLib.MappedFile.new(path, False).get_bytes()
+    if magic != MAGIC or contents.get_size() != HEADER_SIZE + stride * height:
+        raise ValueError("corrupt raster")
+    pixels = GLib.Bytes.new_from_bytes(contents, HEADER_SIZE, stride * height)
+    return Gdk.MemoryTexture.new(width, height, Gdk.MemoryFormat(fmt), pixels, stride)
+
+
+def rasterize(data, size):
+    stream = Gio.MemoryInputStream.new_from_bytes(data)
+    return GdkPixbuf.Pixbuf.new_from_stream_at_scale(stream, size, size, True, None)
+
+
+def _write_raster(path, pixbuf):
+    fmt = Gdk.MemoryFormat.R8G8B8A8 if pixbuf.get_has_alpha() else Gdk.MemoryFormat.R8G8B8
+    width, height, stride = pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride()
+    # The last row of a pixbuf may be shorter than the rowstride
+    pixels = pixbuf.read_pixel_bytes().get_data().ljust(stride * height, b'\0')
+    header = HEADER.pack(MAGIC, width, height, stride, int(fmt)).ljust(HEADER_SIZE, b'\0')
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(pixels)
+    os.replace(tmp, path)
+
+
+def _prune_stale(name, size, keep):
+    for path in glob.glob(os.path.join(get_cache_dir(), f'{name}-{size}-*.rgba')):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def get_texture(name, data, size):
+    """Texture for resource `data` rasterized at `size` pixels, via the disk cache.
+
+    Entries are keyed by name, size and a checksum of the resource, so a
+    rebuilt gresource misses automatically and replaces its stale entry.
+    Returns None if the image cannot be rasterized.
+    """
+    path = cache_path(name, size, resource_checksum(data))
+    if os.path.exists(path):
+        try:
+            return _map_texture(path)
+        except (OSError, GLib.Error, ValueError) as e:
+            log.debug(f"Discarding cached raster {path}: {e}")
+
+    try:
+        pixbuf = rasterize(data, size)
+    except GLib.Error as e:
+        log.warning(f"Could not rasterize {name}: {e.message}")
+        return None
+
+    try:
+        _write_raster(path, pixbuf)
+        _prune_stale(name, size, path)
+        return _map_texture(path)
+    except (OSError, GLib.Error, ValueError) as e:
+        log.debug(f"Raster cache unavailable for {name}: {e}")
+        return Gdk.Texture.new_for_pixbuf(pixbuf)
@@ -0,0 +1,445 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import cairo
+import gi
+
+gi.require_version('Pango', '1.0')
+gi.require_version('PangoCairo', '1.0')
+
+from gi.repository import GLib, Pango, PangoCairo
+
+import calculations
+import cohorts
+import locales
+import score
+import store
+from logger import get_logger, log_to_stderr
+
+log = get_logger('report')
+
+# Page sizes in points
+PAGE_SIZES = {'a4': (595.28, 841.89), 'letter': (612.0, 792.0)}
+MARGIN = 56
+LABEL_WIDTH = 170
+SECTION_GAP = 22
+ROW_GAP = 7
+DEFAULT_DPI = 150
+DEFAULT_CHUNK_SIZE = 50
+DEFAULT_FONT = 'Sans'
+
+FONTS = {
+    'title': 'Bold 20', 'subtitle': '10', 'heading': 'Bold 13', 'label': '10',
+    'value': '11', 'iq': 'Bold 48', 'diagnosis': 'Bold 14', 'small': '9',
+}
+TEXT_COLOR = (0.13, 0.13, 0.13)
+DIM_COLOR = (0.4, 0.4, 0.4)
+RULE_COLOR = (0.82, 0.82, 0.82)
+# Same thresholds and palette as the deviation labels of the results page
+DEVIATION_COLORS = {'error': (0.75, 0.11, 0.16), 'warning': (0.68, 0.48, 0.01),
+                    'success': (0.15, 0.55, 0.33)}
+
+SECTIONS = ['result.label', 'result.stats', 'result.series_title', 'result.interpretation',
+            'result.analysis', 'result.reliability']
+ROW_TITLES = ['result.diagnosis', 'result.total_score', 'result.time_taken', 'result.age',
+              'result.percentile', 'result.degree', 'result.recommendation', 'result.status']
+COLUMN_TITLES = ['result.series', 'result.correct', 'result.deviation']
+
+# Built once per rendering process by _init_renderer, see render_all
+_renderer = None
+
+
+def _escape(text):
+    return GLib.markup_escape_text(str(text), -1)
+
+
+def _deviation_color(dev):
+    if abs(dev) > 2:
+        return DEVIATION_COLORS['error']
+    if abs(dev) > 1:
+        return DEVIATION_COLORS['warning']
+    return DEVIATION_COLORS['success']
+
+
+def _file_stem(name):
+    return re.sub(r'[^\w.-]+', '_', str(name)).strip('._') or 'report'
+
+
+def _claim_path(output_dir, claims, stem, ext):
+    """Output path for stem that no other report of this run has, with -2, -3... if taken.
+
+    Names are claimed by creating a marker in the run's `claims` directory,
+    which is atomic across the worker processes; reports of earlier runs
+    are overwritten.
+    """
+    for n in itertools.count(1):
+        name = f'{stem}.{ext}' if n == 1 else f'{stem}-{n}.{ext}'
+        try:
+            os.close(os.open(os.path.join(claims, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        if n > 1:
+            log.warning(f"{stem}.{ext} is already written by this run, using {name}")
+        return os.path.join(output_dir, name)
+
+
+class ReportRenderer:
+    """Draws result pages with Pango onto PDF or PNG surfaces, no display needed.
+
+    Messages are markup like in the results page. Layout happens on one
+    unhinted Pango context in points, so a page looks the same at any
+    resolution; the fixed labels are laid out once and reused on every page.
+    """
+
+    def __init__(self, fmt='pdf', page='a4', dpi=DEFAULT_DPI, font=DEFAULT_FONT, cohort_table=None):
+        self.fmt = fmt
+        self.width, self.height = PAGE_SIZES[page]
+        self.dpi = dpi
+        self.cohorts = cohort_table
+
+        self.context = PangoCairo.FontMap.new().create_context()
+        options = cairo.FontOptions()
+        options.set_hint_style(cairo.HINT_STYLE_NONE)
+        options.set_hint_metrics(cairo.HINT_METRICS_OFF)
+        PangoCairo.context_set_font_options(self.context, options)
+        self.fonts = {name: Pango.FontDescription.from_string(f'{font} {spec}')
+                      for name, spec in FONTS.items()}
+
+        text_width = self.width - 2 * MARGIN
+        self.title = locales.get_text('app.title')
+        self.labels = {
+            'app.title': self._layout('title', locales.get_text('app.title')),
+            'app.subtitle': self._layout('subtitle', locales.get_text('app.subtitle'), text_width),
+        }
+        for key in SECTIONS:
+            self.labels[key] = self._layout('heading', locales.get_text(key), text_width)
+        for key in ROW_TITLES:
+            self.labels[key] = self._layout('label', locales.get_text(key), LABEL_WIDTH - 8)
+        for key in COLUMN_TITLES:
+            self.labels[key] = self._layout('label', locales.get_text(key))
+        template = locales.get_text('result.series_template')
+        for s in calculations.SERIES_NAMES:
+            text = template.replace('{s}', s) if '{s}' in template else \
+                f"{locales.get_text('result.series')} {s}"
+            self.labels[f'series.{s}'] = self._layout('value', text)
+        self.age_ranges = locales.get_localized_age_ranges()
+
+    def _layout(self, font, markup, width=None, align=None):
+        layout = Pango.Layout.new(self.context)
+        layout.set_font_description(self.fonts[font])
+        if width is not None:
+            layout.set_width(int(width * Pango.SCALE))
+            layout.set_wrap(Pango.WrapMode.WORD_CHAR)
+        if align is not None:
+            layout.set_alignment(align)
+        layout.set_markup(markup, -1)
+        return layout
+
+    def _show(self, cr, layout, x, y, color=TEXT_COLOR):
+        cr.set_source_rgb(*color)
+        cr.move_to(x, y)
+        PangoCairo.show_layout(cr, layout)
+        return layout.get_size()[1] / Pango.SCALE
+
+    def _rule(self, cr, y):
+        cr.set_source_rgb(*RULE_COLOR)
+        cr.set_line_width(0.6)
+        cr.move_to(MARGIN, y)
+        cr.line_to(self.width - MARGIN, y)
+        cr.stroke()
+
+    def _row(self, cr, y, title_key, markup, color=TEXT_COLOR):
+        value_width = self.width - 2 * MARGIN - LABEL_WIDTH
+        title_height = self._show(cr, self.labels[title_key], MARGIN, y + 1, DIM_COLOR)
+        value_height = self._show(cr, self._layout('value', markup, value_width),
+                                  MARGIN + LABEL_WIDTH, y, color)
+        y += max(title_height, value_height) + ROW_GAP
+        self._rule(cr, y - ROW_GAP / 2)
+        return y
+
+    def _section(self, cr, y, key):
+        y += SECTION_GAP
+        return y + self._show(cr, self.labels[key], MARGIN, y) + ROW_GAP
+
+    def _draw_header(self, cr, sheet):
+        y = MARGIN
+        self._show(cr, self.labels['app.title'], MARGIN, y)
+        details = [_escape(sheet['id'])] if sheet.get('id') not in (None, '') else []
+        if sheet.get('created_at'):
+            details.append(time.strftime('%Y-%m-%d %H:%M', time.localtime(sheet['created_at'])))
+        if details:
+            meta = self._layout('small', '\n'.join(details), self.width / 2 - MARGIN,
+                                Pango.Alignment.RIGHT)
+            self._show(cr, meta, self.width / 2, y + 4, DIM_COLOR)
+        y += self.labels['app.title'].get_size()[1] / Pango.SCALE + 2
+        y += self._show(cr, self.labels['app.subtitle'], MARGIN, y, DIM_COLOR) + 10
+        self._rule(cr, y)
+        return y
+
+    def _draw_result(self, cr, y, results):
+        y = self._section(cr, y, 'result.label')
+        iq = self._layout('iq', _escape(results['iq']))
+        iq_width, iq_height = (v / Pango.SCALE for v in iq.get_size())
+        self._show(cr, iq, MARGIN, y)
+        x = MARGIN + max(iq_width + 24, LABEL_WIDTH)
+        label_height = self.labels['result.diagnosis'].get_size()[1] / Pango.SCALE
+        diagnosis = self._layout('diagnosis', locales.get_text(f"diag.{results['diagnosis_key']}"),
+                                 self.width - MARGIN - x)
+        top = y + (iq_height - label_height - diagnosis.get_size()[1] / Pango.SCALE) / 2
+        self._show(cr, self.labels['result.diagnosis'], x, top, DIM_COLOR)
+        self._show(cr, diagnosis, x, top + label_height)
+        return y + iq_height
+
+    def _draw_stats(self, cr, y, results, sheet):
+        y = self._section(cr, y, 'result.stats')
+        y = self._row(cr, y, 'result.total_score', f"{results['raw_score']} / {results['max_score']}")
+        t = sheet.get('time_taken')
+        if t is not None:
+            y = self._row(cr, y, 'result.time_taken', f"{t // 60}:{t % 60:02d}")
+        group = sheet.get('age_group')
+        if group is not None and 0 <= group < len(self.age_ranges):
+            y = self._row(cr, y, 'result.age', self.age_ranges[group])
+            # Only against an age group with enough sessions, as on screen
+            if self.cohorts is not None and self.cohorts.total(group) >= cohorts.MIN_COHORT:
+                p = self.cohorts.percentile(group, results['raw_score'])
+                y = self._row(cr, y, 'result.percentile', f"{p:.0f}")
+        return y
+
+    def _draw_series(self, cr, y, results):
+        y = self._section(cr, y, 'result.series_title')
+        columns = [MARGIN, MARGIN + LABEL_WIDTH, MARGIN + LABEL_WIDTH + 110]
+        height = 0
+        for x, key in zip(columns, COLUMN_TITLES):
+            height = max(height, self._show(cr, self.labels[key], x, y, DIM_COLOR))
+        y += height + ROW_GAP
+        self._rule(cr, y - ROW_GAP / 2)
+        for d in results['series_details']:
+            dev = d['deviation']
+            height = self._show(cr, self.labels[f"series.{d['series']}"], columns[0], y)
+            self._show(cr, self._layout('value', f"{d['score']} / {calculations.SERIES_SIZE}"),
+                       columns[1], y)
+            self._show(cr, self._layout('value', f"+{dev}" if dev > 0 else str(dev)),
+                       columns[2], y, _deviation_color(dev))
+            y += height + ROW_GAP
+            self._rule(cr, y - ROW_GAP / 2)
+        return y
+
+    def _draw(self, cr, results, sheet):
+        y = self._draw_header(cr, sheet)
+        y = self._draw_result(cr, y, results)
+        y = self._draw_stats(cr, y, results, sheet)
+        y = self._draw_series(cr, y, results)
+
+        y = self._section(cr, y, 'result.interpretation')
+        degree = calculations.get_degree_key(results['iq'])
+        y = self._row(cr, y, 'result.degree', locales.get_text(f'degree.{degree}'))
+        y = self._section(cr, y, 'result.analysis')
+        y = self._row(cr, y, 'result.recommendation',
+                      locales.get_text(f"rec.{results.get('recommendation_key', '90')}"))
+        y = self._section(cr, y, 'result.reliability')
+        reliability = results.get('reliability_status') or 'good'
+        self._row(cr, y, 'result.status', _escape(locales.get_text(f'reliability.{reliability}')))
+
+    def render(self, path, results, sheet):
+        """Write the report page of one scored session to path."""
+        tmp = f'{path}.tmp'
+        if self.fmt == 'pdf':
+            surface = cairo.PDFSurface(tmp, self.width, self.height)
+            surface.set_metadata(cairo.PDF_METADATA_TITLE, self.title)
+            surface.set_metadata(cairo.PDF_METADATA_CREATOR, 'Open RPM')
+            self._draw(cairo.Context(surface), results, sheet)
+            surface.finish()
+        else:
+            scale = self.dpi / 72
+            surface = cairo.ImageSurface(cairo.FORMAT_RGB24, round(self.width * scale),
+                                         round(self.height * scale))
+            cr = cairo.Context(surface)
+            cr.set_source_rgb(1, 1, 1)
+            cr.paint()
+            cr.scale(scale, scale)
+            self._draw(cr, results, sheet)
+            surface.write_to_png(tmp)
+        os.replace(tmp, path)
+
+
+def _sheet(kind, label, item):
+    if kind == 'db':
+        return {
+            'id': item['session_id'], 'user_answers': item['user_answers'], 'answer_key': None,
+            'age_group': item['age_group'], 'age_percent': item['age_percent'],
+            'time_taken': item['time_taken'], 'created_at': item['created_at'],
+        }
+    sheet = score.parse_jsonl(item) if kind == 'jsonl' else score.parse_csv(item)
+    if sheet['id'] in (None, ''):
+        sheet['id'] = os.path.basename(label)
+    return sheet
+
+
+def _init_renderer(options):
+    global _renderer
+    _renderer = ReportRenderer(**options)
+
+
+def render_chunk(kind, chunk, output_dir, claims):
+    """Score and render a chunk of sessions; returns (written, skipped)."""
+    default_key = calculations.decode_answers()
+    written = 0
+    for label, item in chunk:
+        try:
+            sheet = _sheet(kind, label, item)
+            results = calculations.calculate_raven_results(
+                user_answers=sheet['user_answers'],
+                answer_key=sheet['answer_key'] or default_key,
+                age_percent=sheet['age_percent'],
+            )
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            log.warning(f"Skipping record {label}: {e}")
+            continue
+        path = _file_stem(sheet['id'])
+        try:
+            path = _claim_path(output_dir, claims, path, _renderer.fmt)
+            _renderer.render(path, results, sheet)
+        except (OSError, cairo.Error) as e:
+            log.error(f"Could not write {path}: {e}")
+            continue
+        written += 1
+    return written, len(chunk) - written
+
+
+def read_sessions(databases, since=None, until=None):
+    for path in databases:
+        for session in store.iter_sessions(path, since, until):
+            yield 'db', (f"{path}:{session['id']}", session)
+
+
+def render_all(records, output_dir, options, jobs=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Render every record; options are the ReportRenderer arguments."""
+    claims = tempfile.mkdtemp(prefix='.claims-', dir=output_dir)
+    try:
+        return _render_chunks(score.iter_chunks(records, chunk_size), output_dir, claims,
+                              options, jobs)
+    finally:
+        shutil.rmtree(claims, ignore_errors=True)
+
+
+def _render_chunks(chunks, output_dir, claims, options, jobs):
+    written = skipped = 0
+    if jobs <= 1:
+        _init_renderer(options)
+        for kind, chunk in chunks:
+            w, s = render_chunk(kind, chunk, output_dir, claims)
+            written, skipped = written + w, skipped + s
+        return written, skipped
+
+    # Each worker builds its own renderer. Creating a Pango font map starts
+    # fontconfig setup on a background thread, and a child forked while it
+    # runs can inherit its locks held, so this process never touches Pango
+    # or cairo once workers may be forked from it.
+    # Modules are served from the GResource import hook, so workers must be
+    # forked from this process rather than re-importing by name.
+    context = multiprocessing.get_context('fork')
+    window = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_init_renderer, initargs=(options,)) as pool:
+        pending = []
+        for kind, chunk in chunks:
+            pending.append(pool.submit(render_chunk, kind, chunk, output_dir, claims))
+            if len(pending) >= window:
+                w, s = pending.pop(0).result()
+                written, skipped = written + w, skipped + s
+        for future in pending:
+            w, s = future.result()
+            written, skipped = written + w, skipped + s
+    return written, skipped
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an ISO date or time, got {value!r}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-report',
+        description="Render a printable result report per session, without a display.")
+    parser.add_argument('inputs', nargs='*',
+                        help="JSONL or CSV answer sheets as read by openrpm-score, '-' for stdin")
+    parser.add_argument('--db', action='append', default=[],
+                        help='session database to read; repeatable')
+    parser.add_argument('--since', type=_timestamp, metavar='DATE',
+                        help='only database sessions finished at or after this ISO date/time')
+    parser.add_argument('--until', type=_timestamp, metavar='DATE',
+                        help='only database sessions finished before this ISO date/time')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'],
+                        help='input format (default: by file extension, else jsonl)')
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help='directory for the reports, one file per session id')
+    parser.add_argument('-t', '--output-format', choices=['pdf', 'png'], default='pdf')
+    parser.add_argument('--page', choices=sorted(PAGE_SIZES), default='a4')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help='PNG resolution')
+    parser.add_argument('--font', default=DEFAULT_FONT, help='font family (default: Sans)')
+    parser.add_argument('--language', help='report language, e.g. ru (default: from the environment)')
+    parser.add_argument('--cohorts', metavar='PATH',
+                        help='cohort table for the percentile in the age group (default: none)')
+    parser.add_argument('--norms', metavar='PATH',
+                        help="norm file from openrpm-norms (default: the manual's norms)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    return parser
+
+
+def main(argv):
+    parser = build_parser()
+    args = parser.parse_args(argv[1:])
+    if not args.inputs and not args.db:
+        parser.error('give answer sheet files or --db')
+    missing = [path for path in args.db if not os.path.exists(path)]
+    if missing:
+        parser.error(f"no such session database: {missing[0]}")
+    log_to_stderr()
+
+    if args.norms:
+        try:
+            calculations.use_norms(calculations.load_norms(args.norms))
+        except (OSError, ValueError) as e:
+            log.error(f"Could not load norms: {e}")
+            return 1
+    if args.language:
+        locales.set_language(args.language)
+    table = cohorts.CohortTable.load(args.cohorts) if args.cohorts else None
+
+    started = time.monotonic()
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+        options = {'fmt': args.output_format, 'page': args.page, 'dpi': args.dpi,
+                   'font': args.font, 'cohort_table': table}
+        records = read_sessions(args.db, args.since, args.until)
+        if args.inputs:
+            records = itertools.chain(records, score.read_records(args.inputs, args.format))
+        written, skipped = render_all(records, args.output_dir, options,
+                                      max(1, args.jobs), max(1, args.chunk_size))
+    except (OSError, sqlite3.Error, BrokenProcessPool) as e:
+        log.error(f"Rendering failed: {e}")
+        return 1
+
+    log.info(f"Wrote {written} report(s) to {args.output_dir} "
+             f"in {time.monotonic() - started:.1f}s, skipped {skipped}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
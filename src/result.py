@@ -1,7 +1,9 @@
 from gi.repository import Gtk, Adw, GLib
 
 import calculations
+import cohorts
 import locales
+import tracing
 from logger import get_logger
 
 log = get_logger('result')
@@ -9,11 +11,25 @@ log = get_logger('result')
 SERIES_NAMES = 'ABCDE'
 
 
+def _escape(text):
+    return GLib.markup_escape_text(text, -1)
+
+
+def _series_title(s):
+    def transform(tmpl):
+        return tmpl.replace('{s}', s) if '{s}' in tmpl else f"{locales.get_text('result.series')} {s}"
+    return transform
+
+
+_SERIES_TITLES = {s: _series_title(s) for s in SERIES_NAMES}
+
+
 class ResultsScreen:
-    def __init__(self, builder, test_results, on_reset_callback=None):
+    def __init__(self, builder, test_results, on_reset_callback=None, cohorts=None):
         self.builder = builder
         self.test_results = test_results
         self.on_reset_callback = on_reset_callback
+        self.cohorts = cohorts
         self.results = None
 
         self._cache_widgets()
@@ -28,6 +44,8 @@ class ResultsScreen:
         self.total_score_value = b.get_object('total_score_value')
         self.time_taken_value = b.get_object('time_taken_value')
         self.age_value = b.get_object('age_value')
+        self.percentile_row = b.get_object('percentile_row')
+        self.percentile_value = b.get_object('percentile_value')
         self.reliability_row = b.get_object('reliability_row')
         self.interpretation_row = b.get_object('interpretation_row')
         self.analysis_row = b.get_object('analysis_row')
@@ -61,31 +79,21 @@ class ResultsScreen:
             'analysis': 'result.analysis', 'reliability': 'result.reliability',
         }
         for name, key in titles.items():
-            g = self._groups.get(name)
-            if g:
-                g.set_title(locales.get_text(key))
-
-        if self._headers.get('series_header_row'):
-            self._headers['series_header_row'].set_title(locales.get_text('result.series'))
-        if self._headers.get('series_header_correct'):
-            self._headers['series_header_correct'].set_label(locales.get_text('result.correct'))
-        if self._headers.get('series_header_deviation'):
-            self._headers['series_header_deviation'].set_label(locales.get_text('result.deviation'))
-
-        for row in ['total_score_row', 'time_taken_row', 'age_row']:
-            obj = self.builder.get_object(row)
-            if obj:
-                obj.set_title(locales.get_text(f'result.{row.replace("_row", "")}'))
-
-        tmpl = locales.get_text('result.series_template')
+            locales.bind(self._groups.get(name), key, 'set_title')
+
+        locales.bind(self._headers.get('series_header_row'), 'result.series', 'set_title')
+        locales.bind(self._headers.get('series_header_correct'), 'result.correct')
+        locales.bind(self._headers.get('series_header_deviation'), 'result.deviation')
+
+        for row in ['total_score_row', 'time_taken_row', 'age_row', 'percentile_row']:
+            locales.bind(self.builder.get_object(row), f'result.{row.replace("_row", "")}', 'set_title')
+
         for s, w in self.series_widgets.items():
-            if w.get('row'):
-                title = tmpl.replace('{s}', s) if '{s}' in tmpl else f"{locales.get_text('result.series')} {s}"
-                w['row'].set_title(title)
+            locales.bind(w.get('row'), 'result.series_template', 'set_title', _SERIES_TITLES[s])
 
-        if self.return_button:
-            self.return_button.set_label(locales.get_text('result.return'))
+        locales.bind(self.return_button, 'result.return')
 
+    @tracing.traced()
     def _render(self):
         self.results = calculations.calculate_raven_results(
             user_answers=self.test_results.get('user_answers', {}),
@@ -96,9 +104,8 @@ class ResultsScreen:
         if self.final_iq_label:
             self.final_iq_label.set_label(str(self.results['iq']))
 
-        if self.diagnosis_row:
-            self.diagnosis_row.set_title(locales.get_text('result.diagnosis'))
-            self.diagnosis_row.set_subtitle(locales.get_text(f"diag.{self.results['diagnosis_key']}"))
+        locales.bind(self.diagnosis_row, 'result.diagnosis', 'set_title')
+        locales.bind(self.diagnosis_row, f"diag.{self.results['diagnosis_key']}", 'set_subtitle')
 
         self._render_stats()
         self._render_series()
@@ -119,8 +126,21 @@ class ResultsScreen:
             if idx in locales.AGE_PERCENTS:
                 r = locales.AGE_RANGES[idx]
                 key = f"age.{r.replace('-', '_').replace('+', '_plus')}"
-                txt = locales.get_text(key)
-                self.age_value.set_label(txt if txt != key else r)
+                locales.bind(self.age_value, key, transform=lambda txt: txt if txt != key else r)
+
+        self._render_percentile()
+
+    def _render_percentile(self):
+        if not (self.percentile_row and self.percentile_value):
+            return
+        idx = self.test_results.get('selected_age_index', 0)
+        table = self.cohorts
+        # Hidden until the age group has enough stored sessions to compare with
+        shown = table is not None and table.total(idx) >= cohorts.MIN_COHORT
+        self.percentile_row.set_visible(shown)
+        if shown:
+            p = table.percentile(idx, self.results['raw_score'])
+            self.percentile_value.set_label(f"{p:.0f}")
 
     def _render_series(self):
         for d in self.results.get('series_details', []):
@@ -146,9 +166,8 @@ class ResultsScreen:
 
         if self.reliability_row:
             rel_key = self.results.get('reliability_status') or 'good'
-            self.reliability_row.set_title(locales.get_text('result.status'))
-            self.reliability_row.set_subtitle(
-                GLib.markup_escape_text(locales.get_text(f"reliability.{rel_key}"), -1))
+            locales.bind(self.reliability_row, 'result.status', 'set_title')
+            locales.bind(self.reliability_row, f"reliability.{rel_key}", 'set_subtitle', _escape)
             for cls in ('error', 'warning', 'success'):
                 self.reliability_row.remove_css_class(cls)
 
@@ -156,16 +175,15 @@ class ResultsScreen:
         if not self.interpretation_row:
             return
         iq = self.results['iq']
-        self.interpretation_row.set_title(locales.get_text('result.degree'))
-        self.interpretation_row.set_subtitle(
-            locales.get_text(f"degree.{calculations.get_degree_key(iq)}"))
+        locales.bind(self.interpretation_row, 'result.degree', 'set_title')
+        locales.bind(self.interpretation_row, f"degree.{calculations.get_degree_key(iq)}", 'set_subtitle')
 
     def _render_analysis(self):
         if not self.analysis_row:
             return
         rec_key = f"rec.{self.results.get('recommendation_key', '90')}"
-        self.analysis_row.set_title(locales.get_text('result.recommendation'))
-        self.analysis_row.set_subtitle(locales.get_text(rec_key))
+        locales.bind(self.analysis_row, 'result.recommendation', 'set_title')
+        locales.bind(self.analysis_row, rec_key, 'set_subtitle')
 
     def _return(self, button):
         content_bin = self.builder.get_object('content_bin')
@@ -176,10 +194,10 @@ class ResultsScreen:
             self.on_reset_callback()
 
 
-def show_results(builder, test_results, on_reset_callback=None):
+def show_results(builder, test_results, on_reset_callback=None, cohorts=None):
     content_bin = builder.get_object('content_bin')
     result_page = builder.get_object('result_page')
     if content_bin and result_page:
         content_bin.set_child(result_page)
-        return ResultsScreen(builder, test_results, on_reset_callback)
+        return ResultsScreen(builder, test_results, on_reset_callback, cohorts)
     return None
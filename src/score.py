@@ -0,0 +1,267 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import calculations
+from logger import get_logger, log_to_stderr
+
+log = get_logger('score')
+
+DEFAULT_CHUNK_SIZE = 500
+
+QUESTION_FIELDS = [f'q{q}' for q in range(1, calculations.TOTAL_QUESTIONS + 1)]
+OUTPUT_FIELDS = (
+    ['id', 'raw_score', 'max_score', 'iq', 'diagnosis_key', 'degree_key',
+     'recommendation_key', 'reliability_status', 'age_used']
+    + [f'series_{s.lower()}' for s in calculations.SERIES_NAMES]
+)
+
+_answer_key = None
+
+
+def _get_answer_key():
+    global _answer_key
+    if _answer_key is None:
+        _answer_key = calculations.decode_answers()
+    return _answer_key
+
+
+def _int_or_none(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _age_group(record):
+    group = _int_or_none(record.get('age_group'))
+    if group is None:
+        group = _int_or_none(record.get('selected_age_index'))
+    return group
+
+
+def _age_percent(record):
+    if record.get('age_percent') not in (None, ''):
+        return float(record['age_percent'])
+    return calculations.get_age_percent(_age_group(record) or 0)
+
+
+def _user_answers(raw):
+    if isinstance(raw, list):
+        return {q: a for q, a in enumerate(raw, 1) if a}
+    return {int(q): a for q, a in raw.items() if a}
+
+
+def parse_jsonl(line):
+    record = json.loads(line)
+    return {
+        'id': record.get('id'),
+        'user_answers': _user_answers(record.get('user_answers') or {}),
+        'answer_key': record.get('answer_key'),
+        'age_group': _age_group(record),
+        'age_percent': _age_percent(record),
+        'time_taken': _int_or_none(record.get('time_taken')),
+    }
+
+
+def parse_csv(row):
+    answers = {}
+    for q, field in enumerate(QUESTION_FIELDS, 1):
+        value = _int_or_none(row.get(field))
+        if value:
+            answers[q] = value
+    return {
+        'id': row.get('id'),
+        'user_answers': answers,
+        'answer_key': None,
+        'age_group': _age_group(row),
+        'age_percent': _age_percent(row),
+        'time_taken': _int_or_none(row.get('time_taken')),
+    }
+
+
+def score_session(session):
+    results = calculations.calculate_raven_results(
+        user_answers=session['user_answers'],
+        answer_key=session['answer_key'] or _get_answer_key(),
+        age_percent=session['age_percent'],
+    )
+    row = {field: results.get(field) for field in OUTPUT_FIELDS}
+    row['id'] = session['id']
+    row['degree_key'] = calculations.get_degree_key(results['iq'])
+    for d in results['series_details']:
+        row[f"series_{d['series'].lower()}"] = d['score']
+    return row
+
+
+def score_chunk(fmt, chunk):
+    parse = parse_jsonl if fmt == 'jsonl' else parse_csv
+    rows = []
+    for lineno, item in chunk:
+        try:
+            rows.append(score_session(parse(item)))
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            log.warning(f"Skipping record {lineno}: {e}")
+    return rows
+
+
+def _open_input(path):
+    if path == '-':
+        return sys.stdin
+    return open(path, newline='', encoding='utf-8')
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def read_records(paths, fmt=None):
+    """Yield (record number, raw record) pairs from every input in order."""
+    for path in paths:
+        kind = _detect_format(path, fmt)
+        stream = _open_input(path)
+        try:
+            if kind == 'csv':
+                for lineno, row in enumerate(csv.DictReader(stream), 2):
+                    yield kind, (f'{path}:{lineno}', row)
+            else:
+                for lineno, line in enumerate(stream, 1):
+                    if line.strip():
+                        yield kind, (f'{path}:{lineno}', line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def shard_records(records, index, count):
+    for n, record in enumerate(records):
+        if n % count == index:
+            yield record
+
+
+def iter_chunks(records, size):
+    """Group records into same-format chunks without reading ahead further."""
+    chunk, chunk_fmt = [], None
+    for fmt, record in records:
+        if chunk and (fmt != chunk_fmt or len(chunk) >= size):
+            yield chunk_fmt, chunk
+            chunk = []
+        chunk_fmt = fmt
+        chunk.append(record)
+    if chunk:
+        yield chunk_fmt, chunk
+
+
+class ResultWriter:
+    def __init__(self, stream, fmt, header=True):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(stream, fieldnames=OUTPUT_FIELDS, lineterminator='\n')
+            if header:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        if self._csv:
+            self._csv.writerows(rows)
+        else:
+            for row in rows:
+                self.stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def score_stream(chunks, writer, jobs):
+    if jobs <= 1:
+        for fmt, chunk in chunks:
+            writer.write(score_chunk(fmt, chunk))
+        return
+
+    # Modules are served from the GResource import hook, so workers must be
+    # forked from this process rather than re-importing by name.
+    context = multiprocessing.get_context('fork')
+    window = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        pending = []
+        for fmt, chunk in chunks:
+            pending.append(pool.submit(score_chunk, fmt, chunk))
+            if len(pending) >= window:
+                writer.write(pending.pop(0).result())
+        for future in pending:
+            writer.write(future.result())
+
+
+def _parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}")
+    return index, count
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='openrpm-score',
+        description="Score Raven's Progressive Matrices sessions from JSONL or CSV.")
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help="input files, '-' for stdin (default)")
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'],
+                        help='input format (default: by file extension, else jsonl)')
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('-t', '--output-format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--no-header', action='store_true',
+                        help='omit the CSV header, e.g. for shards that will be concatenated')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--norms', metavar='PATH',
+                        help="norm file from openrpm-norms (default: the manual's norms)")
+    parser.add_argument('--shard', type=_parse_shard, default=(0, 1), metavar='INDEX/COUNT',
+                        help='only score every COUNT-th record starting at INDEX')
+    return parser
+
+
+def main(argv):
+    args = build_parser().parse_args(argv[1:])
+    log_to_stderr()
+
+    if args.norms:
+        try:
+            calculations.use_norms(calculations.load_norms(args.norms))
+        except (OSError, ValueError) as e:
+            log.error(f"Could not load norms: {e}")
+            return 1
+
+    records = read_records(args.inputs, args.format)
+    index, count = args.shard
+    if count > 1:
+        records = shard_records(records, index, count)
+    chunks = iter_chunks(records, max(1, args.chunk_size))
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        writer = ResultWriter(out, args.output_format, header=not args.no_header)
+        score_stream(chunks, writer, max(1, args.jobs))
+    except BrokenPipeError:
+        # The reader stopped early (e.g. `| head`); finish quietly like other filters
+        # and keep the interpreter's final flush from failing on the closed pipe
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except OSError as e:
+        log.error(f"Scoring failed: {e}")
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
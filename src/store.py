@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import calculations
+from logger import get_logger
+
+log = get_logger('store')
+
+DB_NAME = 'sessions.db'
+SCHEMA_VERSION = 2
+BATCH_SIZE = 64
+FLUSH_INTERVAL = 0.5
+# Seconds between attempts to store rows a write failed on
+RETRY_INTERVAL = 5
+# Rows still unstored at close are kept in this file next to the database
+UNSAVED_SUFFIX = '.unsaved'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    answer_key_version TEXT NOT NULL,
+    age_group INTEGER NOT NULL,
+    age_percent REAL NOT NULL,
+    time_taken INTEGER NOT NULL,
+    answers TEXT NOT NULL,
+    raw_score INTEGER NOT NULL,
+    iq INTEGER NOT NULL,
+    series_a INTEGER NOT NULL,
+    series_b INTEGER NOT NULL,
+    series_c INTEGER NOT NULL,
+    series_d INTEGER NOT NULL,
+    series_e INTEGER NOT NULL,
+    diagnosis_key TEXT NOT NULL,
+    reliability_status TEXT NOT NULL,
+    recommendation_key TEXT NOT NULL,
+    item_times TEXT,
+    first_answer TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at);
+CREATE INDEX IF NOT EXISTS sessions_age_group ON sessions (age_group, created_at);
+"""
+
+COLUMNS = [
+    'session_id', 'created_at', 'answer_key_version', 'age_group', 'age_percent',
+    'time_taken', 'answers', 'raw_score', 'iq',
+    'series_a', 'series_b', 'series_c', 'series_d', 'series_e',
+    'diagnosis_key', 'reliability_status', 'recommendation_key',
+    'item_times', 'first_answer',
+]
+# Columns added after the first schema; NULL for sessions stored or sent without them
+OPTIONAL_COLUMNS = {'item_times', 'first_answer'}
+
+# Statements upgrading a database to each schema version
+MIGRATIONS = {
+    2: ['ALTER TABLE sessions ADD COLUMN item_times TEXT',
+        'ALTER TABLE sessions ADD COLUMN first_answer TEXT'],
+}
+
+# first_answer_ms entry of a question that was never answered
+NO_ANSWER = 0xFFFFFFFF
+
+INSERT_SQL = (f"INSERT OR IGNORE INTO sessions ({', '.join(COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(COLUMNS))})")
+
+
+def get_data_dir():
+    base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'openrpm')
+
+
+def default_path():
+    return os.path.join(get_data_dir(), DB_NAME)
+
+
+def answer_key_version(answer_key):
+    canonical = json.dumps({str(k): v for k, v in answer_key.items()}, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def encode_answers(user_answers):
+    """Pack answers into a 60-character string, '0' for unanswered."""
+    return ''.join(str(user_answers.get(q) or 0)
+                   for q in range(1, calculations.TOTAL_QUESTIONS + 1))
+
+
+def decode_answers(encoded):
+    return {q: int(a) for q, a in enumerate(encoded, 1) if a != '0'}
+
+
+def encode_times(times):
+    """Pack 60 per-question millisecond counts as comma-separated text, '' for NO_ANSWER."""
+    if times is None:
+        return None
+    return ','.join('' if ms == NO_ANSWER else str(ms) for ms in times)
+
+
+def decode_times(encoded):
+    """Per-question millisecond list, None for a question without a value."""
+    if not encoded:
+        return None
+    return [int(ms) if ms else None for ms in encoded.split(',')]
+
+
+def session_row(test_results, results):
+    series = {d['series']: d['score'] for d in results['series_details']}
+    return (
+        test_results.get('session_id') or uuid.uuid4().hex,
+        test_results.get('finished_at') or time.time(),
+        answer_key_version(test_results.get('answer_key', {})),
+        test_results.get('selected_age_index', 0),
+        test_results.get('age_percent', 100),
+        test_results.get('time_taken', 0),
+        encode_answers(test_results.get('user_answers', {})),
+        results['raw_score'],
+        results['iq'],
+        *(series.get(s, 0) for s in calculations.SERIES_NAMES),
+        results['diagnosis_key'],
+        results['reliability_status'],
+        results['recommendation_key'],
+        encode_times(test_results.get('item_times_ms')),
+        encode_times(test_results.get('first_answer_ms')),
+    )
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version < SCHEMA_VERSION:
+        if version == 0:
+            conn.executescript(SCHEMA)
+        else:
+            _migrate(conn, version)
+        conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        conn.commit()
+    return conn
+
+
+def _migrate(conn, version):
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        for statement in MIGRATIONS.get(target, ()):
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError as e:
+                # Another process upgraded the same database first
+                if 'duplicate column' not in str(e):
+                    raise
+        log.info(f"Upgraded session database to schema version {target}")
+
+
+def connect_readonly(path):
+    # as_uri() percent-encodes '?', '#' and '%' that would end or escape the path
+    return sqlite3.connect(f'{pathlib.Path(path).absolute().as_uri()}?mode=ro', uri=True)
+
+
+def id_ranges(path, parts):
+    """Split a session database into about `parts` (path, start, stop) id ranges of similar size."""
+    conn = connect_readonly(path)
+    try:
+        low, high = conn.execute('SELECT MIN(id), MAX(id) FROM sessions').fetchone()
+    finally:
+        conn.close()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // parts))
+    return [(path, start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+
+class SessionStore:
+    """Results archive whose writes are batched on a background thread.
+
+    `record` only enqueues a row, so the GTK main loop never waits on disk;
+    the writer commits up to BATCH_SIZE rows at a time, at most
+    FLUSH_INTERVAL seconds after the first one arrived. Rows a write fails
+    on stay queued and are retried every RETRY_INTERVAL seconds; any still
+    unstored at close are written to a file next to the database and stored
+    by the next SessionStore opened on it. Given a cohorts.CohortTable, the
+    writer also counts every newly stored session into it and publishes a
+    fresh copy as `cohorts` for the main thread.
+    """
+
+    def __init__(self, path=None, cohorts=None):
+        self.path = path or default_path()
+        self.unsaved_path = f'{self.path}{UNSAVED_SUFFIX}'
+        self.cohorts = cohorts.copy() if cohorts else None
+        self._cohorts = cohorts
+        self._queue = queue.Queue()
+        self._closed = False
+        connect(self.path).close()
+        self._thread = threading.Thread(target=self._run, name='openrpm-store', daemon=True)
+        self._thread.start()
+
+    def record(self, test_results, results):
+        if self._closed:
+            log.warning("Session store is closed, result not saved")
+            return
+        self._queue.put(session_row(test_results, results))
+
+    def close(self):
+        """Stop taking results and wait until every queued one is stored or kept on disk."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self, timeout=None):
+        """Up to BATCH_SIZE queued rows, and False once close() was called."""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return [], True
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if batch[-1] is None:
+            return batch[:-1], False
+        return batch, True
+
+    def _run(self):
+        conn = connect(self.path)
+        self._count_cohorts(conn)
+        unsaved = self._read_unsaved()
+        spilled = bool(unsaved)
+        running = True
+        try:
+            while running:
+                batch, running = self._next_batch(RETRY_INTERVAL if unsaved else None)
+                unsaved += batch
+                if unsaved and self._write(conn, unsaved):
+                    unsaved = []
+                    if spilled:
+                        self._drop_unsaved()
+                        spilled = False
+        finally:
+            if unsaved:
+                self._spill(unsaved)
+            conn.close()
+
+    def _write(self, conn, rows):
+        try:
+            with conn:
+                conn.executemany(INSERT_SQL, rows)
+            log.debug(f"Saved {len(rows)} session(s)")
+        except sqlite3.Error as e:
+            log.error(f"Could not save {len(rows)} session(s), retrying: {e}")
+            return False
+        self._count_cohorts(conn)
+        return True
+
+    def _read_unsaved(self):
+        try:
+            with open(self.unsaved_path, encoding='utf-8') as f:
+                rows = [tuple(json.loads(line).get(column) for column in COLUMNS)
+                        for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            aside = f'{self.unsaved_path}.{int(time.time())}'
+            log.error(f"Could not read unsaved sessions, moving them to {aside}: {e}")
+            os.replace(self.unsaved_path, aside)
+            return []
+        log.info(f"Storing {len(rows)} session(s) left unsaved by the last run")
+        return rows
+
+    def _drop_unsaved(self):
+        # Left in place it is only read again; its rows are ignored as duplicates
+        try:
+            os.remove(self.unsaved_path)
+        except OSError as e:
+            log.warning(f"Could not remove {self.unsaved_path}: {e}")
+
+    def _spill(self, rows):
+        tmp = f'{self.unsaved_path}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(COLUMNS, row)), separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.unsaved_path)
+            log.warning(f"Kept {len(rows)} unsaved session(s) in {self.unsaved_path}")
+        except OSError as e:
+            log.error(f"Lost {len(rows)} session(s), could not write {self.unsaved_path}: {e}")
+
+    def _count_cohorts(self, conn):
+        if self._cohorts is None:
+            return
+        last_id = self._cohorts.last_id
+        try:
+            self._cohorts.catch_up(conn)
+            if self._cohorts.last_id != last_id:
+                self._cohorts.save()
+        except (OSError, sqlite3.Error) as e:
+            log.warning(f"Could not update cohort table: {e}")
+        self.cohorts = self._cohorts.copy()
+
+
+def iter_sessions(path=None, since=None, until=None, age_group=None):
+    """Yield stored sessions as dicts, oldest first, straight off the indexes.
+
+    The database is opened read-only, so a wrong path raises instead of
+    creating an empty store.
+    """
+    conn = connect_readonly(path or default_path())
+    conn.row_factory = sqlite3.Row
+    clauses, params = [], []
+    if age_group is not None:
+        clauses.append('age_group = ?')
+        params.append(age_group)
+    if since is not None:
+        clauses.append('created_at >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('created_at < ?')
+        params.append(until)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    try:
+        for row in conn.execute(f'SELECT * FROM sessions{where} ORDER BY created_at', params):
+            session = dict(row)
+            session['user_answers'] = decode_answers(session.pop('answers'))
+            session['item_times_ms'] = decode_times(session.pop('item_times', None))
+            session['first_answer_ms'] = decode_times(session.pop('first_answer', None))
+            yield session
+    finally:
+        conn.close()
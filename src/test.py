@@ -1,9 +1,15 @@
-import base64
-import json
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from gi.repository import Gtk, Gdk, GLib, Gio, Adw
 
 import locales
 import calculations
+import raster_cache
+import store
+import tracing
 from logger import get_logger
 
 log = get_logger('test')
@@ -11,18 +17,121 @@ log = get_logger('test')
 TOTAL_TIME = 20 * 60
 TOTAL_QUESTIONS = 60
 IMG_EXT = '.svg'
+QUESTION_SIZE = 400
+# Pre-rendered PNG sizes in the data gresource, see data/meson.build
+RASTER_VARIANTS = (400, 600, 800)
+JOURNAL_TIME_INTERVAL = 5
+# Deadline check interval while the progress bar is not being drawn
+TIMER_WAKEUP = 1
+NO_ANSWER = store.NO_ANSWER
+TEXTURE_CACHE_BUDGET = 96 * 1024 * 1024
+DECODE_WORKERS = 2
+# A failed decode is retried on the worker this often, this many ms apart
+DECODE_RETRIES = 2
+DECODE_RETRY_DELAY = 200
+# Option count -> columns of its prebuilt grid in options_stack
+OPTION_LAYOUTS = {6: 3, 8: 4}
+
+
+def texture_nbytes(texture):
+    if texture is None:
+        return 0
+    bpp = 4
+    try:
+        if texture.get_format() == Gdk.MemoryFormat.R8G8B8:
+            bpp = 3
+    except AttributeError:
+        pass
+    return texture.get_width() * texture.get_height() * bpp
+
+
+class TextureCache:
+    """LRU of question textures bounded by their decoded size in bytes.
+
+    Pinned keys (the question on screen in each window) are never evicted,
+    even when they alone exceed the budget.
+    """
+
+    def __init__(self, budget=TEXTURE_CACHE_BUDGET):
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pins = {}
+        self._pinned = set()
+        self._largest = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[0]
+
+    def put(self, key, texture):
+        size = texture_nbytes(texture)
+        old = self._entries.pop(key, None)
+        if old:
+            self.nbytes -= old[1]
+        self._entries[key] = (texture, size)
+        self.nbytes += size
+        self._largest = max(self._largest, size)
+        self._evict()
+
+    def pin(self, keys, owner=None):
+        """Replace the keys pinned by `owner`, one owner per candidate window."""
+        if keys:
+            self._pins[owner] = set(keys)
+        else:
+            self._pins.pop(owner, None)
+        self._pinned = set().union(*self._pins.values())
 
-_texture_cache = {}
+    def is_pinned(self, key):
+        return key in self._pinned
 
-ANSWERS_B64 = "eyIxIjo0LCIyIjo1LCIzIjoxLCI0IjoyLCI1Ijo2LCI2IjozLCI3Ijo2LCI4IjoyLCI5IjoxLCIxMCI6MywiMTEiOjQsIjEyIjo1LCIxMyI6MiwiMTQiOjYsIjE1IjoxLCIxNiI6MiwiMTciOjEsIjE4IjozLCIxOSI6NSwiMjAiOjYsIjIxIjo0LCIyMiI6MywiMjMiOjQsIjI0Ijo1LCIyNSI6OCwiMjYiOjIsIjI3IjozLCIyOCI6OCwiMjkiOjcsIjMwIjo0LCIzMSI6NSwiMzIiOjEsIjMzIjo3LCIzNCI6NiwiMzUiOjEsIjM2IjoyLCIzNyI6MywiMzgiOjQsIjM5IjozLCI0MCI6NywiNDEiOjgsIjQyIjo2LCI0MyI6NSwiNDQiOjQsIjQ1IjoxLCI0NiI6MiwiNDciOjUsIjQ4Ijo2LCI0OSI6NywiNTAiOjYsIjUxIjo4LCI1MiI6MiwiNTMiOjEsIjU0Ijo1LCI1NSI6MSwiNTYiOjYsIjU3IjozLCI1OCI6MiwiNTkiOjQsIjYwIjo1fQ=="
+    def set_budget(self, budget):
+        self.budget = budget
+        self._evict()
 
+    def capacity(self):
+        """How many textures of the largest size seen fit in the budget, None before the first."""
+        if not self._largest:
+            return None
+        return max(1, self.budget // self._largest)
 
-def decode_answers():
-    try:
-        return json.loads(base64.b64decode(ANSWERS_B64).decode('utf-8'))
-    except Exception as e:
-        log.error(f"Failed to decode answers: {e}")
-        return {}
+    def touch(self, keys):
+        """Mark the cached `keys` as used in order, the last most recently, without counting hits."""
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def _evict(self):
+        if self.nbytes <= self.budget:
+            return
+        for key in list(self._entries):
+            if self.nbytes <= self.budget:
+                break
+            if key in self._pinned:
+                continue
+            self.nbytes -= self._entries.pop(key)[1]
+            self.evictions += 1
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.nbytes, 'budget': self.budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_texture_cache = TextureCache()
 
 
 def get_options_count(series):
@@ -40,49 +149,190 @@ def get_theme_dir():
     return 'dark' if is_dark_mode() else 'light'
 
 
-def load_texture(q, theme=None):
+def get_raster_size():
+    scale = 1
+    display = Gdk.Display.get_default()
+    if display:
+        monitors = display.get_monitors()
+        for i in range(monitors.get_n_items()):
+            monitor = monitors.get_item(i)
+            # Fractional scale needs GTK 4.14
+            get_scale = getattr(monitor, 'get_scale', monitor.get_scale_factor)
+            scale = max(scale, get_scale())
+    return round(QUESTION_SIZE * scale)
+
+
+def get_variant_size(size):
+    """Smallest pre-rendered size that does not need upscaling."""
+    for variant in RASTER_VARIANTS:
+        if variant >= size:
+            return variant
+    return RASTER_VARIANTS[-1]
+
+
+def _lookup_image(q, theme, size):
+    base = f'/site/ikhlasulov/openrpm/images/{theme}/{q}'
+    try:
+        return Gio.resources_lookup_data(f'{base}@{get_variant_size(size)}.png',
+                                         Gio.ResourceLookupFlags.NONE)
+    except GLib.Error:
+        pass
+    return Gio.resources_lookup_data(f'{base}{IMG_EXT}', Gio.ResourceLookupFlags.NONE)
+
+
+@tracing.traced()
+def load_texture(q, theme=None, size=None):
     if theme is None:
         theme = get_theme_dir()
-    path = f'/site/ikhlasulov/openrpm/images/{theme}/{q}{IMG_EXT}'
+    size = size or get_raster_size()
     try:
-        data = Gio.resources_lookup_data(path, Gio.ResourceLookupFlags.NONE)
+        data = _lookup_image(q, theme, size)
         if data:
-            return Gdk.Texture.new_from_bytes(data)
+            texture = raster_cache.get_texture(f'{theme}-{q}', data, size)
+            return texture or Gdk.Texture.new_from_bytes(data)
     except GLib.Error as e:
         log.warning(f"Could not load image {q} for {theme}: {e.message}")
     return None
 
 
+@tracing.traced()
 def get_texture(q, theme=None):
     if theme is None:
         theme = get_theme_dir()
     key = (q, theme)
-    if key not in _texture_cache:
-        _texture_cache[key] = load_texture(q, theme)
-    return _texture_cache.get(key)
+    found, texture = _texture_cache.lookup(key)
+    if not found:
+        texture = load_texture(q, theme)
+        if texture is not None:
+            _texture_cache.put(key, texture)
+    return texture
+
+
+_decode_pool = None
+_pending_decodes = {}
+_decode_futures = {}
+_placeholder = None
+
+
+def get_placeholder():
+    global _placeholder
+    if _placeholder is None:
+        _placeholder = Gdk.Paintable.new_empty(QUESTION_SIZE, QUESTION_SIZE)
+    return _placeholder
+
+
+def pending_decodes():
+    return len(_pending_decodes)
+
+
+def is_cached_or_pending(key):
+    return key in _texture_cache or key in _pending_decodes
+
+
+def cancel_decodes(keep=()):
+    """Drop queued decodes that have not started, except those in `keep` or on screen."""
+    keep = set(keep)
+    for key, future in list(_decode_futures.items()):
+        if key not in keep and not _texture_cache.is_pinned(key) and future.cancel():
+            del _decode_futures[key]
+            del _pending_decodes[key]
+
+
+def request_texture(q, theme=None, callback=None):
+    """Return the cached texture for `q`, or start decoding it off the main loop.
+
+    On a miss this returns None and the image is decoded on a worker
+    thread; `callback(texture)` then runs on the main loop once it is cached.
+    A failed decode is retried on the worker, never on the main loop; if it
+    keeps failing the callback gets None, and as failures are not cached the
+    next request tries again.
+    """
+    if theme is None:
+        theme = get_theme_dir()
+    key = (q, theme)
+    if key in _texture_cache:
+        return _texture_cache.lookup(key)[1]
+
+    waiters = _pending_decodes.get(key)
+    if waiters is None:
+        waiters = _pending_decodes[key] = []
+        _submit_decode(key)
+    if callback:
+        waiters.append(callback)
+    return None
+
+
+def _submit_decode(key, attempt=0):
+    global _decode_pool
+    if _decode_pool is None:
+        _decode_pool = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix='openrpm-decode')
+    # Display and theme queries stay on the main thread
+    future = _decode_pool.submit(load_texture, *key, get_raster_size())
+    _decode_futures[key] = future
+    future.add_done_callback(lambda f: GLib.idle_add(_deliver_texture, key, f, attempt))
+
+
+def _retry_decode(key, attempt):
+    if key in _pending_decodes and key not in _decode_futures:
+        _submit_decode(key, attempt)
+    return False
+
+
+def _deliver_texture(key, future, attempt):
+    if future.cancelled() or _decode_futures.get(key) is not future:
+        return False
+    del _decode_futures[key]
+    try:
+        texture = future.result()
+    except Exception as e:
+        log.warning(f"Could not decode image {key}: {e}")
+        texture = None
+    if texture is None and attempt < DECODE_RETRIES:
+        # The waiters keep showing the placeholder meanwhile
+        log.debug(f"Retrying decode of image {key} ({attempt + 1}/{DECODE_RETRIES})")
+        GLib.timeout_add(DECODE_RETRY_DELAY, _retry_decode, key, attempt + 1)
+        return False
+    waiters = _pending_decodes.pop(key, [])
+    if texture is not None:
+        _texture_cache.put(key, texture)
+    for callback in waiters:
+        callback(texture)
+    return False
 
 
 class TestController:
-    def __init__(self, builder, age_percent, on_finish_callback=None, on_reset_callback=None):
+    def __init__(self, builder, age_percent, on_finish_callback=None, on_reset_callback=None,
+                 journal=None, resume=None, prefetcher=None, slot=None):
         self.builder = builder
         self.age_percent = age_percent
         self.on_finish = on_finish_callback
         self.on_reset = on_reset_callback
+        self.journal = journal
+        self.resume = resume
+        self.prefetcher = prefetcher
+        self.slot = slot
 
         self.current = 1
         self.answers = {}
-        self.time_left = TOTAL_TIME
         self.active = False
         self.timer_id = None
-        self.answer_key = decode_answers()
+        self._frame_tick_id = None
+        self._started = time.monotonic()
+        self._deadline = self._started + TOTAL_TIME
+        self._progress_step = None
+        self._last_journal_time = 0
+        self.item_times = array('I', bytes(4 * TOTAL_QUESTIONS))
+        self.first_answer = array('I', [NO_ANSWER] * TOTAL_QUESTIONS)
+        self._shown_q = None
+        self._shown_at = 0.0
+        self.answer_key = calculations.decode_answers()
         self.dialog = None
         self._handlers = {}
         self._theme_handler = None
         self._current_theme = None
-        self._option_buttons = []
+        self._option_buttons = {}
         self._current_options_count = 0
-        self._current_cols = 0
-        self._click_handlers = {}
+        self._selected_btn = None
 
         self._cache_widgets()
         self._create_option_buttons()
@@ -94,22 +344,32 @@ class TestController:
         self.timer_progress = b.get_object('timer_progress')
         self.progress_label = b.get_object('progress_label')
         self.question_image = b.get_object('question_image')
-        self.options_grid = b.get_object('options_grid')
+        self.options_stack = b.get_object('options_stack')
+        self.option_grids = {count: b.get_object(f'options_grid_{count}') for count in OPTION_LAYOUTS}
         self.prev_btn = b.get_object('prev_button')
         self.end_btn = b.get_object('end_button')
         self.next_btn = b.get_object('next_button')
 
     def _create_option_buttons(self):
-        """Create 8 option buttons."""
-        for i in range(1, 9):
-            btn = Gtk.Button(label=str(i))
-            btn.add_css_class('pill')
-            btn.set_hexpand(True)
-            btn.set_vexpand(True)
-            btn.set_halign(Gtk.Align.FILL)
-            btn.set_valign(Gtk.Align.FILL)
-            btn.set_visible(False)
-            self._option_buttons.append(btn)
+        """Fill each option grid once; the buttons stay in the page for later tests."""
+        for count, cols in OPTION_LAYOUTS.items():
+            grid = self.option_grids.get(count)
+            if not grid:
+                continue
+            buttons = []
+            for i in range(1, count + 1):
+                row, col = (i - 1) // cols, (i - 1) % cols
+                btn = grid.get_child_at(col, row)
+                if btn is None:
+                    btn = Gtk.Button(label=str(i))
+                    btn.add_css_class('pill')
+                    btn.set_hexpand(True)
+                    btn.set_vexpand(True)
+                    btn.set_halign(Gtk.Align.FILL)
+                    btn.set_valign(Gtk.Align.FILL)
+                    grid.attach(btn, col, row, 1, 1)
+                buttons.append(btn)
+            self._option_buttons[count] = buttons
 
     def _wire(self):
         self._unwire()
@@ -118,6 +378,9 @@ class TestController:
                               ('next', self.next_btn, self._next)]:
             if obj:
                 self._handlers[name] = (obj, obj.connect('clicked', cb))
+        for count, buttons in self._option_buttons.items():
+            for i, btn in enumerate(buttons, 1):
+                self._handlers[f'option{count}_{i}'] = (btn, btn.connect('clicked', self._select, i))
 
     def _unwire(self):
         for obj, hid in self._handlers.values():
@@ -139,154 +402,191 @@ class TestController:
         new_theme = get_theme_dir()
         if new_theme != self._current_theme:
             self._current_theme = new_theme
-            GLib.idle_add(self._preload_theme_images, new_theme, GLib.PRIORITY_LOW)
-            if self.active and self.question_image:
-                paintable = get_texture(self.current)
-                if paintable:
-                    self.question_image.set_from_paintable(paintable)
-
-    def _preload_theme_images(self, theme, *args):
-        for q in range(1, TOTAL_QUESTIONS + 1):
-            if get_texture(q, theme) is None:
-                return True
-        return False
+            if self.active:
+                self._show_image()
 
     def start(self):
         self.active = True
         self.current = 1
         self.answers = {}
-        self.time_left = TOTAL_TIME
+        elapsed = 0
+        if self.resume:
+            self.answers = dict(self.resume.answers)
+            self.current = self.resume.current
+            elapsed = min(self.resume.elapsed_ms / 1000, TOTAL_TIME - 1)
+            for q, ms in self.resume.item_times.items():
+                self.item_times[q - 1] = ms
+            for q, ms in self.resume.first_answer.items():
+                self.first_answer[q - 1] = ms
+        self._started = time.monotonic() - elapsed
+        self._deadline = self._started + TOTAL_TIME
+        self._last_journal_time = elapsed
+        self._progress_step = None
+        self._shown_q = None
         self._current_theme = get_theme_dir()
-        self._current_cols = 0
         self._current_options_count = 0
+        self._selected_btn = None
 
-        # Reset all buttons - hide all, remove styles
-        for btn in self._option_buttons:
-            btn.set_visible(False)
-            if btn.has_css_class('suggested-action'):
+        # The grids outlive the controller, clear any highlight from a previous test
+        for buttons in self._option_buttons.values():
+            for btn in buttons:
                 btn.remove_css_class('suggested-action')
 
-        if self.timer_progress:
-            self.timer_progress.set_fraction(1.0)
-
-        theme = self._current_theme
-        for q in range(1, 6):
-            get_texture(q, theme)
-
+        self._update_progress()
         self._run_timer()
+        locales.on_language_changed(self._on_language_changed)
         self._show()
 
+    @property
+    def time_left(self):
+        return max(0.0, self._deadline - time.monotonic())
+
     def _run_timer(self):
-        if self.timer_id:
-            GLib.source_remove(self.timer_id)
-        self.timer_id = GLib.timeout_add(1000, self._tick)
+        """Watch the deadline; the progress bar follows the frame clock while it is mapped.
+
+        Tick callbacks only run for mapped widgets, so a hidden or minimized
+        window costs one wakeup per TIMER_WAKEUP seconds.
+        """
+        self._stop_timer()
+        self.timer_id = GLib.timeout_add_seconds(TIMER_WAKEUP, self._tick)
+        if self.timer_progress:
+            self._frame_tick_id = self.timer_progress.add_tick_callback(self._on_frame)
 
     def _stop_timer(self):
         if self.timer_id:
             GLib.source_remove(self.timer_id)
             self.timer_id = None
+        if self._frame_tick_id:
+            self.timer_progress.remove_tick_callback(self._frame_tick_id)
+            self._frame_tick_id = None
+
+    def _on_frame(self, widget, clock):
+        if not self.active or self.time_left <= 0:
+            self._frame_tick_id = None
+            if self.active:
+                self._complete()
+            return GLib.SOURCE_REMOVE
+        self._update_progress()
+        return GLib.SOURCE_CONTINUE
+
+    def _update_progress(self):
+        if not self.timer_progress:
+            return
+        fraction = self.time_left / TOTAL_TIME
+        # Only touch the bar when its fill moves by a whole pixel
+        step = round(fraction * max(self.timer_progress.get_width(), 1))
+        if step != self._progress_step:
+            self._progress_step = step
+            self.timer_progress.set_fraction(fraction)
 
     def _tick(self):
         if not self.active:
+            self.timer_id = None
             return False
-        self.time_left -= 1
-        if self.timer_progress:
-            self.timer_progress.set_fraction(max(0, self.time_left / TOTAL_TIME))
-        if self.time_left <= 0:
+        remaining = self.time_left
+        if remaining <= 0:
+            self.timer_id = None
             self._complete()
             return False
+
+        elapsed = TOTAL_TIME - remaining
+        if self.journal and elapsed - self._last_journal_time >= JOURNAL_TIME_INTERVAL:
+            self._last_journal_time = elapsed
+            self.journal.time(self._elapsed_ms())
+        if remaining <= TIMER_WAKEUP:
+            # Hand over to a one-shot timeout that fires at the deadline itself
+            self.timer_id = GLib.timeout_add(int(remaining * 1000) + 1, self._tick)
+            return False
         return True
 
+    def _elapsed_ms(self):
+        return min(int((time.monotonic() - self._started) * 1000), TOTAL_TIME * 1000)
+
+    def _leave_question(self):
+        """Add the time the question on screen has been shown to its total."""
+        if self._shown_q is not None:
+            now = time.monotonic()
+            self.item_times[self._shown_q - 1] += int((now - self._shown_at) * 1000)
+            self._shown_at = now
+
+    @tracing.traced()
     def _show(self):
         q = self.current
         series = calculations.get_series(q)
+        self._leave_question()
+        self._shown_q, self._shown_at = q, time.monotonic()
+        if self.journal:
+            self.journal.navigate(q, self._elapsed_ms())
 
-        if self.progress_label:
-            tmpl = locales.get_text('test.progress_template')
-            if '{q}' in tmpl and '{s}' in tmpl:
-                self.progress_label.set_label(tmpl.replace('{q}', str(q)).replace('{s}', series))
-            else:
-                self.progress_label.set_label(f"{locales.get_text('test.question')} {q} | {series}")
-
-        if self.question_image:
-            paintable = get_texture(q)
-            if paintable:
-                self.question_image.set_from_paintable(paintable)
-
+        self._update_progress_label()
+        self._show_image()
         self._update_options(series)
         self._update_nav()
 
+    def _update_progress_label(self):
+        if not self.progress_label:
+            return
+        q, series = self.current, calculations.get_series(self.current)
+        tmpl = locales.get_text('test.progress_template')
+        if '{q}' in tmpl and '{s}' in tmpl:
+            self.progress_label.set_label(tmpl.replace('{q}', str(q)).replace('{s}', series))
+        else:
+            self.progress_label.set_label(f"{locales.get_text('test.question')} {q} | {series}")
+
+    def _on_language_changed(self):
+        if self.active:
+            self._update_progress_label()
+
+    def _show_image(self):
+        q, theme = self.current, self._current_theme
+        _texture_cache.pin([(q, theme)], owner=self.slot)
+        if self.prefetcher:
+            self.prefetcher.focus(q, theme, owner=self.slot)
+        if not self.question_image:
+            return
+        texture = request_texture(q, theme, lambda t: self._on_texture_ready(q, theme, t))
+        self.question_image.set_from_paintable(texture or get_placeholder())
+
+    def _on_texture_ready(self, q, theme, texture):
+        if self.active and texture and (q, theme) == (self.current, self._current_theme):
+            self.question_image.set_from_paintable(texture)
+
+    @tracing.traced()
     def _update_options(self, series):
         count = get_options_count(series)
-        cols = 3 if count == 6 else 4
-
-        need_rebuild = (cols != self._current_cols)
-        self._current_cols = cols
-
-        if self.options_grid:
-            # ALWAYS clear grid completely first
-            while child := self.options_grid.get_first_child():
-                self.options_grid.remove(child)
-
-            # Force grid to reset column geometry
-            self.options_grid.set_column_homogeneous(False)
-            self.options_grid.queue_resize()
-
-            # Rebuild with new layout
-            for i in range(1, count + 1):
-                btn = self._option_buttons[i - 1]
-                btn.set_label(str(i))
-                btn.set_visible(True)
-
-                is_selected = self.answers.get(self.current) == i
-                has_suggested = btn.has_css_class('suggested-action')
-
-                if is_selected and not has_suggested:
-                    btn.add_css_class('suggested-action')
-                elif not is_selected and has_suggested:
-                    btn.remove_css_class('suggested-action')
-
-                old_handler = self._click_handlers.get(btn)
-                if old_handler:
-                    try:
-                        btn.disconnect(old_handler)
-                    except Exception:
-                        pass
-                self._click_handlers[btn] = btn.connect('clicked', self._select, i)
-
-                row, col = (i - 1) // cols, (i - 1) % cols
-                self.options_grid.attach(btn, col, row, 1, 1)
-
-            # Hide extra buttons (7, 8 for series A, B)
-            for i in range(count + 1, 9):
-                btn = self._option_buttons[i - 1]
-                btn.set_visible(False)
-                if btn.has_css_class('suggested-action'):
-                    btn.remove_css_class('suggested-action')
-
-            self.options_grid.set_column_homogeneous(True)
-            self.options_grid.queue_resize()
-
+        if self.options_stack:
+            self.options_stack.set_visible_child_name(str(count))
         self._current_options_count = count
+        self._highlight(self.answers.get(self.current))
+
+    def _highlight(self, opt):
+        buttons = self._option_buttons.get(self._current_options_count, [])
+        btn = buttons[opt - 1] if opt and opt <= len(buttons) else None
+        if btn is self._selected_btn:
+            return
+        if self._selected_btn:
+            self._selected_btn.remove_css_class('suggested-action')
+        if btn:
+            btn.add_css_class('suggested-action')
+        self._selected_btn = btn
 
     def _select(self, btn, opt):
-        self.answers[self.current] = opt
-        for i, b in enumerate(self._option_buttons[:self._current_options_count], 1):
-            is_selected = (i == opt)
-            has_suggested = b.has_css_class('suggested-action')
-            if is_selected and not has_suggested:
-                b.add_css_class('suggested-action')
-            elif not is_selected and has_suggested:
-                b.remove_css_class('suggested-action')
+        if self.time_left <= 0:
+            self._complete()
+            return
+        q = self.current
+        if self.first_answer[q - 1] == NO_ANSWER:
+            viewed = time.monotonic() - self._shown_at
+            self.first_answer[q - 1] = self.item_times[q - 1] + int(viewed * 1000)
+        self.answers[q] = opt
+        if self.journal:
+            self.journal.select(self.current, opt, self._elapsed_ms())
+        self._highlight(opt)
 
     def _update_nav(self):
         if self.prev_btn:
             self.prev_btn.set_sensitive(self.current > 1)
-        if self.next_btn:
-            label = locales.get_text('test.finish' if self.current == TOTAL_QUESTIONS else 'test.next')
-            self.next_btn.set_label(label)
-        if self.end_btn:
-            self.end_btn.set_label(locales.get_text('test.end'))
+        locales.bind(self.next_btn, 'test.finish' if self.current == TOTAL_QUESTIONS else 'test.next')
 
     def _prev(self, btn):
         if self.current > 1:
@@ -322,9 +622,12 @@ class TestController:
         if resp == 'end':
             self._complete()
 
-    def _complete(self):
+    def _stop(self):
         self.active = False
         self._stop_timer()
+        self._leave_question()
+        self._shown_q = None
+        locales.disconnect_language_changed(self._on_language_changed)
         self._unwire()
 
         if self._theme_handler:
@@ -334,11 +637,37 @@ class TestController:
                 log.debug(f"Theme handler already disconnected: {e}")
             self._theme_handler = None
 
-        elapsed = TOTAL_TIME - self.time_left
+        _texture_cache.pin([], owner=self.slot)
+
+    def abandon(self):
+        """Stop without finishing, e.g. when the window closes; the journal is kept for resume."""
+        if not self.active:
+            return
+        self._stop()
+        if self.dialog:
+            self.dialog.close()
+            self.dialog = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def _complete(self):
+        if not self.active:
+            return
+        self._stop()
+        log.debug(f"Texture cache: {_texture_cache.stats()}")
+
+        elapsed = int(TOTAL_TIME - self.time_left)
         if self.on_finish:
             self.on_finish({
+                'session_id': self.journal.session_id if self.journal else None,
                 'user_answers': self.answers.copy(),
                 'answer_key': self.answer_key,
                 'age_percent': self.age_percent,
-                'time_taken': elapsed
+                'time_taken': elapsed,
+                'item_times_ms': self.item_times,
+                'first_answer_ms': self.first_answer
             })
+        if self.journal:
+            self.journal.finish()
+            self.journal = None
@@ -0,0 +1,119 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+from logger import get_logger
+
+log = get_logger('tracing')
+
+TRACE_ENV = 'OPENRPM_TRACE'
+
+_path = os.environ.get(TRACE_ENV)
+enabled = bool(_path)
+_events = []
+_threads = {}
+_pid = os.getpid()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _us(t):
+    return t * 1e6
+
+
+def _tid():
+    ident = threading.get_ident()
+    if ident not in _threads:
+        _threads[ident] = threading.current_thread().name
+    return ident
+
+
+def add_span(name, start, end, cat='app', **args):
+    """Record a finished span from time.perf_counter() timestamps."""
+    if enabled:
+        _events.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': _pid, 'tid': _tid(),
+                        'ts': _us(start), 'dur': _us(end - start), 'args': args})
+
+
+def instant(name, cat='app', **args):
+    if enabled:
+        _events.append({'name': name, 'cat': cat, 'ph': 'i', 's': 'p', 'pid': _pid,
+                        'tid': _tid(), 'ts': _us(time.perf_counter()), 'args': args})
+
+
+def counter(name, **values):
+    if enabled:
+        _events.append({'name': name, 'ph': 'C', 'pid': _pid, 'tid': _tid(),
+                        'ts': _us(time.perf_counter()), 'args': values})
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_span(self.name, self.start, time.perf_counter(), self.cat, **self.args)
+        return False
+
+
+def span(name, cat='app', **args):
+    """Context manager timing its block; a shared no-op when tracing is off."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def traced(name=None, cat='app'):
+    """Decorator timing every call; returns the function untouched when tracing is off."""
+    def decorate(func):
+        if not enabled:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_span(label, start, time.perf_counter(), cat)
+        return wrapper
+    return decorate
+
+
+def write(path=None):
+    path = path or _path
+    if not path:
+        return
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': _pid, 'tid': tid, 'args': {'name': n}}
+                for tid, n in _threads.items()]
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + _events, 'displayTimeUnit': 'ms'}, f)
+        log.info(f"Wrote {len(_events)} trace events to {path}")
+    except OSError as e:
+        log.warning(f"Could not write trace: {e}")
+
+
+if enabled:
+    atexit.register(write)
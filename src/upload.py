@@ -0,0 +1,188 @@
+import glob
+import json
+import os
+import queue
+import socket
+import threading
+
+import store
+from logger import get_logger
+
+log = get_logger('upload')
+
+SPOOL_NAME = 'spool'
+REJECTED_NAME = 'rejected'
+CONNECT_TIMEOUT = 5
+RETRY_MIN = 1
+RETRY_MAX = 300
+
+
+def parse_address(text):
+    """('unix', path) for 'unix:PATH' or an absolute path, else ('tcp', (host, port)) for 'HOST:PORT'."""
+    if text.startswith('unix:'):
+        return 'unix', text[5:]
+    if text.startswith('/'):
+        return 'unix', text
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid collector address: {text}")
+    return 'tcp', (host.strip('[]') or 'localhost', int(port))
+
+
+def encode_row(row):
+    """One protocol line: the session row as a JSON object keyed by store.COLUMNS."""
+    return json.dumps(dict(zip(store.COLUMNS, row)), separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def decode_row(line):
+    data = json.loads(line)
+    # Clients older than the optional columns do not send them
+    return tuple(data.get(column) if column in store.OPTIONAL_COLUMNS else data[column]
+                 for column in store.COLUMNS)
+
+
+def encode_ack(session_id):
+    return json.dumps({'ack': session_id}).encode('utf-8') + b'\n'
+
+
+def encode_reject(line, error):
+    """Reply to a line decode_row refused, naming its session when the line has a readable id."""
+    reply = {'error': f"invalid session: {error}"}
+    try:
+        session_id = json.loads(line).get('session_id')
+    except (ValueError, AttributeError):
+        session_id = None
+    if isinstance(session_id, str):
+        reply['reject'] = session_id
+    return json.dumps(reply).encode('utf-8') + b'\n'
+
+
+def _backoff(delay):
+    return min((delay or RETRY_MIN / 2) * 2, RETRY_MAX)
+
+
+def default_spool_dir():
+    return os.path.join(store.get_data_dir(), SPOOL_NAME)
+
+
+def connect(address, timeout=CONNECT_TIMEOUT):
+    kind, target = address
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(target)
+        return sock
+    return socket.create_connection(target, timeout=timeout)
+
+
+class ResultUploader:
+    """Sends finished sessions to an openrpm-collector from a background thread.
+
+    `submit` only enqueues. The sender spools each session to its own file,
+    pushes every spooled session in one stream and deletes a file once the
+    collector acknowledges that its row is committed. A session the
+    collector rejects as invalid is moved to the rejected/ subdirectory
+    instead of being resent. While the collector is unreachable or leaves
+    sessions unacknowledged the spool is retried with exponential backoff.
+    """
+
+    def __init__(self, address, spool_dir=None):
+        self.address = parse_address(address)
+        self.spool_dir = spool_dir or default_spool_dir()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = queue.Queue()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name='openrpm-upload', daemon=True)
+        self._thread.start()
+
+    def submit(self, test_results, results):
+        self._queue.put(store.session_row(test_results, results))
+        self._wakeup.set()
+
+    def close(self, timeout=5):
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def _spool(self, row):
+        path = os.path.join(self.spool_dir, f'{row[0]}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(encode_row(row))
+        os.replace(tmp, path)
+
+    def _run(self):
+        delay = None
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            while True:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._spool(row)
+                except OSError as e:
+                    log.error(f"Could not spool session {row[0]}: {e}")
+            if self._closing:
+                return
+
+            paths = sorted(glob.glob(os.path.join(self.spool_dir, '*.json')))
+            if not paths:
+                delay = None
+                continue
+            try:
+                left = self._send(paths)
+            except (OSError, ValueError) as e:
+                delay = _backoff(delay)
+                log.debug(f"Collector unreachable ({e}), {len(paths)} session(s) spooled, "
+                          f"retrying in {delay}s")
+                continue
+            if left:
+                delay = _backoff(delay)
+                log.debug(f"{left} of {len(paths)} spooled session(s) not acknowledged, "
+                          f"retrying in {delay}s")
+            else:
+                delay = None
+                log.debug(f"Uploaded {len(paths)} spooled session(s)")
+
+    def _reject(self, path, reason):
+        rejected_dir = os.path.join(self.spool_dir, REJECTED_NAME)
+        os.makedirs(rejected_dir, exist_ok=True)
+        os.replace(path, os.path.join(rejected_dir, os.path.basename(path)))
+        log.warning(f"Session {os.path.basename(path)[:-len('.json')]} rejected ({reason}), "
+                    f"moved to {rejected_dir}")
+
+    def _send(self, paths):
+        """Stream the spooled sessions; the number still spooled afterwards."""
+        by_id = {}
+        lines = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                line = f.read()
+            try:
+                decode_row(line)
+            except (ValueError, KeyError, TypeError) as e:
+                # The collector could not name this session in its reply either
+                self._reject(path, f"unreadable spool file: {e}")
+                continue
+            lines.append(line)
+            by_id[os.path.basename(path)[:-len('.json')]] = path
+        if not lines:
+            return 0
+
+        with connect(self.address) as sock:
+            sock.sendall(b''.join(lines))
+            sock.shutdown(socket.SHUT_WR)
+            for line in sock.makefile('rb'):
+                reply = json.loads(line)
+                path = by_id.pop(reply.get('ack'), None)
+                if path:
+                    os.remove(path)
+                elif reply.get('reject') in by_id:
+                    self._reject(by_id.pop(reply['reject']), reply['error'])
+                elif 'error' in reply:
+                    log.warning(f"Collector could not store a session: {reply['error']}")
+        return len(by_id)
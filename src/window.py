@@ -1,3 +1,5 @@
+import time
+
 import gi
 
 gi.require_version('Gtk', '4.0')
@@ -5,9 +7,16 @@ gi.require_version('Adw', '1')
 
 from gi.repository import Gtk, Adw, Gdk, Gio, GLib
 
+import calculations
+import cohorts
+import journal
 import locales
+import prefetch
 import result
+import store
 import test
+import tracing
+import upload
 from logger import get_logger
 
 log = get_logger('window')
@@ -16,7 +25,10 @@ BASE_WIDTH = 1920
 WINDOW_WIDTH_PCT = 0.5
 WINDOW_ASPECT = 0.75
 
-UI_FILES = ['window.ui', 'intro.ui', 'test.ui', 'result.ui', 'shortcuts.ui']
+# Built at activation; the other pages are built on first use or once the
+# first frame is on screen
+UI_FILES = ['window.ui', 'intro.ui']
+LAZY_PAGES = {'test_page': 'test.ui', 'result_page': 'result.ui'}
 RESOURCE_BASE = '/site/ikhlasulov/openrpm/'
 
 INTRO_SIZES = [
@@ -29,7 +41,7 @@ INTRO_SIZES = [
 TEST_FIXED_SIZES = [
     ('timer_progress', 'width-request', 418),
     ('question_image', 'pixel-size', 400),
-    ('options_grid', 'width-request', 418),
+    ('options_stack', 'width-request', 418),
     ('navigation_container', 'width-request', 418),
 ]
 
@@ -38,7 +50,8 @@ TEST_SCALED_SIZES = [
     ('test_page', 'margin-end', 24), ('test_page', 'margin-top', 12),
     ('test_page', 'margin-bottom', 12), ('progress_container', 'spacing', 8),
     ('content_box', 'spacing', 8),
-    ('options_grid', 'column-spacing', 8), ('options_grid', 'row-spacing', 8),
+    ('options_grid_6', 'column-spacing', 8), ('options_grid_6', 'row-spacing', 8),
+    ('options_grid_8', 'column-spacing', 8), ('options_grid_8', 'row-spacing', 8),
     ('navigation_container', 'spacing', 8),
 ]
 
@@ -53,16 +66,20 @@ MIN_TEST_WIDTH = 468
 MIN_TEST_HEIGHT = 700
 MIN_RESULT_WIDTH = 1000
 MIN_RESULT_HEIGHT = 650
+# Upper bound for --candidates, one window per candidate screen
+MAX_CANDIDATES = 16
 
 
-def load_ui(builder):
-    for ui_file in UI_FILES:
+@tracing.traced()
+def load_ui(builder, ui_files=UI_FILES):
+    for ui_file in ui_files:
         try:
             builder.add_from_resource(f'{RESOURCE_BASE}ui/{ui_file}')
         except GLib.Error as e:
             log.warning(f"Could not load {ui_file}: {e.message}")
 
 
+@tracing.traced()
 def load_css():
     try:
         css_bytes = Gio.resources_lookup_data(
@@ -93,67 +110,43 @@ def set_clamp(builder, scale, wide=False):
     clamp.set_property('tightening-threshold', int(threshold * scale))
 
 
-class OpenRpmApp(Adw.Application):
+class CandidateWindow:
+    """One candidate's window with its own pages, monitor scaling and test.
 
-    def __init__(self, **kwargs):
-        super().__init__(application_id='site.ikhlasulov.openrpm', **kwargs)
+    All windows of the application share the texture cache, prefetcher,
+    scoring tables and message catalog; `slot` keeps their journals,
+    texture pins and prefetch positions apart.
+    """
+
+    def __init__(self, app, slot, monitor=None):
+        self.app = app
+        self.slot = slot
+        self.target_monitor = monitor
         self.builder = None
         self.win = None
         self.current_monitor = None
         self.monitor_handler_id = None
+        self.monitors = None
+        self.monitors_handler_id = None
         self.test_controller = None
         self.selected_age_index = 0
         self.scale_factor = 1.0
-        self.settings = None
         self.original_window_width = None
         self.original_window_height = None
         self.is_resized_mode = False
         self.scrolled_window = None
+        self._activate_start = time.perf_counter()
+        self._first_frame_handler = None
+        self._idle_pages_id = None
+        self._build()
 
-    def do_startup(self):
-        Adw.Application.do_startup(self)
-        self.settings = Gio.Settings.new('site.ikhlasulov.openrpm')
-        self._register_actions()
-
-    def _register_actions(self):
-        about = Gio.SimpleAction.new('about', None)
-        about.connect('activate', self._show_about)
-        self.add_action(about)
-
-        quit_act = Gio.SimpleAction.new('quit', None)
-        quit_act.connect('activate', lambda a, p: self.quit())
-        self.add_action(quit_act)
-
-        shortcuts = Gio.SimpleAction.new('shortcuts', None)
-        shortcuts.connect('activate', self._show_shortcuts)
-        self.add_action(shortcuts)
-
-        self.set_accels_for_action('app.quit', ['<Control>q', '<Control>w'])
-
-    def _show_about(self, action, param):
-        dialog = Adw.AboutDialog()
-        dialog.set_application_name('Open RPM')
-        dialog.set_application_icon('site.ikhlasulov.openrpm')
-        dialog.set_version('1.0.3')
-        dialog.set_comments(locales.get_text('about.comments'))
-        dialog.set_developer_name('Ikhlasulov')
-        dialog.set_license_type(Gtk.License.GPL_3_0)
-        dialog.present(self.win)
-
-    def _show_shortcuts(self, action, param):
-        builder = Gtk.Builder()
-        builder.add_from_resource(f'{RESOURCE_BASE}ui/shortcuts.ui')
-        shortcuts = builder.get_object('shortcuts_dialog')
-        if shortcuts:
-            shortcuts.present(self.win)
-
-    def do_activate(self):
+    @tracing.traced('CandidateWindow.build')
+    def _build(self):
         self.builder = Gtk.Builder()
         load_ui(self.builder)
-        load_css()
 
         self.win = self.builder.get_object('main_window')
-        self.win.set_application(self)
+        self.win.set_application(self.app)
 
         content_bin = self.builder.get_object('content_bin')
         intro_page = self.builder.get_object('intro_page')
@@ -174,35 +167,125 @@ class OpenRpmApp(Adw.Application):
 
         self.win.connect('notify::default-width', self._on_window_resize)
         self.win.connect('notify::is-active', self._on_window_active)
+        self.win.connect('close-request', self._on_close_request)
 
         self._setup_initial_size()
 
         locales.init_combo_models(self.builder)
         locales.apply_localization(self.builder)
+        locales.on_language_changed(self._on_language_changed)
 
         age_combo = self.builder.get_object('age_combo')
-        if age_combo and self.settings:
-            saved = self.settings.get_int('last-age-group')
+        if age_combo and self.app.settings:
+            saved = self.app.settings.get_int('last-age-group')
             age_combo.set_selected(saved)
             self.selected_age_index = saved
 
         display = Gdk.Display.get_default()
         if display:
-            monitors = display.get_monitors()
-            monitors.connect('items-changed', self._on_monitors_changed)
+            self.monitors = display.get_monitors()
+            self.monitors_handler_id = self.monitors.connect('items-changed', self._on_monitors_changed)
 
+    def present(self):
         self.win.present()
-        GLib.idle_add(self._preload_images_idle, GLib.PRIORITY_LOW)
-
-    def _preload_images_idle(self, *args):
-        for theme in ['dark', 'light']:
-            for q in range(1, 61):
-                key = (q, theme)
-                if key not in test._texture_cache:
-                    test.get_texture(q, theme)
-                    return True
+        if self.target_monitor:
+            self.win.fullscreen_on_monitor(self.target_monitor)
+        self._watch_first_frame()
+        self.app.prefetcher.focus(1, test.get_theme_dir(), owner=self.slot)
+        self._offer_resume()
+
+    def _on_close_request(self, win):
+        if self.test_controller:
+            self.test_controller.abandon()
+            self.test_controller = None
+        if self._idle_pages_id:
+            GLib.source_remove(self._idle_pages_id)
+            self._idle_pages_id = None
+        if self.current_monitor and self.monitor_handler_id:
+            self.current_monitor.disconnect(self.monitor_handler_id)
+            self.monitor_handler_id = None
+        if self.monitors and self.monitors_handler_id:
+            self.monitors.disconnect(self.monitors_handler_id)
+            self.monitors_handler_id = None
+        locales.disconnect_language_changed(self._on_language_changed)
+        locales.unbind_all(self.builder)
+        self.app.prefetcher.release(self.slot)
+        self.app.window_closed(self)
+        return False
+
+    def _on_language_changed(self):
+        # Bound labels are refreshed by locales; rebuild what is generated from messages
+        menu_button = self.builder.get_object('buttonMenu')
+        if menu_button:
+            menu_button.set_menu_model(locales.create_localized_menu())
+        age_combo = self.builder.get_object('age_combo')
+        if age_combo:
+            selected = age_combo.get_selected()
+            locales.init_combo_models(self.builder)
+            age_combo.set_selected(selected)
+
+    def _ensure_page(self, name):
+        """Page widget `name`, building its UI file into this window's builder on first use."""
+        page = self.builder.get_object(name)
+        if page is None:
+            load_ui(self.builder, [LAZY_PAGES[name]])
+            self._apply_all_sizes()
+            page = self.builder.get_object(name)
+        return page
+
+    def _build_pages_idle(self):
+        # One page per pass so a pending input event never waits on more than one file
+        for name in LAZY_PAGES:
+            if self.builder.get_object(name) is None:
+                self._ensure_page(name)
+                return True
+        self._idle_pages_id = None
         return False
 
+    def _watch_first_frame(self):
+        clock = self.win.get_frame_clock()
+        if clock:
+            self._first_frame_handler = clock.connect('after-paint', self._on_first_frame)
+        else:
+            self._schedule_page_builds()
+
+    def _on_first_frame(self, clock):
+        clock.disconnect(self._first_frame_handler)
+        now = time.perf_counter()
+        tracing.add_span('activate-to-first-frame', self._activate_start, now, slot=self.slot)
+        log.debug(f"Window {self.slot}: first frame {(now - self._activate_start) * 1000:.1f} ms "
+                  f"after activation")
+        self._schedule_page_builds()
+
+    def _schedule_page_builds(self):
+        if self._idle_pages_id is None:
+            self._idle_pages_id = GLib.idle_add(self._build_pages_idle, priority=GLib.PRIORITY_LOW)
+
+    def _offer_resume(self):
+        state = journal.load(journal.default_path(self.slot))
+        if not state:
+            return
+        dialog = Adw.MessageDialog.new(
+            self.win,
+            locales.get_text('resume.title'),
+            locales.get_text('resume.message').format(answered=len(state.answers))
+        )
+        dialog.add_response('discard', locales.get_text('resume.discard'))
+        dialog.add_response('resume', locales.get_text('resume.continue'))
+        dialog.set_response_appearance('resume', Adw.ResponseAppearance.SUGGESTED)
+        dialog.set_default_response('resume')
+        dialog.connect('response', self._on_resume_response, state)
+        dialog.present()
+
+    def _on_resume_response(self, dialog, response, state):
+        dialog.close()
+        if response != 'resume':
+            journal.discard(journal.default_path(self.slot))
+            return
+        log.info(f"Resuming test at question {state.current}, {len(state.answers)} answers")
+        self.selected_age_index = state.age_group
+        self._begin_test(state.age_percent, resume=state)
+
     def _get_monitor(self):
         if not self.win:
             return None
@@ -212,6 +295,8 @@ class OpenRpmApp(Adw.Application):
         surface = self.win.get_surface()
         if surface:
             return display.get_monitor_at_surface(surface)
+        if self.target_monitor:
+            return self.target_monitor
         monitors = display.get_monitors()
         return monitors.get_item(0) if monitors else None
 
@@ -220,6 +305,7 @@ class OpenRpmApp(Adw.Application):
             return BASE_WIDTH
         return monitor.get_geometry().width
 
+    @tracing.traced()
     def _setup_initial_size(self):
         monitor = self._get_monitor()
         if monitor:
@@ -318,18 +404,30 @@ class OpenRpmApp(Adw.Application):
         age_pct = 100
         if age_combo:
             self.selected_age_index = age_combo.get_selected()
-            if self.settings:
-                self.settings.set_int('last-age-group', self.selected_age_index)
+            if self.app.settings:
+                self.app.settings.set_int('last-age-group', self.selected_age_index)
             log.debug(locales.get_text('log.selected_age').format(
                 selected_age=self.selected_age_index))
-            age_pct = locales.AGE_PERCENTS.get(self.selected_age_index, 100)
+            age_pct = calculations.get_age_percent(self.selected_age_index)
 
         log.info(locales.get_text('log.test_start'))
         self._begin_test(age_pct)
 
-    def _begin_test(self, age_pct):
+    def _open_journal(self, age_pct, resume=None):
+        session_journal = journal.Journal(path=journal.default_path(self.slot),
+                                          session_id=resume.session_id if resume else None)
+        try:
+            session_journal.open(resume)
+        except OSError as e:
+            log.warning(f"Test journal disabled: {e}")
+            return None
+        if not resume:
+            session_journal.start(self.selected_age_index, age_pct)
+        return session_journal
+
+    def _begin_test(self, age_pct, resume=None):
         content_bin = self.builder.get_object('content_bin')
-        test_page = self.builder.get_object('test_page')
+        test_page = self._ensure_page('test_page')
 
         if content_bin and test_page:
             self._set_window_size(MIN_TEST_WIDTH, MIN_TEST_HEIGHT)
@@ -341,7 +439,11 @@ class OpenRpmApp(Adw.Application):
                 builder=self.builder,
                 age_percent=age_pct,
                 on_finish_callback=self._on_test_complete,
-                on_reset_callback=self._on_test_reset
+                on_reset_callback=self._on_test_reset,
+                journal=self._open_journal(age_pct, resume),
+                resume=resume,
+                prefetcher=self.app.prefetcher,
+                slot=self.slot
             )
             self.test_controller.start()
 
@@ -359,16 +461,181 @@ class OpenRpmApp(Adw.Application):
     def _show_results(self, test_results):
         self._set_window_size(MIN_RESULT_WIDTH, MIN_RESULT_HEIGHT)
 
+        self._ensure_page('result_page')
         set_clamp(self.builder, self.scale_factor, wide=True)
-        result.show_results(
+        screen = result.show_results(
             builder=self.builder,
             test_results=test_results,
-            on_reset_callback=self._on_results_reset
+            on_reset_callback=self._on_results_reset,
+            cohorts=self.app.store.cohorts if self.app.store else None
         )
+        if screen and self.app.store:
+            self.app.store.record(test_results, screen.results)
+        if screen and self.app.uploader:
+            self.app.uploader.submit(test_results, screen.results)
         self.test_controller = None
 
     def _on_results_reset(self):
         log.debug("Returned to intro from results")
+        self.app.prefetcher.focus(1, test.get_theme_dir(), owner=self.slot)
         self._restore_original_window_size()
         set_clamp(self.builder, self.scale_factor, wide=False)
         self.test_controller = None
+
+
+class OpenRpmApp(Adw.Application):
+
+    def __init__(self, **kwargs):
+        super().__init__(application_id='site.ikhlasulov.openrpm', **kwargs)
+        self.settings = None
+        self.store = None
+        self.uploader = None
+        self.windows = {}
+        self.candidates = 1
+        # Started with --candidates: the windows belong to the operator
+        self.kiosk = False
+        self._css_loaded = False
+        self._shortcuts_dialog = None
+        self.prefetcher = prefetch.PrefetchScheduler()
+        self.add_main_option('candidates', ord('n'), GLib.OptionFlags.NONE, GLib.OptionArg.INT,
+                             'Open one window per candidate, fullscreen on its own monitor '
+                             'when there are enough', 'N')
+
+    def do_handle_local_options(self, options):
+        count = options.lookup_value('candidates', GLib.VariantType.new('i'))
+        if count:
+            self.candidates = max(1, min(count.get_int32(), MAX_CANDIDATES))
+            self.kiosk = True
+        return -1
+
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        self.settings = Gio.Settings.new('site.ikhlasulov.openrpm')
+        locales.set_language(self.settings.get_string('language'))
+        locales.on_language_changed(self._on_language_changed)
+        test._texture_cache.set_budget(self.settings.get_int('texture-cache-mb') * 1024 * 1024)
+        self._load_norms()
+        self._register_actions()
+        self._open_store()
+
+    def do_shutdown(self):
+        self.prefetcher.stop()
+        for window in self.windows.values():
+            if window.test_controller:
+                window.test_controller.abandon()
+        if self.store:
+            self.store.close()
+            self.store = None
+        if self.uploader:
+            self.uploader.close()
+            self.uploader = None
+        Adw.Application.do_shutdown(self)
+
+    def _load_norms(self):
+        path = self.settings.get_string('norms-file')
+        if not path:
+            return
+        try:
+            calculations.use_norms(calculations.load_norms(path))
+        except (OSError, ValueError) as e:
+            log.warning(f"Using the manual's norms: {e}")
+
+    def _open_store(self):
+        try:
+            self.store = store.SessionStore(cohorts=cohorts.CohortTable.load())
+        except (OSError, store.sqlite3.Error) as e:
+            log.warning(f"Session history disabled: {e}")
+
+        address = self.settings.get_string('collector-address')
+        if address:
+            try:
+                self.uploader = upload.ResultUploader(address)
+            except (OSError, ValueError) as e:
+                log.warning(f"Result upload disabled: {e}")
+
+    def _register_actions(self):
+        about = Gio.SimpleAction.new('about', None)
+        about.connect('activate', self._show_about)
+        self.add_action(about)
+
+        quit_act = Gio.SimpleAction.new('quit', None)
+        quit_act.connect('activate', lambda a, p: self.quit())
+        self.add_action(quit_act)
+
+        shortcuts = Gio.SimpleAction.new('shortcuts', None)
+        shortcuts.connect('activate', self._show_shortcuts)
+        self.add_action(shortcuts)
+
+        new_window = Gio.SimpleAction.new('new-window', None)
+        new_window.connect('activate', lambda a, p: self.open_window())
+        # Candidates at a kiosk must not open or close session windows
+        new_window.set_enabled(not self.kiosk)
+        self.add_action(new_window)
+
+        language = Gio.SimpleAction.new_stateful(
+            'language', GLib.VariantType.new('s'),
+            GLib.Variant('s', self.settings.get_string('language')))
+        language.connect('activate', self._on_language_activate)
+        self.add_action(language)
+
+        self.set_accels_for_action('app.quit', ['<Control>q'])
+        if not self.kiosk:
+            self.set_accels_for_action('app.new-window', ['<Control>n'])
+            self.set_accels_for_action('window.close', ['<Control>w'])
+
+    def _on_language_activate(self, action, param):
+        action.set_state(param)
+        self.settings.set_string('language', param.get_string())
+        locales.set_language(param.get_string())
+
+    def _on_language_changed(self):
+        self._shortcuts_dialog = None
+
+    def _show_about(self, action, param):
+        dialog = Adw.AboutDialog()
+        dialog.set_application_name('Open RPM')
+        dialog.set_application_icon('site.ikhlasulov.openrpm')
+        dialog.set_version('1.0.3')
+        dialog.set_comments(locales.get_text('about.comments'))
+        dialog.set_developer_name('Ikhlasulov')
+        dialog.set_license_type(Gtk.License.GPL_3_0)
+        dialog.present(self.get_active_window())
+
+    def _show_shortcuts(self, action, param):
+        if self._shortcuts_dialog is None:
+            builder = Gtk.Builder()
+            load_ui(builder, ['shortcuts.ui'])
+            self._shortcuts_dialog = builder.get_object('shortcuts_dialog')
+        if self._shortcuts_dialog:
+            self._shortcuts_dialog.present(self.get_active_window())
+
+    @tracing.traced('OpenRpmApp.do_activate')
+    def do_activate(self):
+        if self.windows:
+            self.get_active_window().present()
+            return
+        if not self._css_loaded:
+            load_css()
+            self._css_loaded = True
+
+        monitors = None
+        display = Gdk.Display.get_default()
+        if self.candidates > 1 and display:
+            monitors = display.get_monitors()
+            if monitors.get_n_items() < self.candidates:
+                log.info(f"{self.candidates} candidate windows on {monitors.get_n_items()} "
+                         f"monitors, leaving placement to the window manager")
+                monitors = None
+        for slot in range(self.candidates):
+            self.open_window(monitors.get_item(slot) if monitors else None)
+
+    def open_window(self, monitor=None):
+        slot = next(i for i in range(len(self.windows) + 1) if i not in self.windows)
+        window = CandidateWindow(self, slot, monitor)
+        self.windows[slot] = window
+        window.present()
+        log.info(f"Opened candidate window {slot}, {len(self.windows)} open")
+        return window
+
+    def window_closed(self, window):
+        self.windows.pop(window.slot, None)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import calculations
+import store
+
+
+@pytest.fixture
+def session_db(tmp_path):
+    """Factory storing `count` scored sessions in tmp_path/name and returning its path.
+
+    Session i is 's{i}', finished at 1000 + i in age group i % 7, with its
+    first 20 + i % 40 answers correct. `key_for(i)` picks another answer
+    key per session; extra fields go into every session's test results.
+    """
+    def create(count, name='sessions.db', key_for=None, **fields):
+        path = str(tmp_path / name)
+        conn = store.connect(path)
+        for i in range(count):
+            key = key_for(i) if key_for else calculations.decode_answers()
+            answers = {q: key[str(q)] for q in range(1, 21 + i % 40)}
+            test_results = {'session_id': f's{i}', 'user_answers': answers, 'answer_key': key,
+                            'finished_at': 1000.0 + i, 'selected_age_index': i % 7, **fields}
+            results = calculations.calculate_raven_results(answers, key, 100)
+            conn.execute(store.INSERT_SQL, store.session_row(test_results, results))
+        conn.commit()
+        conn.close()
+        return path
+    return create
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+import calculations
+
+np = pytest.importorskip('numpy')
+
+SESSIONS = 4000
+# Age factors of the manual's seven age groups
+AGE_PERCENTS = [100, 97, 93, 88, 82, 76, 70]
+
+
+def _random_key(rng):
+    return {str(q): rng.randint(1, 8) for q in range(1, calculations.TOTAL_QUESTIONS + 1)}
+
+
+def _random_sessions(count, seed):
+    """Answer sheets spread over every score, with lopsided series to reach each reliability branch."""
+    rng = random.Random(seed)
+    key = _random_key(rng)
+    sheets, ages = [], []
+    for _ in range(count):
+        rates = [rng.random() ** rng.choice([0.3, 1, 3]) for _ in calculations.SERIES_NAMES]
+        if rng.random() < 0.2:
+            rates[0] = 0.0
+        sheet = []
+        for q in range(1, calculations.TOTAL_QUESTIONS + 1):
+            series = (q - 1) // calculations.SERIES_SIZE
+            if rng.random() < 0.05:
+                sheet.append(0)
+            elif rng.random() < rates[series]:
+                sheet.append(key[str(q)])
+            else:
+                sheet.append(rng.randint(1, 8))
+        sheets.append(sheet)
+        ages.append(rng.choice(AGE_PERCENTS))
+    return key, sheets, ages
+
+
+def test_batch_matches_single_session_scoring():
+    key, sheets, ages = _random_sessions(SESSIONS, seed=1)
+    batch = calculations.calculate_raven_results_batch(sheets, key, ages)
+
+    statuses = set()
+    for i, (sheet, age) in enumerate(zip(sheets, ages)):
+        answers = {q: a for q, a in enumerate(sheet, 1) if a}
+        single = calculations.calculate_raven_results(answers, key, age)
+        statuses.add(single['reliability_status'])
+
+        assert batch['raw_score'][i] == single['raw_score']
+        assert batch['max_score'] == single['max_score']
+        assert batch['iq'][i] == single['iq']
+        assert batch['diagnosis_key'][i] == single['diagnosis_key']
+        assert batch['degree_key'][i] == calculations.get_degree_key(single['iq'])
+        assert batch['recommendation_key'][i] == single['recommendation_key']
+        assert batch['reliability_status'][i] == single['reliability_status']
+        assert batch['age_used'][i] == single['age_used']
+        for s, d in enumerate(single['series_details']):
+            assert batch['series_scores'][i, s] == d['score']
+            assert batch['expected'][i, s] == d['expected']
+            assert batch['deviation'][i, s] == d['deviation']
+
+    assert statuses == {'good', 'low_reliability', 'unreliable', 'defect'}
+    assert batch['raw_score'].min() < 15
+
+
+def test_batch_rejects_wrong_shape():
+    with pytest.raises(ValueError):
+        calculations.calculate_raven_results_batch([[0] * 59], _random_key(random.Random(1)), 100)
+
+
+def test_fitted_profiles_below_15_are_used():
+    manual = calculations.ScoringTables()
+    assert manual.get_expected(10) == [5, 3, 1, 1, 0]
+    fitted = calculations.ScoringTables(
+        normative={**calculations.NORMATIVE_DISTRIBUTION, 10: [4, 3, 2, 1, 0]})
+    assert fitted.get_expected(10) == [4, 3, 2, 1, 0]
+    assert fitted.get_expected(9) == manual.get_expected(9)
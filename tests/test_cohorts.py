@@ -0,0 +1,27 @@
+import cohorts
+import store
+
+
+def test_merged_table_is_not_counted_again(tmp_path, session_db):
+    conn = store.connect(session_db(40))
+    table = cohorts.CohortTable()
+    assert table.catch_up(conn) == 40
+
+    merged = cohorts.CohortTable()
+    merged.merge(table)
+    merged.save(str(tmp_path / 'merged.bin'))
+    loaded = cohorts.CohortTable.load(str(tmp_path / 'merged.bin'))
+    assert loaded.merged
+    assert loaded.catch_up(conn) == 0
+    assert sum(loaded.total(g) for g in range(cohorts.AGE_GROUPS)) == 40
+    conn.close()
+
+
+def test_reads_tables_without_flags(session_db):
+    table = cohorts.build(session_db(40))
+    data = table.to_bytes()
+    v1 = cohorts.HEADER_V1.pack(cohorts.MAGIC_V1, table.last_id) + data[cohorts.HEADER.size:]
+    loaded = cohorts.CohortTable.from_bytes(v1)
+    assert not loaded.merged
+    assert loaded.last_id == 40
+    assert loaded.counts == table.counts
@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+# Also catches attempts, so the check holds where PyGObject is not installed
+CHECK = """
+import sys
+
+attempted = []
+
+
+class Watch:
+    @staticmethod
+    def find_spec(name, path=None, target=None):
+        if name == 'gi' or name.startswith('gi.'):
+            attempted.append(name)
+        return None
+
+
+sys.meta_path.insert(0, Watch)
+import calculations, locales, score
+assert locales.get_text('app.title')
+locales.set_language('ru')
+assert 'gi' not in sys.modules and not attempted, attempted
+"""
+
+
+def test_headless_modules_do_not_import_gi():
+    result = subprocess.run([sys.executable, '-c', CHECK], cwd=SRC_DIR,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+# Generous: the three take about 35 ms on a single-core VM
+IMPORT_BUDGET_MS = 250
+
+
+def test_headless_modules_import_within_budget():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import calculations, locales, score'],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    total_us = 0
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | name", nested imports indented
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() in ('calculations', 'locales', 'score') \
+                and not fields[2].startswith('  '):
+            total_us += int(fields[1])
+    assert 0 < total_us < IMPORT_BUDGET_MS * 1000, f"{total_us / 1000:.1f} ms"
@@ -0,0 +1,18 @@
+import pytest
+
+import calculations
+import store
+
+items = pytest.importorskip('items')
+
+
+def test_only_sessions_of_the_current_key_are_analysed(session_db):
+    key = calculations.decode_answers()
+    old_key = {q: key[q] % 8 + 1 for q in key}
+    path = session_db(30, key_for=lambda i: old_key if i % 3 == 0 else key)
+
+    matrix, _ = items.load_matrix([path])
+    assert len(matrix) == 20
+    # Every analysed session answered its first 20 items correctly
+    assert matrix.unpack()[:, :20].all()
+    assert items.count_other_keys(path, store.answer_key_version(key)) == 10
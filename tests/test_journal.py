@@ -0,0 +1,28 @@
+import os
+import time
+
+import journal
+
+
+def test_events_appended_during_a_write_are_kept_on_close(tmp_path, monkeypatch):
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.05)
+        fsync(fd)
+
+    path = str(tmp_path / 'session.journal')
+    log = journal.Journal(path)
+    log.open()
+    monkeypatch.setattr(journal.os, 'fsync', slow_fsync)
+    log.start(2, 93)
+    log.navigate(1, 0)
+    # The writer is now inside the fsync of the records above
+    time.sleep(0.01)
+    log.select(1, 4, 800)
+    log.close()
+
+    state = journal.load(path)
+    assert state.session_id == log.session_id
+    assert state.age_group == 2
+    assert state.answers == {1: 4}
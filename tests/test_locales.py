@@ -0,0 +1,49 @@
+import pytest
+
+import locales
+
+
+class Label:
+    def __init__(self):
+        self.texts = []
+
+    def set_label(self, text):
+        self.texts.append(text)
+
+
+class Builder:
+    def __init__(self, *objects):
+        self.objects = list(objects)
+
+    def get_objects(self):
+        return self.objects
+
+
+@pytest.fixture
+def catalogs(monkeypatch):
+    tables = {'xx': {'result.return': 'Zurück'}}
+    monkeypatch.setattr(locales, '_load_messages', lambda language=None: (language, tables.get(language, {})))
+    monkeypatch.setattr(locales, '_bindings', {})
+    locales.set_language('en')
+    yield
+    locales._messages = None
+
+
+def test_bound_objects_follow_language_switches(catalogs):
+    label = Label()
+    locales.bind(label, 'result.return')
+    locales.set_language('xx')
+    assert label.texts == ['Return', 'Zurück']
+
+
+def test_unbind_releases_objects(catalogs):
+    kept, closed, other = Label(), Label(), Label()
+    for obj in (kept, closed, other):
+        locales.bind(obj, 'result.return')
+    locales.unbind(other)
+    locales.unbind_all(Builder(closed))
+    assert list(locales._bindings) == [kept]
+
+    locales.set_language('xx')
+    assert kept.texts == ['Return', 'Zurück']
+    assert closed.texts == other.texts == ['Return']
@@ -0,0 +1,34 @@
+import pytest
+
+import calculations
+
+np = pytest.importorskip('numpy')
+norms = pytest.importorskip('norms')
+
+
+def _counts(seed):
+    """Sessions of every age group, older groups scoring lower."""
+    rng = np.random.default_rng(seed)
+    counts = norms.new_counts()
+    for group in range(norms.AGE_GROUPS):
+        ability = rng.normal(0.7 - 0.06 * group, 0.15, size=(2000, 1))
+        p = np.clip(ability + np.linspace(0.2, -0.2, norms.SERIES_COUNT), 0.02, 0.98)
+        series = rng.binomial(calculations.SERIES_SIZE, p)
+        norms.add_scores(counts, np.full(len(series), group), series)
+    return counts
+
+
+@pytest.mark.parametrize('reference', [0, 3])
+def test_every_age_group_averages_iq_100(reference):
+    counts = _counts(seed=reference)
+    fitted = norms.fit_norms(counts, reference)
+    tables = calculations.ScoringTables(fitted['spline_points'], fitted['normative'],
+                                        fitted['age_percents'])
+    assert fitted['age_percents'][reference] == 100
+
+    raw_counts = counts[:, :, 0, :].sum(axis=2)
+    for group in range(norms.AGE_GROUPS):
+        iq = [tables.get_final_iq(score, tables.age_percents[group])
+              for score in range(norms.SCORE_BINS)]
+        mean = raw_counts[group] @ iq / raw_counts[group].sum()
+        assert abs(mean - 100) < 0.5
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import calculations
+
+pytest.importorskip('cairo')
+pytest.importorskip('gi.repository.PangoCairo')
+report = pytest.importorskip('report')
+
+SIGNATURES = {'pdf': b'%PDF-', 'png': b'\x89PNG\r\n\x1a\n'}
+
+
+def _records():
+    key = calculations.decode_answers()
+    for i in range(3):
+        sheet = {'id': f'candidate {i}', 'user_answers': {str(q): key[str(q)] for q in range(1, 41 + i)},
+                 'age_group': i, 'time_taken': 1200 + i}
+        yield 'jsonl', (f'sheet:{i + 1}', json.dumps(sheet))
+
+
+@pytest.mark.parametrize('fmt', ['pdf', 'png'])
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_renders_valid_reports(tmp_path, fmt, jobs):
+    options = {'fmt': fmt, 'page': 'a4', 'dpi': 72, 'font': report.DEFAULT_FONT, 'cohort_table': None}
+    assert report.render_all(_records(), str(tmp_path), options, jobs, chunk_size=1) == (3, 0)
+    for i in range(3):
+        with open(tmp_path / f'candidate_{i}.{fmt}', 'rb') as f:
+            assert f.read(8).startswith(SIGNATURES[fmt])
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_colliding_ids_get_suffixes(tmp_path, jobs):
+    key = calculations.decode_answers()
+    records = [('jsonl', (f'sheet:{i + 1}', json.dumps({'id': sid, 'user_answers': {'1': key['1']}})))
+               for i, sid in enumerate(['a b', 'a b', 'a/b'])]
+    options = {'fmt': 'pdf', 'page': 'a4', 'dpi': 72, 'font': report.DEFAULT_FONT, 'cohort_table': None}
+    assert report.render_all(iter(records), str(tmp_path), options, jobs, chunk_size=1) == (3, 0)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a_b-2.pdf', 'a_b-3.pdf', 'a_b.pdf']
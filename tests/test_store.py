@@ -0,0 +1,85 @@
+import os
+import sqlite3
+
+import pytest
+
+import calculations
+import store
+
+
+def test_iter_sessions_reads_without_writing(session_db):
+    path = session_db(5)
+    before = os.stat(path)
+
+    sessions = list(store.iter_sessions(path, since=1001.0, until=1004.0))
+    assert [s['session_id'] for s in sessions] == ['s1', 's2', 's3']
+    assert sorted(sessions[0]['user_answers']) == list(range(1, 22))
+    after = os.stat(path)
+    assert (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+
+
+def test_iter_sessions_does_not_create_a_missing_database(tmp_path):
+    path = str(tmp_path / 'missing' / 'sessions.db')
+    with pytest.raises(sqlite3.OperationalError):
+        list(store.iter_sessions(path))
+    assert not os.path.exists(os.path.dirname(path))
+
+
+def test_read_only_paths_are_not_parsed_as_uris(session_db):
+    path = session_db(2, 'room 1?#50%.db')
+    assert [s['session_id'] for s in store.iter_sessions(path)] == ['s0', 's1']
+    assert store.id_ranges(path, 1) == [(path, 1, 3)]
+
+
+def test_item_times_round_trip(session_db):
+    item_times = list(range(100, 160))
+    first_answer = [store.NO_ANSWER] * 30 + list(range(50, 80))
+    path = session_db(1, item_times_ms=item_times, first_answer_ms=first_answer)
+
+    session, = store.iter_sessions(path)
+    assert session['item_times_ms'] == item_times
+    assert session['first_answer_ms'] == [None] * 30 + list(range(50, 80))
+
+
+def test_version_1_database_is_upgraded(tmp_path, session_db):
+    path = str(tmp_path / 'sessions.db')
+    old_schema = store.SCHEMA.replace(',\n    item_times TEXT,\n    first_answer TEXT', '')
+    assert 'item_times' not in old_schema
+    conn = sqlite3.connect(path)
+    conn.executescript(old_schema)
+    conn.execute("INSERT INTO sessions (session_id, created_at, answer_key_version, age_group, "
+                 "age_percent, time_taken, answers, raw_score, iq, series_a, series_b, series_c, "
+                 "series_d, series_e, diagnosis_key, reliability_status, recommendation_key) "
+                 "VALUES ('old', 1, 'k', 0, 100, 60, ?, 0, 60, 0, 0, 0, 0, 0, 'low', 'good', 'low')",
+                 ('0' * 60,))
+    conn.execute('PRAGMA user_version=1')
+    conn.commit()
+    conn.close()
+
+    store.connect(path).close()
+    session_db(1)
+    sessions = {s['session_id']: s for s in store.iter_sessions(path)}
+    assert sessions['old']['item_times_ms'] is None
+    assert sessions['s0']['item_times_ms'] is None
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == store.SCHEMA_VERSION
+    conn.close()
+
+
+def test_sessions_survive_failed_writes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'sessions.db')
+    key = calculations.decode_answers()
+    results = calculations.calculate_raven_results({1: key['1']}, key, 100)
+
+    monkeypatch.setattr(store, 'INSERT_SQL', 'INSERT INTO missing VALUES (1)')
+    failing = store.SessionStore(path)
+    for i in range(3):
+        failing.record({'session_id': f'kept{i}', 'user_answers': {1: key['1']}, 'answer_key': key},
+                       results)
+    failing.close()
+    assert os.path.exists(failing.unsaved_path)
+    monkeypatch.undo()
+
+    store.SessionStore(path).close()
+    assert sorted(s['session_id'] for s in store.iter_sessions(path)) == ['kept0', 'kept1', 'kept2']
+    assert not os.path.exists(failing.unsaved_path)
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+
+import calculations
+import collector
+import store
+import upload
+
+
+def _row():
+    key = calculations.decode_answers()
+    answers = {q: key[str(q)] for q in range(1, 31)}
+    test_results = {'session_id': 'abc', 'user_answers': answers, 'answer_key': key,
+                    'item_times_ms': [1500] * 60, 'first_answer_ms': [store.NO_ANSWER] * 60}
+    return store.session_row(test_results, calculations.calculate_raven_results(answers, key, 100))
+
+
+def test_row_round_trips_with_item_times():
+    row = _row()
+    assert upload.decode_row(upload.encode_row(row)) == row
+    assert store.decode_times(row[store.COLUMNS.index('item_times')]) == [1500] * 60
+
+
+def test_rows_from_older_clients_are_accepted():
+    data = json.loads(upload.encode_row(_row()))
+    for column in store.OPTIONAL_COLUMNS:
+        del data[column]
+    row = upload.decode_row(json.dumps(data))
+    assert row[store.COLUMNS.index('item_times')] is None
+    assert row[store.COLUMNS.index('session_id')] == 'abc'
+
+
+def test_reject_reply_names_the_session():
+    data = json.loads(upload.encode_row(_row()))
+    del data['raw_score']
+    line = json.dumps(data).encode('utf-8')
+    assert json.loads(upload.encode_reject(line, 'raw_score'))['reject'] == 'abc'
+    assert 'reject' not in json.loads(upload.encode_reject(b'{not json', 'bad'))
+
+
+def test_invalid_sessions_are_quarantined(tmp_path):
+    loop = asyncio.new_event_loop()
+    receiver = collector.Collector(str(tmp_path / 'sessions.db'))
+    address = ('unix', str(tmp_path / 'collector.sock'))
+    loop.run_until_complete(receiver.start(address))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        spool = tmp_path / 'spool'
+        uploader = upload.ResultUploader(f'unix:{address[1]}', str(spool))
+        uploader._spool(_row())
+        (spool / 'broken.json').write_text('{"session_id": "broken"}\n')
+
+        assert uploader._send(sorted(str(p) for p in spool.glob('*.json'))) == 0
+        assert list(spool.glob('*.json')) == []
+        assert [p.name for p in (spool / 'rejected').iterdir()] == ['broken.json']
+        uploader.close()
+    finally:
+        asyncio.run_coroutine_threadsafe(receiver.stop(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    assert receiver.inserted == 1
+
+
+def test_acks_quote_any_session_id():
+    for session_id in ['abc', 'a"b', 'back\\slash', 'line\nbreak']:
+        assert json.loads(upload.encode_ack(session_id)) == {'ack': session_id}